@@ -1,5 +1,5 @@
-from pydantic import BaseModel, validator
-from typing import Optional
+from pydantic import BaseModel, Field, root_validator, validator
+from typing import ClassVar, Optional
 import datetime as dt
 
 # enum types
@@ -47,6 +47,67 @@ class Product(BaseModel):
     product_code: str
 
 
+# === PARTIAL UPDATES ===
+# the bodies of the PATCH endpoints, only the fields that are sent are changed
+
+class PartialModel(BaseModel):
+    # fields that may be set to null
+    nullable_fields: ClassVar[frozenset[str]] = frozenset()
+
+    @root_validator(pre=True)
+    def check_fields(cls, values):
+        sent = {name: value for name, value in values.items() if name in cls.__fields__}
+        if not sent:
+            raise ValueError('No fields to update')
+        nulls = sorted(name for name, value in sent.items() if value is None and name not in cls.nullable_fields)
+        if nulls:
+            raise ValueError(f'Cannot set {", ".join(nulls)} to null')
+        return values
+
+    def changes(self) -> dict:
+        return self.dict(exclude_unset=True)
+
+
+class CustomerPatch(PartialModel):
+    nullable_fields: ClassVar[frozenset[str]] = frozenset({'customer_middle_name'})
+
+    customer_first_name: Optional[str]
+    customer_middle_name: Optional[str]
+    customer_last_name: Optional[str]
+    customer_password: Optional[str]
+    customer_email: Optional[str]
+    customer_contact_number: Optional[str]
+    customer_is_active: Optional[bool]
+
+
+class StaffPatch(PartialModel):
+    staff_full_name: Optional[str]
+    staff_contact_number: Optional[str]
+    staff_username: Optional[str]
+    staff_password: Optional[str]
+    staff_position: Optional[CanteenPosition]
+    staff_is_active: Optional[bool]
+
+
+class AdminPatch(PartialModel):
+    admin_full_name: Optional[str]
+    admin_username: Optional[str]
+    admin_password: Optional[str]
+    admin_position: Optional[AdminPosition]
+    admin_is_active: Optional[bool]
+
+
+class ProductPatch(PartialModel):
+    product_name: Optional[str]
+    product_price: Optional[float]
+    product_image_link: Optional[str]
+    product_stock: Optional[int]
+    product_description: Optional[str]
+    product_type: Optional[ProductType]
+    product_is_active: Optional[bool]
+    product_code: Optional[str]
+
+
 class Transaction(BaseModel):
     transaction_agent: str
     transaction_description: str
@@ -65,4 +126,26 @@ class Order(BaseModel):
 
     @validator('order_date', pre=True, always=True)
     def set_ts_now(cls, v):
-        return v or dt.datetime.now()
\ No newline at end of file
+        return v or dt.datetime.now()
+
+
+class OrderStatusUpdate(BaseModel):
+    order_status: OrderStatus
+
+
+class CheckoutLine(BaseModel):
+    product_code: str
+    quantity: int = Field(1, ge=1)
+    request: str = ''
+
+
+class Checkout(BaseModel):
+    order_customer_email: str
+    order_staff_username: str
+    order_status: OrderStatus = OrderStatus.INCOMING
+    order_date: Optional[dt.datetime]
+    lines: list[CheckoutLine] = Field(..., min_items=1)
+
+    @validator('order_date', pre=True, always=True)
+    def set_ts_now(cls, v):
+        return v or dt.datetime.now()
@@ -0,0 +1,214 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator
+
+import asyncpg
+from psycopg2 import OperationalError
+
+from backend.operations import metrics
+from backend.database.database_operation import (
+    connection_params,
+    session_settings,
+    POOL_MIN_SIZE,
+    ASYNC_POOL_MAX_SIZE,
+    POOL_CHECKOUT_TIMEOUT,
+    CONNECT_TIMEOUT,
+    get_pool,
+)
+
+# errors raised by asyncpg when the database cannot be reached, these are re-raised as
+# psycopg2 OperationalError so the endpoints handle both database paths the same way
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.ConnectionDoesNotExistError,
+    asyncpg.exceptions.CannotConnectNowError,
+)
+
+# statements kept prepared by every asyncpg connection, enough for every read of
+# backend/database/queries.py and the pagination variants of the lists
+STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))
+
+_pool: asyncpg.Pool | None = None
+_pool_lock = asyncio.Lock()
+# pools inherited through a fork, they belong to the event loop of the parent
+_inherited_pools: list[asyncpg.Pool] = []
+_warm_up_task: asyncio.Task | None = None
+
+
+async def get_async_pool() -> asyncpg.Pool:
+    """
+    Returns the asyncpg pool of the current process, creating it on first use
+
+    :return: Returns the shared asyncpg Pool
+    """
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                params = connection_params()
+                _pool = await asyncpg.create_pool(
+                    host=params['host'],
+                    port=int(params['port']),
+                    user=params['user'],
+                    password=params['password'],
+                    database=params['database'],
+                    min_size=min(POOL_MIN_SIZE, ASYNC_POOL_MAX_SIZE),
+                    max_size=ASYNC_POOL_MAX_SIZE,
+                    timeout=CONNECT_TIMEOUT,
+                    statement_cache_size=STATEMENT_CACHE_SIZE,
+                    init=_count_connection,
+                    server_settings=session_settings(),
+                )
+    return _pool
+
+
+async def close_async_pool():
+    """
+    Closes the asyncpg pool of the current process if it was opened
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def open_pools_in_background():
+    """
+    Starts opening both pools of the worker without waiting for them, so the first requests
+    find them open while the worker starts serving right away. When the database cannot be
+    reached the pools are opened again by the first request that needs them
+    """
+    global _warm_up_task
+    if _warm_up_task is None or _warm_up_task.done():
+        _warm_up_task = asyncio.get_running_loop().create_task(_warm_up())
+
+
+async def _warm_up():
+    try:
+        await get_async_pool()
+        await asyncio.to_thread(get_pool)
+    except (*CONNECTION_ERRORS, asyncpg.PostgresError, OperationalError) as e:
+        print(f'Could not open the database pools yet: {e}')
+
+
+def _forget_pool_after_fork():
+    # a forked worker opens its own pool, in its own event loop, on first use
+    global _pool, _pool_lock, _warm_up_task
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_lock = asyncio.Lock()
+    _warm_up_task = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+async def _count_connection(conn: asyncpg.Connection):
+    metrics.DB_CONNECTIONS_OPENED.labels('asyncpg').inc()
+
+
+async def _run(method: str, sql: str, *args) -> Any:
+    try:
+        pool = await get_async_pool()
+        async with pool.acquire(timeout=POOL_CHECKOUT_TIMEOUT) as conn:
+            started = time.perf_counter()
+            try:
+                return await getattr(conn, method)(sql, *args)
+            finally:
+                metrics.observe_query('asyncpg', sql, time.perf_counter() - started)
+    except CONNECTION_ERRORS as e:
+        raise OperationalError(str(e)) from e
+
+
+async def fetch_records(sql: str, *args) -> list[asyncpg.Record]:
+    """
+    Runs a query and returns every row as the records read by asyncpg, without copying them
+    into dictionaries. Send them with serialization.rows_response
+
+    :param str sql: The query to run, using $1, $2, ... placeholders
+    :return: Returns the fetched records
+    """
+    return await _run('fetch', sql, *args)
+
+
+async def fetch_all(sql: str, *args) -> list[dict[str, Any]]:
+    """
+    Runs a query and returns every row
+
+    :param str sql: The query to run, using $1, $2, ... placeholders
+    :return: Returns the fetched rows as dictionaries
+    """
+    records = await fetch_records(sql, *args)
+    return [dict(record) for record in records]
+
+
+async def fetch_one(sql: str, *args) -> dict[str, Any] | None:
+    """
+    Runs a query and returns the first row
+
+    :param str sql: The query to run, using $1, $2, ... placeholders
+    :return: Returns the fetched row as a dictionary, or None when nothing matched
+    """
+    record = await _run('fetchrow', sql, *args)
+    return dict(record) if record is not None else None
+
+
+async def fetch_value(sql: str, *args) -> Any:
+    """
+    Runs a query and returns the first column of the first row
+
+    :param str sql: The query to run, using $1, $2, ... placeholders
+    :return: Returns the fetched value
+    """
+    return await _run('fetchval', sql, *args)
+
+
+async def execute(sql: str, *args) -> str:
+    """
+    Runs a statement that does not return rows
+
+    :param str sql: The statement to run, using $1, $2, ... placeholders
+    :return: Returns the status of the statement
+    """
+    return await _run('execute', sql, *args)
+
+
+async def stream(sql: str, *args, prefetch: int = 500) -> AsyncIterator[asyncpg.Record]:
+    """
+    Runs a query through a server side cursor so the rows can be sent out as they arrive,
+    without holding the whole result in memory. The pool is opened right away so an unreachable
+    database surfaces before a response is started. The connection is only acquired once the
+    first row is read, and released once the returned iterator is exhausted or closed, so an
+    iterator that is never read holds no connection
+
+    :param str sql: The query to run, using $1, $2, ... placeholders
+    :param int prefetch: The rows fetched from the server at a time
+    :return: Returns an async iterator over the rows
+    """
+    try:
+        pool = await get_async_pool()
+    except CONNECTION_ERRORS as e:
+        raise OperationalError(str(e)) from e
+
+    async def records():
+        try:
+            conn = await pool.acquire(timeout=POOL_CHECKOUT_TIMEOUT)
+        except CONNECTION_ERRORS as e:
+            raise OperationalError(str(e)) from e
+        metrics.DB_CURSORS.labels('asyncpg').inc()
+        started = time.perf_counter()
+        try:
+            # cursors only live inside a transaction
+            async with conn.transaction():
+                async for record in conn.cursor(sql, *args, prefetch=prefetch):
+                    yield record
+        finally:
+            metrics.observe_query('asyncpg', sql, time.perf_counter() - started)
+            await pool.release(conn)
+
+    return records()
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+import backend.database.async_operation as async_db
+
+# === CACHE SETTINGS ===
+
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 60))
+CATALOG_CACHE_MAX_SIZE = int(os.getenv('CATALOG_CACHE_MAX_SIZE', 1024))
+ROW_COUNT_CACHE_TTL = float(os.getenv('ROW_COUNT_CACHE_TTL', 5))
+TABLE_VERSION_CACHE_TTL = float(os.getenv('TABLE_VERSION_CACHE_TTL', 5))
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_size: int):
+        """
+        The constructor creates an in-process cache where entries expire after ttl seconds,
+        and the least recently used entries are dropped once max_size is reached.
+        It is safe to invalidate from the worker threads running the sync database writes
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        # set while every change to the cached data is notified by the database, the entries
+        # are then kept until invalidated instead of expiring after ttl seconds
+        self.invalidated_on_change = False
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the cached value of the key, or the default when missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic() and not self.invalidated_on_change:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None):
+        """
+        Stores a value under the key. When a generation is given, the value is only stored
+        if the cache was not invalidated since that generation was read
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable | None = None):
+        """
+        Drops the cached value of the key, or every cached value when no key is given
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached value of the key, calling the loader on a miss.
+        Concurrent misses on the same key share a single call to the loader
+
+        :param key: The cache key
+        :param loader: Coroutine function fetching the value from the database
+        :return: Returns the cached or freshly loaded value
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        with self._lock:
+            generation = self._generation
+        pending = asyncio.get_running_loop().create_future()
+        self._loading[key] = pending
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # retrieve the exception so it is not reported when nobody else was waiting
+            pending.exception()
+            raise
+        finally:
+            self._loading.pop(key, None)
+        self.set(key, value, generation)
+        pending.set_result(value)
+        return value
+
+
+async def cached_fetch_all(cache: TTLCache, key: Hashable, sql: str, *args) -> list[dict[str, Any]]:
+    """
+    Runs a query through async_operation.fetch_all, reusing the rows cached under the key
+
+    :param TTLCache cache: The cache holding the rows
+    :param key: The cache key of the query
+    :param str sql: The query to run on a miss, using $1, $2, ... placeholders
+    :return: Returns the cached or fetched rows
+    """
+    return await cache.get_or_load(key, lambda: async_db.fetch_all(sql, *args))
+
+
+async def cached_fetch_one(cache: TTLCache, key: Hashable, sql: str, *args) -> dict[str, Any] | None:
+    """
+    Runs a query through async_operation.fetch_one, reusing the row cached under the key
+
+    :param TTLCache cache: The cache holding the row
+    :param key: The cache key of the query
+    :param str sql: The query to run on a miss, using $1, $2, ... placeholders
+    :return: Returns the cached or fetched row, or None when nothing matched
+    """
+    return await cache.get_or_load(key, lambda: async_db.fetch_one(sql, *args))
+
+
+# cache of the product catalog, written through by create.add_product_to_database
+# and update.update_product
+catalog_cache = TTLCache(CATALOG_CACHE_TTL, CATALOG_CACHE_MAX_SIZE)
+
+# cache of the dashboard row counters, keyed by count mode
+row_count_cache = TTLCache(ROW_COUNT_CACHE_TTL, 2)
+
+# cache of the hainco_table_version rows behind the ETags, keyed by table name
+table_version_cache = TTLCache(TABLE_VERSION_CACHE_TTL, 16)
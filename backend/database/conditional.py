@@ -0,0 +1,105 @@
+import datetime as dt
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple
+
+import asyncpg
+from fastapi import Response
+from starlette import status
+
+import backend.database.async_operation as async_db
+from backend.database import queries
+from backend.database.cache import table_version_cache
+
+# clients may keep the responses but have to revalidate them on every use
+CACHE_CONTROL = 'no-cache'
+
+
+class TableVersion(NamedTuple):
+    table: str
+    version: int
+    modified_at: dt.datetime
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.table}-{self.version}"'
+
+    @property
+    def last_modified(self) -> str:
+        return format_datetime(self.modified_at.astimezone(dt.timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+async def _fetch_table_version(table: str) -> dict | None:
+    try:
+        return await async_db.fetch_one(queries.TABLE_VERSION.sql, table)
+    except asyncpg.UndefinedTableError:
+        # scripts/create_table_versions.sql was not applied yet, the lists are sent without validators
+        return None
+
+
+async def table_version(table: str) -> TableVersion | None:
+    """
+    Reads the version of a table kept by scripts/create_table_versions.sql. The versions are
+    cached for a few seconds and invalidated by the writes and the database notifications.
+    Read the version before the rows it validates, so the rows are never older than the ETag
+
+    :param str table: The name of the table
+    :return: Returns the version of the table, or None when the table is not versioned
+    """
+    row = await table_version_cache.get_or_load(table, lambda: _fetch_table_version(table))
+    if row is None:
+        return None
+    return TableVersion(table, row['version'], row['modified_at'])
+
+
+def is_not_modified(version: TableVersion | None, if_none_match: str | None,
+                    if_modified_since: str | None) -> bool:
+    """
+    Evaluates the conditional headers of a GET request against the version of the table.
+    If-Modified-Since is ignored when If-None-Match is sent, as the ETag is the exact validator
+    and Last-Modified only has a precision of one second
+
+    :param TableVersion version: The current version of the table
+    :param str if_none_match: The If-None-Match header of the request
+    :param str if_modified_since: The If-Modified-Since header of the request
+    :return: Returns True when the client already has the current data
+    """
+    if version is None:
+        return False
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.removeprefix('W/') == version.etag for tag in tags)
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=dt.timezone.utc)
+        return version.modified_at.replace(microsecond=0) <= since
+    return False
+
+
+def set_validators(response: Response, version: TableVersion | None):
+    """
+    Sends the ETag and Last-Modified of the table version with the response
+
+    :param Response response: The response of the endpoint
+    :param TableVersion version: The version of the table the response was read from
+    """
+    if version is None:
+        return
+    response.headers['ETag'] = version.etag
+    response.headers['Last-Modified'] = version.last_modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+
+
+def not_modified(version: TableVersion) -> Response:
+    """
+    Builds the bodiless 304 response telling the client to reuse its copy
+
+    :param TableVersion version: The current version of the table
+    :return: Returns the 304 Not Modified response
+    """
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, version)
+    return response
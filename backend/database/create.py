@@ -1,7 +1,13 @@
+import json
+import os
+from typing import Any
+
 import psycopg2
+from psycopg2.extras import RealDictCursor
 
 from backend.data_models import (
     Admin,
+    Checkout,
     Customer,
     Product,
     Staff,
@@ -9,176 +15,358 @@ from backend.data_models import (
     Order
 )
 from backend.database.security import create_salt, encrypt_password
+from backend.operations.verification import hash_password
+from backend.database import queries
 from backend.database.database_operation import DatabaseOperator
+from backend.database.queries import ORDER_COLUMNS
+from backend.database.cache import catalog_cache, table_version_cache
+from backend.enums.transaction_type import TransactionType
+from backend.operations import audit
+from backend.operations.order_feed import ORDER_CREATED, order_feed
+
+# rows sent per INSERT statement by the bulk functions
+BULK_PAGE_SIZE = int(os.getenv('BULK_PAGE_SIZE', 1000))
+# most rows accepted by a single bulk request
+BULK_MAX_SIZE = int(os.getenv('BULK_MAX_SIZE', 10000))
+
+# SQLSTATEs raised by place_order (scripts/create_checkout.sql) when a cart cannot be served
+INSUFFICIENT_STOCK = 'HC001'
+UNAVAILABLE_PRODUCTS = 'HC002'
+
+
+class InsufficientStock(Exception):
+    def __init__(self, products: list[dict[str, Any]]):
+        """
+        Raised when a checkout asks for more than the stock of its products, nothing was ordered
 
-pg_heroku = DatabaseOperator()
+        :param list products: The short products, with the requested and available quantities
+        """
+        super().__init__('Insufficient stock')
+        self.products = products
+
+
+class UnavailableProducts(Exception):
+    def __init__(self, product_codes: list[str]):
+        """
+        Raised when a checkout orders products that do not exist or are inactive, nothing was ordered
+
+        :param list product_codes: The codes of those products
+        """
+        super().__init__('Unavailable products')
+        self.product_codes = product_codes
 
 
 def add_admin_to_database(admin: Admin) -> Admin:
+    # hash before borrowing a connection so it is not held while hashing
+    password_hash = hash_password(admin.admin_password)
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     salt = create_salt()
     encrypted_password = encrypt_password(admin.admin_password, salt)
     try:
-        sql = """INSERT INTO hainco_admin(
-                    admin_full_name, 
-                    admin_username, 
-                    admin_position, 
-                    admin_is_active,
-                    admin_password_salt,
-                    admin_password_hash
-                    ) VALUES(%s, %s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (admin.admin_full_name,
-                             admin.admin_username,
-                             admin.admin_position,
-                             admin.admin_is_active,
-                             salt,
-                             encrypted_password))
+        pg_heroku.execute(cursor, queries.ADD_ADMIN, (admin.admin_full_name,
+                                                      admin.admin_username,
+                                                      admin.admin_position,
+                                                      admin.admin_is_active,
+                                                      salt,
+                                                      encrypted_password,
+                                                      password_hash))
         pg_heroku.commit()
+        table_version_cache.invalidate('hainco_admin')
         cursor.close()
+        audit.record('ADMIN', f'Added new admin: {admin.admin_full_name}',
+                     TransactionType.ADMIN, audit.ADD_RECORD)
     except (Exception, psycopg2.DatabaseError) as e:
         print(e)
     finally:
+        pg_heroku.close_connection()
         return admin
 
 
 def add_customer_to_database(customer: Customer) -> Customer:
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     salt = create_salt()
     encrypted_password = encrypt_password(customer.customer_password, salt)
     try:
-        sql = """INSERT INTO hainco_customer(
-                    customer_first_name, 
-                    customer_middle_name,
-                    customer_last_name,
-                    customer_email, 
-                    customer_is_active,
-                    customer_password_salt,
-                    customer_password_hash,
-                    customer_contact_number
-                    ) VALUES(%s, %s, %s, %s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (customer.customer_first_name,
-                             customer.customer_middle_name,
-                             customer.customer_last_name,
-                             customer.customer_email,
-                             customer.customer_is_active,
-                             salt,
-                             encrypted_password,
-                             customer.customer_contact_number
-                             ))
+        pg_heroku.execute(cursor, queries.ADD_CUSTOMER, (customer.customer_first_name,
+                                                         customer.customer_middle_name,
+                                                         customer.customer_last_name,
+                                                         customer.customer_email,
+                                                         customer.customer_is_active,
+                                                         salt,
+                                                         encrypted_password,
+                                                         customer.customer_contact_number
+                                                         ))
         pg_heroku.commit()
         cursor.close()
+        audit.record('ADMIN/CUSTOMER', f'Added new customer with email: {customer.customer_email}',
+                     TransactionType.ADMIN, audit.ADD_RECORD)
     except (Exception, psycopg2.DatabaseError) as e:
         print(e)
     finally:
+        pg_heroku.close_connection()
         return customer
 
 
 def add_product_to_database(product: Product) -> Product:
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     try:
-        sql = """INSERT INTO hainco_product(
-                    product_name, 
-                    product_price,
-                    product_image_link,
-                    product_stock, 
-                    product_type, 
-                    product_is_active,
-                    product_description,
-                    product_code
-                    ) VALUES(%s, %s, %s, %s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (product.product_name,
-                             product.product_price,
-                             product.product_image_link,
-                             product.product_stock,
-                             product.product_type,
-                             product.product_is_active,
-                             product.product_description,
-                             product.product_code
-                             ))
+        pg_heroku.execute(cursor, queries.ADD_PRODUCT, (product.product_name,
+                                                        product.product_price,
+                                                        product.product_image_link,
+                                                        product.product_stock,
+                                                        product.product_type,
+                                                        product.product_is_active,
+                                                        product.product_description,
+                                                        product.product_code
+                                                        ))
         pg_heroku.commit()
+        catalog_cache.invalidate()
+        table_version_cache.invalidate('hainco_product')
         cursor.close()
+        audit.record('ADMIN/STAFF', f'Added new product: {product.product_name} with code: {product.product_code}',
+                     TransactionType.ADMIN, audit.ADD_RECORD)
     except (Exception, psycopg2.DatabaseError) as e:
         print(e)
     finally:
+        pg_heroku.close_connection()
         return product
 
 
 def add_staff_to_database(staff: Staff) -> Staff:
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     salt = create_salt()
     encrypted_password = encrypt_password(staff.staff_password, salt)
     try:
-        sql = """INSERT INTO hainco_staff(
-                        staff_full_name, 
-                        staff_contact_number, 
-                        staff_username, 
-                        staff_password_salt,
-                        staff_password_hash,
-                        staff_address,
-                        staff_position,
-                        staff_is_active
-                        ) VALUES(%s, %s, %s, %s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (staff.staff_full_name,
-                             staff.staff_contact_number,
-                             staff.staff_username,
-                             salt,
-                             encrypted_password,
-                             staff.staff_address,
-                             staff.staff_position,
-                             staff.staff_is_active
-                             ))
+        pg_heroku.execute(cursor, queries.ADD_STAFF, (staff.staff_full_name,
+                                                      staff.staff_contact_number,
+                                                      staff.staff_username,
+                                                      salt,
+                                                      encrypted_password,
+                                                      staff.staff_position,
+                                                      staff.staff_is_active
+                                                      ))
         pg_heroku.commit()
+        table_version_cache.invalidate('hainco_staff')
         cursor.close()
+        audit.record('ADMIN', f'Added new staff with username: {staff.staff_username}',
+                     TransactionType.ADMIN, audit.ADD_RECORD)
     except (Exception, psycopg2.DatabaseError) as e:
         print(e)
     finally:
+        pg_heroku.close_connection()
         return staff
 
 
 def add_transaction_to_database(transaction: Transaction) -> Transaction:
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     try:
-        sql = """INSERT INTO hainco_transaction(
-                    transaction_agent, 
-                    transaction_description, 
-                    transaction_type, 
-                    transaction_amount,
-                    transaction_date
-                    ) VALUES(%s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (transaction.transaction_agent,
-                             transaction.transaction_description,
-                             transaction.transaction_type,
-                             transaction.transaction_amount,
-                             transaction.transaction_date
-                             ))
+        pg_heroku.execute(cursor, queries.ADD_TRANSACTION, (transaction.transaction_agent,
+                                                            transaction.transaction_description,
+                                                            transaction.transaction_type,
+                                                            transaction.transaction_amount,
+                                                            transaction.transaction_date
+                                                            ))
         pg_heroku.commit()
         cursor.close()
     except (Exception, psycopg2.DatabaseError) as e:
         print(e)
     finally:
+        pg_heroku.close_connection()
         return transaction
 
-def add_order_to_database(order: Order) -> Order:
+def add_order_to_database(order: Order) -> dict[str, Any] | None:
+    pg_heroku = DatabaseOperator(pooled=True, cursor_factory=RealDictCursor)
+    cursor = pg_heroku.get_cursor()
+    order_record = None
+    try:
+        pg_heroku.execute(cursor, queries.ADD_ORDER, (order.order_product_code,
+                                                      order.order_customer_email,
+                                                      order.order_request,
+                                                      order.order_date,
+                                                      order.order_staff_username,
+                                                      order.order_status
+                                                      ))
+        order_record = dict(cursor.fetchone())
+        pg_heroku.commit()
+        cursor.close()
+        _record_order(order_record)
+        order_feed.publish_local(ORDER_CREATED, order_record)
+    except (Exception, psycopg2.DatabaseError) as e:
+        print(e)
+        order_record = None
+    finally:
+        pg_heroku.close_connection()
+        return order_record
+
+
+def place_order_in_database(checkout: Checkout) -> list[dict[str, Any]]:
+    """
+    Places every line of a cart in one round trip and one transaction through place_order,
+    which reserves the stock under row locks so concurrent checkouts cannot oversell.
+    A line with a quantity of n creates n orders
+
+    :param Checkout checkout: The cart to place
+    :return: Returns the created orders, in line order
+    """
+    pg_heroku = DatabaseOperator(pooled=True, cursor_factory=RealDictCursor)
+    cursor = pg_heroku.get_cursor()
+    try:
+        pg_heroku.execute(cursor, queries.PLACE_ORDER, (checkout.order_customer_email,
+                                                        checkout.order_staff_username,
+                                                        checkout.order_status,
+                                                        checkout.order_date,
+                                                        [line.product_code for line in checkout.lines],
+                                                        [line.quantity for line in checkout.lines],
+                                                        [line.request for line in checkout.lines]))
+        order_records = [dict(row) for row in cursor.fetchall()]
+        pg_heroku.commit()
+        cursor.close()
+    except psycopg2.DatabaseError as e:
+        if e.pgcode == INSUFFICIENT_STOCK:
+            raise InsufficientStock(json.loads(e.diag.message_detail))
+        if e.pgcode == UNAVAILABLE_PRODUCTS:
+            raise UnavailableProducts(json.loads(e.diag.message_detail))
+        print(e)
+        raise
+    finally:
+        pg_heroku.close_connection()
+    # the ordered products have less stock now
+    catalog_cache.invalidate()
+    table_version_cache.invalidate('hainco_product')
+    for order_record in order_records:
+        _record_order(order_record)
+        order_feed.publish_local(ORDER_CREATED, order_record)
+    return order_records
+
+
+def _record_order(order_record: dict[str, Any]):
+    audit.record('CUSTOMER',
+                 f"New Order by: {order_record['order_customer_email']} "
+                 f"ordering: {order_record['order_product_code']}",
+                 TransactionType.ORDER, audit.ADD_RECORD,
+                 product_code=order_record['order_product_code'])
+
+
+# === BULK INSERTS ===
+
+def _bulk_insert(query: queries.Query, rows: list[tuple]) -> list[tuple]:
+    """
+    Inserts many rows inside a single transaction, a page of BULK_PAGE_SIZE rows per statement.
+    Each page is sent as one array per column, so every page runs the same prepared statement
+
+    :param Query query: The INSERT statement, reading every column from an array parameter
+    :param list rows: The values of each row
+    :return: Returns the rows produced by the RETURNING clause of the statement
+    """
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     try:
-        sql = """INSERT INTO hainco_product(
-                        order_product_code,
-                        order_customer_email,
-                        order_requests,
-                        order_date,
-                        order_staff_username,
-                        order_status
-                    ) VALUES(%s, %s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (order.order_product_code,
-                             order.order_customer_email,
-                             order.order_requests,
-                             order.order_date,
-                             order.order_staff_username,
-                             order.order_status
-                             ))
+        returned = []
+        for start in range(0, len(rows), BULK_PAGE_SIZE):
+            columns = [list(column) for column in zip(*rows[start:start + BULK_PAGE_SIZE])]
+            pg_heroku.execute(cursor, query, columns)
+            returned.extend(cursor.fetchall())
         pg_heroku.commit()
         cursor.close()
+        return returned
     except (Exception, psycopg2.DatabaseError) as e:
         print(e)
+        raise
     finally:
-        return order
\ No newline at end of file
+        pg_heroku.close_connection()
+
+
+def _row_results(keys: list[Any], created_keys: set[Any]) -> list[dict[str, Any]]:
+    """
+    Builds the result of every submitted row, in the order they were received.
+    Only the first row of a key can be created, repeated keys are reported as duplicates
+    """
+    results = []
+    for index, key in enumerate(keys):
+        created = key in created_keys
+        created_keys.discard(key)
+        results.append({
+            'index': index,
+            'key': key,
+            'status': 'created' if created else 'duplicate'
+        })
+    return results
+
+
+def add_products_to_database(products: list[Product]) -> list[dict[str, Any]]:
+    rows = [(product.product_name,
+             product.product_price,
+             product.product_image_link,
+             product.product_stock,
+             product.product_type,
+             product.product_is_active,
+             product.product_description,
+             product.product_code) for product in products]
+    created = _bulk_insert(queries.ADD_PRODUCTS, rows)
+    catalog_cache.invalidate()
+    table_version_cache.invalidate('hainco_product')
+    created_codes = {row[0] for row in created}
+    for product in products:
+        if product.product_code in created_codes:
+            audit.record('ADMIN/STAFF', f'Added new product: {product.product_name} with code: {product.product_code}',
+                         TransactionType.ADMIN, audit.ADD_RECORD)
+    return _row_results([product.product_code for product in products], created_codes)
+
+
+def add_customers_to_database(customers: list[Customer]) -> list[dict[str, Any]]:
+    rows = []
+    for customer in customers:
+        salt = create_salt()
+        rows.append((customer.customer_first_name,
+                     customer.customer_middle_name,
+                     customer.customer_last_name,
+                     customer.customer_email,
+                     customer.customer_is_active,
+                     salt,
+                     encrypt_password(customer.customer_password, salt),
+                     customer.customer_contact_number))
+    created = _bulk_insert(queries.ADD_CUSTOMERS, rows)
+    for row in created:
+        audit.record('ADMIN/CUSTOMER', f'Added new customer with email: {row[0]}',
+                     TransactionType.ADMIN, audit.ADD_RECORD)
+    return _row_results([customer.customer_email for customer in customers], {row[0] for row in created})
+
+
+def add_staffs_to_database(staffs: list[Staff]) -> list[dict[str, Any]]:
+    rows = []
+    for staff in staffs:
+        salt = create_salt()
+        rows.append((staff.staff_full_name,
+                     staff.staff_contact_number,
+                     staff.staff_username,
+                     salt,
+                     encrypt_password(staff.staff_password, salt),
+                     staff.staff_position,
+                     staff.staff_is_active))
+    created = _bulk_insert(queries.ADD_STAFFS, rows)
+    table_version_cache.invalidate('hainco_staff')
+    for row in created:
+        audit.record('ADMIN', f'Added new staff with username: {row[0]}',
+                     TransactionType.ADMIN, audit.ADD_RECORD)
+    return _row_results([staff.staff_username for staff in staffs], {row[0] for row in created})
+
+
+def add_orders_to_database(orders: list[Order]) -> list[dict[str, Any]]:
+    rows = [(order.order_product_code,
+             order.order_customer_email,
+             order.order_request,
+             order.order_date,
+             order.order_staff_username,
+             order.order_status) for order in orders]
+    created = [dict(zip(ORDER_COLUMNS, row)) for row in _bulk_insert(queries.ADD_ORDERS, rows)]
+    for order_record in created:
+        _record_order(order_record)
+        order_feed.publish_local(ORDER_CREATED, order_record)
+    # orders have no natural key, every row is created and gets its order number
+    return [{'index': index, 'key': order_record['order_number'], 'status': 'created'}
+            for index, order_record in enumerate(created)]
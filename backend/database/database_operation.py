@@ -1,45 +1,300 @@
-from typing import Any
+import os
+import threading
+import time
+import weakref
+from typing import Any, Sequence
 
 from dotenv import dotenv_values, load_dotenv
 import psycopg2 as pg
+import psycopg2.errors
+from psycopg2 import extensions as pg_extensions
+from psycopg2 import pool as pg_pool
 from psycopg2.extras import RealDictCursor
 
+from backend.database import queries
+from backend.database.queries import Query
+from backend.operations import metrics
+
+load_dotenv()
 config = dotenv_values('.env')
 
+# === CONNECTION POOL SETTINGS ===
+# every gunicorn worker opens a psycopg2 pool for the writes, an asyncpg pool for the reads
+# (backend/database/async_operation.py) and one connection listening for changes
+# (backend/database/notifications.py), so the server sees at most
+#   WEB_CONCURRENCY * (DB_POOL_MAX_SIZE + DB_ASYNC_POOL_MAX_SIZE + 1)
+# connections from the API. By default the workers split DB_MAX_CONNECTIONS between them, a third
+# of each share for the writes, keep it under the max_connections of the database less what psql
+# and the maintenance commands need
+
+DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', 16))
+WORKERS = int(os.getenv('WEB_CONCURRENCY', 4))
+_WORKER_CONNECTIONS = max(2, DB_MAX_CONNECTIONS // WORKERS - 1)
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', max(1, _WORKER_CONNECTIONS // 3)))
+ASYNC_POOL_MAX_SIZE = int(os.getenv('DB_ASYNC_POOL_MAX_SIZE', max(1, _WORKER_CONNECTIONS - POOL_MAX_SIZE)))
+POOL_CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', 10))
+POOL_HEALTH_CHECK_AFTER = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30))
+# seconds to wait for a new connection, so an unreachable database fails requests quickly
+# instead of holding them until the operating system gives up
+CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 10))
+
+# === AUDIT SETTINGS ===
+# trigger: the log_* triggers write the audit log inside every write
+# batched: the API sessions skip those inserts and backend/operations/audit.py writes them in batches
+
+AUDIT_MODE = os.getenv('AUDIT_MODE', 'trigger')
+
+
+def connection_params(**params) -> dict[str, Any]:
+    """
+    Builds the keyword arguments used to open a connection to the database
+
+    :return: Returns the connection keyword arguments, with the values in params taking priority
+    """
+    return {
+        'host': params.get('host', os.getenv('DB_HOST', 'ec2-35-153-35-94.compute-1.amazonaws.com')),
+        'database': params.get('database', os.getenv('DB_NAME', 'd2a8coo0jp3akd')),
+        'user': params.get('user', os.getenv('DB_USER', 'cxbubumlkovyuu')),
+        'password': params.get('password', os.getenv(
+            'DB_PASSWORD',
+            '7875893fe286b394a64661098d404972f17914786d304ef1fc66705d55840abc'
+        )),
+        'port': params.get('port', os.getenv('DB_PORT', '5432')),
+    }
+
+
+def session_settings() -> dict[str, str]:
+    """
+    Builds the settings every API session starts with
+
+    :return: Returns the setting names and values
+    """
+    return {'hainco.audit_mode': AUDIT_MODE}
+
+
+def session_options() -> str:
+    """
+    Builds the libpq options string applying session_settings to a psycopg2 connection
+    """
+    return ' '.join(f'-c {name}={value}' for name, value in session_settings().items())
+
+
+class ConnectionPool:
+    def __init__(self, min_size: int, max_size: int, **params):
+        """
+        The constructor creates a thread safe pool of database connections.
+        Checking out blocks until a connection is free instead of failing right away
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = pg_pool.ThreadedConnectionPool(
+            min_size,
+            max_size,
+            connection_factory=metrics.CountedConnection,
+            options=session_options(),
+            connect_timeout=CONNECT_TIMEOUT,
+            **connection_params(**params)
+        )
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used: dict[int, float] = {}
+        # when a connection was last found broken, the connections idle since then are checked
+        # before use as the database may have restarted or the network dropped meanwhile
+        self._broken_at = float('-inf')
+
+    def checkout(self):
+        """
+        Borrows a connection from the pool, replacing it first if it has gone bad
+
+        :return: Returns an open psycopg2 connection
+        """
+        if not self._slots.acquire(timeout=POOL_CHECKOUT_TIMEOUT):
+            raise pg.OperationalError('Timed out waiting for a pooled database connection')
+        try:
+            # after a database restart every idle connection may be stale, so each one is checked
+            # and thrown away until a healthy one comes up. The pool holds at most max_size idle
+            # connections, once they are gone getconn opens a new one, which fails with an
+            # OperationalError when the database cannot be reached
+            for _ in range(self.max_size):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._pool.putconn(conn, close=True)
+            return self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """
+        Returns a borrowed connection to the pool. Connections left inside a transaction are
+        rolled back and broken connections are thrown away
+        """
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.info.transaction_status != pg_extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except pg.Error:
+                    broken = True
+            if broken:
+                self._last_used.pop(id(conn), None)
+                self._broken_at = time.monotonic()
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._pool.closeall()
+        self._last_used.clear()
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        # connections that were just opened or recently used are trusted as they are
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or (time.monotonic() - last_used < POOL_HEALTH_CHECK_AFTER
+                                 and last_used > self._broken_at):
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except pg.Error:
+            self._last_used.pop(id(conn), None)
+            # the connections idle since before this one broke are checked too
+            self._broken_at = time.monotonic()
+            return False
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+# pools inherited through a fork, kept referenced so they are never closed by the child:
+# closing a connection sends a Terminate message on the socket it shares with the parent
+_inherited_pools: list[ConnectionPool] = []
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the connection pool of the current process, creating it on first use
+
+    :return: Returns the shared ConnectionPool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(min(POOL_MIN_SIZE, POOL_MAX_SIZE), POOL_MAX_SIZE)
+    return _pool
+
+
+def close_pool():
+    """
+    Closes every connection of the process pool if it was opened
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _forget_pool_after_fork():
+    # a forked worker opens its own connections on first use, the lock may have been held
+    # by another thread of the parent when it forked
+    global _pool, _pool_lock, _prepared
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+    _prepared = weakref.WeakKeyDictionary()
+
+
+# names of the statements prepared on every psycopg2 connection, dropped with the connection.
+# Prepared statements belong to the session, a rollback does not remove them
+_prepared: 'weakref.WeakKeyDictionary[Any, set[str]]' = weakref.WeakKeyDictionary()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
 
 class DatabaseOperator:
-    def __init__(self, **params):
+    def __init__(self, pooled: bool = False, **params):
         """
-        The constructor creates an instance of a Database connection
+        The constructor creates an instance of a Database connection. When pooled is set,
+        the connection is borrowed from the process pool and given back by close_connection
+        or when leaving a with block
         """
-        load_dotenv()
-        self.host = params.get('host', 'ec2-35-153-35-94.compute-1.amazonaws.com')
-        self.database_name = params.get('database', 'd2a8coo0jp3akd')
-        self.user = params.get('user', 'cxbubumlkovyuu')
-        self.password = params.get('password', '7875893fe286b394a64661098d404972f17914786d304ef1fc66705d55840abc')
-        self.port = params.get('port', '5432')
+        connection = connection_params(**params)
+        self.host = connection['host']
+        self.database_name = connection['database']
+        self.user = connection['user']
+        self.password = connection['password']
+        self.port = connection['port']
         self.cursor_factory = params.get('cursor_factory', None)
-        self.conn = pg.connect(
-            host=self.host,
-            database=self.database_name,
-            user=self.user,
-            password=self.password,
-            port=self.port,
-            cursor_factory=self.cursor_factory,
-        )
+        self.pooled = pooled
+        if pooled:
+            self.conn = get_pool().checkout()
+        else:
+            self.conn = pg.connect(
+                host=self.host,
+                database=self.database_name,
+                user=self.user,
+                password=self.password,
+                port=self.port,
+                cursor_factory=self.cursor_factory,
+                connection_factory=metrics.CountedConnection,
+                options=session_options(),
+                connect_timeout=CONNECT_TIMEOUT,
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_connection()
 
     def get_cursor(self):
-        return self.conn.cursor()
+        metrics.DB_CURSORS.labels('psycopg2').inc()
+        return self.conn.cursor(cursor_factory=metrics.timed_cursor_factory(self.cursor_factory))
 
     def close_cursor(self):
         self.conn.cursor().close()
 
     def close_connection(self):
-        self.conn.close()
+        if self.conn is None:
+            return
+        if self.pooled:
+            get_pool().release(self.conn)
+        else:
+            self.conn.close()
+        self.conn = None
 
     def commit(self):
         self.conn.commit()
 
+    def execute(self, cursor, query: Query, params: Sequence[Any] = ()):
+        """
+        Runs a registered statement by name. The statement is prepared the first time the
+        connection runs it, later runs only send EXECUTE with the values, so Postgres
+        parses it once per connection and can reuse its plan
+
+        :param cursor: A cursor of this operator
+        :param Query query: The statement, from backend/database/queries.py
+        :param params: The values of $1, $2, ... in order
+        """
+        prepared = _prepared.setdefault(self.conn, set())
+        if query.name not in prepared:
+            cursor.execute(f'PREPARE {query.name} AS {query.sql}')
+            prepared.add(query.name)
+        if params:
+            cursor.execute(f'EXECUTE {query.name}({", ".join(["%s"] * len(params))})', tuple(params))
+        else:
+            cursor.execute(f'EXECUTE {query.name}')
+
     # def get_next_id(self, table: str):
     #     sql = f'SELECT {table}_id FROM hainco_{table} ORDER BY id DESC LIMIT 1'
     #     print(sql)
@@ -49,30 +304,39 @@ class DatabaseOperator:
     #     # return int(max_id) + 1
 
 
-def count_rows() -> list[tuple[Any, ...]]:
+# tables reported by count_rows
+COUNTED_TABLES = [
+    'hainco_admin',
+    'hainco_customer',
+    'hainco_order',
+    'hainco_product',
+    'hainco_staff',
+    'hainco_transaction',
+]
+
+
+def count_rows(mode: str = 'exact') -> list[tuple[Any, ...]]:
     """
-    A static function to count the rows of the tables to be used as counters in the front end
+    A static function to count the rows of the tables to be used as counters in the front end.
+    The exact counts are read from the hainco_row_count table kept up to date by triggers
+    (scripts/create_row_counters.sql), the estimates from the planner statistics
 
+    :param str mode: Either exact or estimate
     :return: Returns a list of tuples with the corresponding number of rows
     """
-    db = DatabaseOperator(cursor_factory=RealDictCursor)
-    cursor = db.get_cursor()
-    sql = """
-    SELECT 
-        table_name, 
-        cnt_rows(table_schema, table_name) AS rows
-    FROM information_schema.tables
-    WHERE 
-        table_schema NOT IN ('pg_catalog', 'information_schema') AND
-        table_name NOT LIKE ('%position') AND
-        table_name NOT LIKE ('%interval') AND
-        table_name NOT LIKE ('%type') AND 
-        table_name NOT LIKE ('%status')
-        and table_type='BASE TABLE'
-    ORDER BY
-        table_name;
-    """
+    with DatabaseOperator(pooled=True, cursor_factory=RealDictCursor) as db:
+        cursor = db.get_cursor()
+        if mode == 'estimate':
+            db.execute(cursor, queries.ROW_COUNT_ESTIMATES, (COUNTED_TABLES,))
+            return cursor.fetchall()
+
+        try:
+            db.execute(cursor, queries.ROW_COUNTS, (COUNTED_TABLES,))
+            return cursor.fetchall()
+        except pg.errors.UndefinedTable:
+            # the counters were not created yet, fall back to counting every table
+            db.conn.rollback()
 
-    cursor.execute(sql)
-    row_counts = cursor.fetchall()
-    return row_counts
+        db.execute(cursor, queries.ROW_COUNTS_BY_COUNTING)
+        row_counts = cursor.fetchall()
+        return row_counts
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+from typing import Any
+
+import asyncpg
+from psycopg2 import OperationalError
+
+import backend.database.async_operation as async_db
+from backend.database import queries
+from backend.database.async_operation import CONNECTION_ERRORS
+from backend.database.cache import catalog_cache, row_count_cache, table_version_cache
+from backend.database.database_operation import connection_params
+from backend.database.queries import ORDER_COLUMNS
+from backend.operations.order_feed import ORDER_CREATED, ORDER_STATUS_CHANGED, order_feed
+
+# === NOTIFICATION SETTINGS ===
+# the trigger functions of scripts/create_triggers.sql and scripts/update_triggers.sql send
+# a notification for every write, and every worker listens on its own connection
+
+CHANGES_CHANNEL = 'hainco_changes'
+NOTIFY_LISTEN = os.getenv('DB_NOTIFY_LISTEN', 'true').lower() not in ('0', 'false', 'no')
+NOTIFY_RECONNECT_DELAY = float(os.getenv('DB_NOTIFY_RECONNECT_DELAY', 1))
+NOTIFY_RECONNECT_MAX_DELAY = float(os.getenv('DB_NOTIFY_RECONNECT_MAX_DELAY', 30))
+
+
+def handle_change(change: dict[str, Any]):
+    """
+    Applies a change notified by the database to the state kept by this worker
+
+    :param dict change: The decoded payload, with the table, op and key of the changed row
+    """
+    table = change.get('table')
+    table_version_cache.invalidate(table)
+    if change.get('op') in ('INSERT', 'DELETE', 'TRUNCATE'):
+        row_count_cache.invalidate()
+    if table == 'hainco_product':
+        catalog_cache.invalidate()
+    elif table == 'hainco_order' and change.get('key') is not None:
+        if change.get('op') == 'INSERT':
+            _publish_order(ORDER_CREATED, change)
+        elif change.get('old_status') != change.get('status'):
+            _publish_order(ORDER_STATUS_CHANGED, change)
+
+
+def _publish_order(event_type: str, change: dict[str, Any]):
+    if change.get('row') is not None:
+        order = {column: change['row'].get(column) for column in ORDER_COLUMNS}
+        order_feed.publish(event_type, order, change.get('id'))
+        return
+    # the row was too long to be sent with the notification
+    task = asyncio.get_running_loop().create_task(_fetch_and_publish_order(event_type, change))
+    _fetching.add(task)
+    task.add_done_callback(_fetching.discard)
+
+
+# the tasks reading the orders left out of their notification, kept until done
+_fetching: set[asyncio.Task] = set()
+
+
+async def _fetch_and_publish_order(event_type: str, change: dict[str, Any]):
+    try:
+        order = await async_db.fetch_one(queries.ORDER_BY_NUMBER.sql, change['key'])
+    except (OperationalError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        print(f'Failed to read order {change["key"]} for the order feed: {e}')
+        return
+    if order is None:
+        return
+    # the row may have changed again since, the status is the one of this change
+    order['order_status'] = change.get('status', order['order_status'])
+    order_feed.publish(event_type, order, change.get('id'))
+
+
+# caches of the tables whose every write is notified, by the triggers of
+# scripts/create_table_versions.sql
+NOTIFIED_CACHES = (catalog_cache, table_version_cache)
+
+
+def _follow_changes(followed: bool):
+    for cache in NOTIFIED_CACHES:
+        cache.invalidated_on_change = followed
+
+
+def _invalidate_all():
+    # notifications sent while the connection was down are lost for good
+    catalog_cache.invalidate()
+    row_count_cache.invalidate()
+    table_version_cache.invalidate()
+
+
+class ChangeListener:
+    def __init__(self):
+        """
+        The constructor creates the listener of the database notifications of a worker.
+        It keeps a dedicated connection outside of the pools and reconnects on its own
+        when the connection is lost
+        """
+        self._task: asyncio.Task | None = None
+        self._lost: asyncio.Event | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        for task in list(_fetching):
+            task.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset_after_fork(self):
+        # the task ran in the event loop of the parent, a forked worker listens on its own
+        self._task = None
+        self._lost = None
+        _follow_changes(False)
+
+    def _on_notification(self, conn, pid: int, channel: str, payload: str):
+        try:
+            handle_change(json.loads(payload))
+        except (ValueError, TypeError, KeyError) as e:
+            print(f'Ignored malformed notification on {channel}: {e}')
+
+    def _on_termination(self, conn):
+        if self._lost is not None:
+            self._lost.set()
+
+    async def _run(self):
+        delay = NOTIFY_RECONNECT_DELAY
+        while True:
+            conn = None
+            self._lost = asyncio.Event()
+            try:
+                params = connection_params()
+                conn = await asyncpg.connect(
+                    host=params['host'],
+                    port=int(params['port']),
+                    user=params['user'],
+                    password=params['password'],
+                    database=params['database'],
+                )
+                conn.add_termination_listener(self._on_termination)
+                await conn.add_listener(CHANGES_CHANNEL, self._on_notification)
+                order_feed.fed_by_database = True
+                # whatever was cached before listening may already be stale
+                _invalidate_all()
+                _follow_changes(True)
+                delay = NOTIFY_RECONNECT_DELAY
+                await self._lost.wait()
+                print('Lost the database notification connection, reconnecting')
+            except (*CONNECTION_ERRORS, asyncpg.PostgresError) as e:
+                print(f'Failed to listen for database notifications: {e}')
+            finally:
+                order_feed.fed_by_database = False
+                _follow_changes(False)
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            _invalidate_all()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, NOTIFY_RECONNECT_MAX_DELAY)
+
+
+change_listener = ChangeListener()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=change_listener.reset_after_fork)
+
+
+async def start_listener():
+    """
+    Starts listening for database notifications in the background, if enabled by DB_NOTIFY_LISTEN
+    """
+    if NOTIFY_LISTEN:
+        change_listener.start()
+
+
+async def stop_listener():
+    await change_listener.stop()
@@ -0,0 +1,217 @@
+import base64
+import csv
+import datetime as dt
+import decimal
+import io
+import json
+import os
+import zlib
+from typing import Any, AsyncIterator, Callable
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette import status
+from starlette.exceptions import HTTPException
+
+import backend.database.async_operation as async_db
+from backend.database.serialization import rows_response
+
+# === PAGINATION SETTINGS ===
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+STREAM_PREFETCH = int(os.getenv('STREAM_PREFETCH', 500))
+# bytes of CSV gathered before sending them, so an export is not sent one row at a time
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 64 * 1024))
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class Keyset:
+    def __init__(self, *columns: tuple[str, Callable[[Any], Any]], descending: bool = False):
+        """
+        The constructor describes the indexed columns a list endpoint is ordered and paged by.
+        Each column comes with the function used to read its value back from a cursor
+
+        :param columns: Pairs of column name and cursor value parser, the last column must be unique
+        :param bool descending: Whether the rows are listed from the highest key down
+        """
+        self.columns = [name for name, _ in columns]
+        self.parsers = [parser for _, parser in columns]
+        self.descending = descending
+
+    def encode_cursor(self, row: dict[str, Any]) -> str:
+        """
+        Builds the opaque cursor pointing right after the given row
+
+        :param dict row: The last row of a page
+        :return: Returns the URL safe cursor string
+        """
+        values = [_encode_value(row[name]) for name in self.columns]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor: str) -> list[Any]:
+        """
+        Reads the key values back from a cursor made by encode_cursor
+
+        :param str cursor: The cursor received from the client
+        :return: Returns the key values, in column order
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.columns):
+                raise ValueError('cursor does not match the keyset')
+            return [parser(value) for parser, value in zip(self.parsers, values)]
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Invalid pagination cursor'
+            )
+
+    def query(self, sql: str, args: tuple = (), after: str | None = None,
+              limit: int | None = None) -> tuple[str, list[Any]]:
+        """
+        Wraps a query so it is ordered by the keyset, optionally starting after a cursor
+        and limited to a page
+
+        :param str sql: The base query, which must select the keyset columns
+        :param tuple args: The arguments already used by the base query
+        :param str after: The cursor of the last row of the previous page
+        :param int limit: The most rows to return
+        :return: Returns the wrapped query and its arguments
+        """
+        args = list(args)
+        where = ''
+        if after is not None:
+            placeholders = []
+            for value in self.decode_cursor(after):
+                args.append(value)
+                placeholders.append(f'${len(args)}')
+            where = ' WHERE ({}) {} ({})'.format(
+                ', '.join(self.columns),
+                '<' if self.descending else '>',
+                ', '.join(placeholders)
+            )
+        direction = ' DESC' if self.descending else ''
+        order_by = ', '.join(f'{name}{direction}' for name in self.columns)
+        wrapped = f'SELECT * FROM ({sql}) AS page{where} ORDER BY {order_by}'
+        if limit is not None:
+            args.append(limit)
+            wrapped += f' LIMIT ${len(args)}'
+        return wrapped, args
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    encoded = _encode_value(value)
+    if encoded is value:
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    return encoded
+
+
+async def ndjson_lines(records: AsyncIterator) -> AsyncIterator[bytes]:
+    """
+    Encodes streamed rows as newline delimited JSON
+
+    :param records: The rows coming from async_operation.stream
+    :return: Yields one encoded line per row
+    """
+    async for record in records:
+        yield (json.dumps(dict(record), default=_json_default) + '\n').encode()
+
+
+async def csv_lines(records: AsyncIterator, columns: tuple[str, ...]) -> AsyncIterator[bytes]:
+    """
+    Encodes streamed rows as CSV, with a header row first even when there are no rows.
+    The rows are sent in chunks of about EXPORT_CHUNK_SIZE bytes
+
+    :param records: The rows coming from async_operation.stream
+    :param tuple columns: The names of the columns of the rows, in order
+    :return: Yields the encoded chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for record in records:
+        writer.writerow(record)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """
+    Reads an Accept-Encoding header the way RFC 9110 does: gzip is accepted when it is listed,
+    or covered by *, with a q-value above 0. gzip;q=0 refuses it
+
+    :param str accept_encoding: The Accept-Encoding header of the request, None when not sent
+    :return: Returns whether the response may be compressed with gzip
+    """
+    weights = {}
+    for coding in (accept_encoding or '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name:
+            weights[name.lower()] = weight
+    return weights.get('gzip', weights.get('*', 0.0)) > 0
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Compresses a streamed body with gzip as it is sent, chunk by chunk
+
+    :param chunks: The chunks of the body
+    :return: Yields the compressed chunks
+    """
+    # wbits above 16 writes the gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def paginate(keyset: Keyset, sql: str, response: Response, limit: int | None,
+                   after: str | None, stream: bool, args: tuple = ()):
+    """
+    Serves a list endpoint one page at a time, or streams every row as newline delimited JSON.
+    The cursor of the next page is sent back in the X-Next-Cursor header
+
+    :param Keyset keyset: The ordering of the listed table
+    :param str sql: The base query of the endpoint
+    :param Response response: The response of the endpoint, used to set the cursor header
+    :param int limit: The page size
+    :param str after: The cursor of the previous page
+    :param bool stream: Whether to stream the rows instead of returning a page
+    :param tuple args: The arguments of the base query
+    :return: Returns the page as a RowsResponse, or a StreamingResponse
+    """
+    wrapped, wrapped_args = keyset.query(sql, args, after, limit)
+    if stream:
+        records = await async_db.stream(wrapped, *wrapped_args, prefetch=STREAM_PREFETCH)
+        # carry over the headers already set by the endpoint. Closing the rows once the response
+        # is over gives their connection back even when the client left halfway
+        return StreamingResponse(ndjson_lines(records), media_type='application/x-ndjson',
+                                 headers=dict(response.headers), background=BackgroundTask(records.aclose))
+
+    records = await async_db.fetch_records(wrapped, *wrapped_args)
+    if limit is not None and len(records) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = keyset.encode_cursor(records[-1])
+    return rows_response(records, response)
@@ -0,0 +1,709 @@
+import threading
+from typing import NamedTuple
+
+# === QUERY REGISTRY ===
+# every statement the API sends, by name. The writes run through DatabaseOperator.execute,
+# which prepares each statement once per pooled psycopg2 connection and then runs it with
+# EXECUTE, the reads through async_operation, whose asyncpg connections prepare and keep every
+# statement they run. Either way Postgres parses and plans a statement once per connection.
+# Parameters are always $1, $2, ... placeholders, values are never put into the SQL text
+
+
+class Query(NamedTuple):
+    name: str
+    sql: str
+
+
+QUERIES: dict[str, Query] = {}
+_NAMES: dict[str, str] = {}
+_register_lock = threading.Lock()
+
+
+def register(name: str, sql: str) -> Query:
+    """
+    Adds a statement to the registry
+
+    :param str name: The name of the statement, used as the name of the prepared statement
+    :param str sql: The statement, using $1, $2, ... placeholders
+    :return: Returns the registered Query
+    """
+    if name in QUERIES:
+        raise ValueError(f'Query {name} is already registered')
+    query = Query(name, sql)
+    QUERIES[name] = query
+    _NAMES[sql] = name
+    return query
+
+
+def partial_update(table: str, key_column: str, columns: list[str], returning: str) -> Query:
+    """
+    Returns the UPDATE of only some columns of a row, registering it the first time that set
+    of columns is updated. The statement is named after the columns it sets, so every set of
+    columns is prepared once per connection like the other statements
+
+    :param str table: The table, one of UPDATABLE_COLUMNS
+    :param str key_column: The column identifying the row, bound to the last parameter
+    :param list columns: The columns to set, bound to $1, $2, ... in the order of UPDATABLE_COLUMNS
+    :param str returning: The column sent back for the updated row
+    :return: Returns the registered Query
+    """
+    updatable = UPDATABLE_COLUMNS[table]
+    unknown = set(columns) - set(updatable)
+    if not columns or unknown:
+        raise ValueError(f'Cannot update {sorted(unknown) or "no columns"} of {table}')
+    # one bit per updatable column
+    mask = sum(1 << updatable.index(column) for column in set(columns))
+    name = f'patch_{table.removeprefix("hainco_")}_{mask}'
+    query = QUERIES.get(name)
+    if query is not None:
+        return query
+    ordered = [column for column in updatable if column in columns]
+    assignments = ',\n                    '.join(f'{column} = ${index}' for index, column in enumerate(ordered, 1))
+    with _register_lock:
+        if name in QUERIES:
+            return QUERIES[name]
+        return register(name, f"""UPDATE {table}
+                    SET {assignments}
+                    WHERE {key_column} = ${len(ordered) + 1}
+                    RETURNING {returning}""")
+
+
+def name_of(sql: str) -> str | None:
+    """
+    Returns the name a statement is registered under, or None when it is not registered
+    """
+    return _NAMES.get(sql)
+
+
+# the columns of an order as listed by GET /order and sent by the order feed
+ORDER_COLUMNS = (
+    'order_id',
+    'order_product_code',
+    'order_customer_email',
+    'order_requests',
+    'order_date',
+    'order_staff_username',
+    'order_status',
+    'order_number',
+)
+
+
+# columns the partial updates may set, in the order they are set
+UPDATABLE_COLUMNS = {
+    'hainco_admin': (
+        'admin_full_name',
+        'admin_username',
+        'admin_position',
+        'admin_is_active',
+        'admin_password_salt',
+        'admin_password_hash',
+        'admin_password_argon2',
+    ),
+    'hainco_product': (
+        'product_name',
+        'product_price',
+        'product_image_link',
+        'product_stock',
+        'product_type',
+        'product_is_active',
+        'product_description',
+        'product_code',
+    ),
+    'hainco_staff': (
+        'staff_full_name',
+        'staff_contact_number',
+        'staff_username',
+        'staff_password_salt',
+        'staff_password_hash',
+        'staff_position',
+        'staff_is_active',
+    ),
+    'hainco_customer': (
+        'customer_first_name',
+        'customer_middle_name',
+        'customer_last_name',
+        'customer_email',
+        'customer_is_active',
+        'customer_password_salt',
+        'customer_password_hash',
+        'customer_contact_number',
+    ),
+}
+
+
+# === ADMIN ===
+
+ADMIN_LIST = register('admin_list', """SELECT
+                        admin_id,
+                        admin_full_name,
+                        admin_username,
+                        admin_position,
+                        admin_is_active
+                        FROM hainco_admin""")
+
+ADMIN_BY_USERNAME = register('admin_by_username', """SELECT
+                        admin_id,
+                        admin_full_name,
+                        admin_username,
+                        admin_password_salt,
+                        admin_password_hash,
+                        admin_position,
+                        admin_is_active
+                        FROM hainco_admin
+                        WHERE admin_username = $1""")
+
+ADMIN_USERNAME_TAKEN = register('admin_username_taken', """SELECT EXISTS (
+                        SELECT 1 FROM hainco_admin WHERE admin_username = $1
+                        )""")
+
+ADMIN_CREDENTIALS = register('admin_credentials', """SELECT
+                        admin_id,
+                        admin_username,
+                        admin_position,
+                        admin_is_active,
+                        admin_password_argon2,
+                        admin_password_salt,
+                        admin_password_hash
+                        FROM hainco_admin
+                        WHERE admin_username = $1""")
+
+REHASH_ADMIN_PASSWORD = register('rehash_admin_password', """UPDATE hainco_admin
+                        SET admin_password_argon2 = $1
+                        WHERE admin_id = $2
+                        RETURNING admin_full_name""")
+
+ADD_ADMIN = register('add_admin', """INSERT INTO hainco_admin(
+                    admin_full_name,
+                    admin_username,
+                    admin_position,
+                    admin_is_active,
+                    admin_password_salt,
+                    admin_password_hash,
+                    admin_password_argon2
+                    ) VALUES($1, $2, $3, $4, $5, $6, $7)""")
+
+UPDATE_ADMIN = register('update_admin', """UPDATE hainco_admin
+                    SET admin_full_name = $1,
+                    admin_username = $2,
+                    admin_position = $3,
+                    admin_is_active = $4,
+                    admin_password_salt = $5,
+                    admin_password_hash = $6,
+                    admin_password_argon2 = $7
+                    WHERE admin_username = $8""")
+
+
+# === PRODUCT ===
+
+PRODUCT_LIST = register('product_list', """SELECT
+                            product_id,
+                            product_name,
+                            product_price,
+                            product_image_link,
+                            product_stock,
+                            product_description,
+                            product_type,
+                            product_is_active,
+                            product_code
+                            FROM hainco_product""")
+
+PRODUCT_BY_CODE = register('product_by_code', """SELECT
+                            product_id,
+                            product_name,
+                            product_price,
+                            product_image_link,
+                            product_stock,
+                            product_description,
+                            product_type,
+                            product_is_active,
+                            product_code
+                            FROM hainco_product
+                            WHERE product_code = $1""")
+
+# see scripts/create_product_search.sql, $1 is the search text. The filters are left out when
+# NULL: $2 the product types, $3 active or inactive, $4 in stock only, $5 and $6 the price range
+PRODUCT_SEARCH = register('product_search', """SELECT
+                            product_id,
+                            product_name,
+                            product_price,
+                            product_image_link,
+                            product_stock,
+                            product_description,
+                            product_type,
+                            product_is_active,
+                            product_code,
+                            round(ts_rank_cd(product_search, search)::numeric, 4)
+                                AS rank
+                            FROM hainco_product, product_search_query($1) AS search
+                            WHERE product_search @@ search
+                            AND ($2::integer[] IS NULL OR product_type = ANY($2))
+                            AND ($3::boolean IS NULL OR product_is_active = $3)
+                            AND (NOT $4::boolean OR product_stock > 0)
+                            AND ($5::numeric IS NULL OR product_price >= $5)
+                            AND ($6::numeric IS NULL OR product_price <= $6)""")
+
+# the same filters without search text, every product ranks the same
+PRODUCT_FILTER = register('product_filter', """SELECT
+                            product_id,
+                            product_name,
+                            product_price,
+                            product_image_link,
+                            product_stock,
+                            product_description,
+                            product_type,
+                            product_is_active,
+                            product_code,
+                            0::numeric AS rank
+                            FROM hainco_product
+                            WHERE ($1::integer[] IS NULL OR product_type = ANY($1))
+                            AND ($2::boolean IS NULL OR product_is_active = $2)
+                            AND (NOT $3::boolean OR product_stock > 0)
+                            AND ($4::numeric IS NULL OR product_price >= $4)
+                            AND ($5::numeric IS NULL OR product_price <= $5)""")
+
+PRODUCT_CODE_TAKEN = register('product_code_taken', """SELECT EXISTS (
+                            SELECT 1 FROM hainco_product WHERE product_code = $1
+                            )""")
+
+ADD_PRODUCT = register('add_product', """INSERT INTO hainco_product(
+                    product_name,
+                    product_price,
+                    product_image_link,
+                    product_stock,
+                    product_type,
+                    product_is_active,
+                    product_description,
+                    product_code
+                    ) VALUES($1, $2, $3, $4, $5, $6, $7, $8)""")
+
+# one array per column, so a page of any size runs the same prepared statement
+ADD_PRODUCTS = register('add_products', """INSERT INTO hainco_product(
+                product_name,
+                product_price,
+                product_image_link,
+                product_stock,
+                product_type,
+                product_is_active,
+                product_description,
+                product_code
+                )
+                SELECT * FROM unnest(
+                    $1::text[], $2::numeric[], $3::text[], $4::integer[],
+                    $5::integer[], $6::boolean[], $7::text[], $8::text[]
+                )
+                ON CONFLICT (product_code) DO NOTHING
+                RETURNING product_code""")
+
+UPDATE_PRODUCT = register('update_product', """UPDATE hainco_product
+                    SET product_name = $1,
+                    product_price = $2,
+                    product_image_link = $3,
+                    product_stock = $4,
+                    product_type = $5,
+                    product_is_active = $6,
+                    product_description = $7,
+                    product_code = $8
+                    WHERE product_code = $9""")
+
+
+# === CANTEEN STAFF ===
+
+STAFF_LIST = register('staff_list', """SELECT
+                            staff_id,
+                            staff_full_name,
+                            staff_contact_number,
+                            staff_username,
+                            staff_position,
+                            staff_is_active
+                            FROM hainco_staff""")
+
+STAFF_BY_USERNAME = register('staff_by_username', """SELECT
+                            staff_id,
+                            staff_full_name,
+                            staff_contact_number,
+                            staff_username,
+                            staff_password_salt,
+                            staff_password_hash,
+                            staff_position,
+                            staff_is_active
+                            FROM hainco_staff
+                            WHERE staff_username = $1""")
+
+STAFF_USERNAME_TAKEN = register('staff_username_taken', """SELECT EXISTS (
+                            SELECT 1 FROM hainco_staff WHERE staff_username = $1
+                            )""")
+
+ADD_STAFF = register('add_staff', """INSERT INTO hainco_staff(
+                        staff_full_name,
+                        staff_contact_number,
+                        staff_username,
+                        staff_password_salt,
+                        staff_password_hash,
+                        staff_position,
+                        staff_is_active
+                        ) VALUES($1, $2, $3, $4, $5, $6, $7)""")
+
+ADD_STAFFS = register('add_staffs', """INSERT INTO hainco_staff(
+                staff_full_name,
+                staff_contact_number,
+                staff_username,
+                staff_password_salt,
+                staff_password_hash,
+                staff_position,
+                staff_is_active
+                )
+                SELECT * FROM unnest(
+                    $1::text[], $2::text[], $3::text[], $4::text[],
+                    $5::text[], $6::integer[], $7::boolean[]
+                )
+                ON CONFLICT (staff_username) DO NOTHING
+                RETURNING staff_username""")
+
+UPDATE_STAFF = register('update_staff', """UPDATE hainco_staff
+                    SET staff_full_name = $1,
+                        staff_contact_number = $2,
+                        staff_username = $3,
+                        staff_password_salt = $4,
+                        staff_password_hash = $5,
+                        staff_position = $6,
+                        staff_is_active = $7
+                    WHERE staff_username = $8""")
+
+
+# === CUSTOMER ===
+
+CUSTOMER_LIST = register('customer_list', """SELECT
+                            customer_id,
+                            customer_first_name,
+                            customer_middle_name,
+                            customer_last_name,
+                            customer_email,
+                            customer_contact_number,
+                            customer_is_active
+                            FROM hainco_customer""")
+
+CUSTOMER_BY_EMAIL = register('customer_by_email', """SELECT
+                            customer_id,
+                            customer_first_name,
+                            customer_middle_name,
+                            customer_last_name,
+                            customer_email,
+                            customer_password_salt,
+                            customer_password_hash,
+                            customer_contact_number,
+                            customer_is_active
+                            FROM hainco_customer
+                            WHERE customer_email = $1""")
+
+CUSTOMER_EMAIL_TAKEN = register('customer_email_taken', """SELECT EXISTS (
+                            SELECT 1 FROM hainco_customer WHERE customer_email = $1
+                            )""")
+
+ADD_CUSTOMER = register('add_customer', """INSERT INTO hainco_customer(
+                    customer_first_name,
+                    customer_middle_name,
+                    customer_last_name,
+                    customer_email,
+                    customer_is_active,
+                    customer_password_salt,
+                    customer_password_hash,
+                    customer_contact_number
+                    ) VALUES($1, $2, $3, $4, $5, $6, $7, $8)""")
+
+ADD_CUSTOMERS = register('add_customers', """INSERT INTO hainco_customer(
+                customer_first_name,
+                customer_middle_name,
+                customer_last_name,
+                customer_email,
+                customer_is_active,
+                customer_password_salt,
+                customer_password_hash,
+                customer_contact_number
+                )
+                SELECT * FROM unnest(
+                    $1::text[], $2::text[], $3::text[], $4::text[],
+                    $5::boolean[], $6::text[], $7::text[], $8::text[]
+                )
+                ON CONFLICT (customer_email) DO NOTHING
+                RETURNING customer_email""")
+
+UPDATE_CUSTOMER = register('update_customer', """UPDATE hainco_customer
+                    SET customer_first_name = $1,
+                        customer_middle_name = $2,
+                        customer_last_name = $3,
+                        customer_email = $4,
+                        customer_is_active = $5,
+                        customer_password_salt = $6,
+                        customer_password_hash = $7,
+                        customer_contact_number = $8
+                    WHERE customer_email = $9""")
+
+
+# === TRANSACTION ===
+
+# the columns of a transaction as listed by GET /transaction and its CSV export
+TRANSACTION_COLUMNS = (
+    'transaction_id',
+    'transaction_agent',
+    'transaction_description',
+    'transaction_type',
+    'transaction_amount',
+    'transaction_date',
+)
+
+TRANSACTION_LIST = register('transaction_list', """SELECT
+                        {}
+                        FROM hainco_transaction""".format(',\n                        '.join(TRANSACTION_COLUMNS)))
+
+# conditions of the filters of GET /transaction, in the order of their parameters. from and to
+# are dates, to includes the whole day
+TRANSACTION_FILTERS = {
+    'from': 'transaction_date >= ${}::date',
+    'to': 'transaction_date < ${}::date + 1',
+    'transaction_type': 'transaction_type = ANY(${}::integer[])',
+    'transaction_agent': 'transaction_agent = ${}',
+}
+
+
+def transaction_list(filters: list[str]) -> Query:
+    """
+    Returns the list of transactions with only the given filters, registering it the first
+    time that set of filters is used. Leaving the unused filters out of the statement, instead
+    of skipping them when NULL, lets every set of filters be planned on the index it needs
+
+    :param list filters: The filters used, from TRANSACTION_FILTERS, bound to $1, $2, ... in
+        the order of TRANSACTION_FILTERS
+    :return: Returns the registered Query
+    """
+    unknown = set(filters) - set(TRANSACTION_FILTERS)
+    if unknown:
+        raise ValueError(f'Cannot filter transactions by {sorted(unknown)}')
+    if not filters:
+        return TRANSACTION_LIST
+    # one bit per filter
+    mask = sum(1 << list(TRANSACTION_FILTERS).index(name) for name in set(filters))
+    name = f'transaction_list_{mask}'
+    query = QUERIES.get(name)
+    if query is not None:
+        return query
+    ordered = [column for column in TRANSACTION_FILTERS if column in filters]
+    conditions = [TRANSACTION_FILTERS[column].format(index) for index, column in enumerate(ordered, 1)]
+    with _register_lock:
+        if name in QUERIES:
+            return QUERIES[name]
+        return register(name, TRANSACTION_LIST.sql + """
+                        WHERE {}""".format('\n                        AND '.join(conditions)))
+
+
+# monthly partitions of hainco_transaction and their month, see scripts/partition_transactions.sql
+TRANSACTION_PARTITIONS = register('transaction_partitions', """SELECT
+                        child.relname AS partition,
+                        to_date(right(child.relname, 7), 'YYYY_MM') AS month
+                        FROM pg_inherits
+                        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                        WHERE pg_inherits.inhparent = 'hainco_transaction'::regclass
+                        AND child.relname ~ '^hainco_transaction_[0-9]{4}_[0-9]{2}$'
+                        ORDER BY month""")
+
+CREATE_TRANSACTION_PARTITION = register('create_transaction_partition',
+                                        'SELECT create_transaction_partition($1)')
+
+CREATE_TRANSACTION_PARTITIONS = register('create_transaction_partitions',
+                                         'SELECT created FROM create_transaction_partitions($1) AS created')
+
+DROP_TRANSACTION_PARTITION = register('drop_transaction_partition',
+                                      'SELECT drop_transaction_partition($1)')
+
+ADJUST_TRANSACTION_ROW_COUNT = register('adjust_transaction_row_count',
+                                        'SELECT adjust_transaction_row_count($1)')
+
+ADD_TRANSACTION = register('add_transaction', """INSERT INTO hainco_transaction(
+                    transaction_agent,
+                    transaction_description,
+                    transaction_type,
+                    transaction_amount,
+                    transaction_date
+                    ) VALUES($1, $2, $3, $4, $5)""")
+
+# audit entries written by backend/operations/audit.py, orders are priced from the product
+# like log_add_order does
+ADD_AUDIT_ENTRIES = register('add_audit_entries', """INSERT INTO hainco_transaction(
+                transaction_agent,
+                transaction_description,
+                transaction_amount,
+                transaction_type,
+                transaction_date,
+                transaction_state
+                )
+                SELECT
+                    entry.agent,
+                    entry.description,
+                    COALESCE(entry.amount, hainco_product.product_price),
+                    entry.transaction_type,
+                    entry.date,
+                    entry.state
+                FROM unnest(
+                    $1::text[], $2::text[], $3::numeric[], $4::integer[],
+                    $5::timestamp[], $6::text[], $7::text[]
+                ) AS entry(agent, description, amount, transaction_type, date, state, product_code)
+                LEFT JOIN hainco_product ON hainco_product.product_code = entry.product_code""")
+
+
+# === ORDERS ===
+
+ORDER_LIST = register('order_list', """SELECT
+                        {}
+                        FROM hainco_order""".format(',\n                        '.join(ORDER_COLUMNS)))
+
+ORDER_BY_NUMBER = register('order_by_number', """SELECT
+                        {}
+                        FROM hainco_order
+                        WHERE order_number = $1""".format(',\n                        '.join(ORDER_COLUMNS)))
+
+# order history of a customer, newest first with the product of every order. $2 filters by the
+# order statuses, $3 and $4 by the dates of the orders (both included), each left out when NULL.
+# The order columns are all in hainco_order_customer_date_idx (scripts/create_indexes.sql) so the
+# orders are read from the index alone
+CUSTOMER_ORDERS = register('customer_orders', """SELECT
+                        hainco_order.order_id,
+                        hainco_order.order_number,
+                        hainco_order.order_date,
+                        hainco_order.order_status,
+                        hainco_order.order_product_code,
+                        hainco_product.product_name,
+                        hainco_product.product_price
+                        FROM hainco_order
+                        LEFT JOIN hainco_product
+                            ON hainco_product.product_code = hainco_order.order_product_code
+                        WHERE hainco_order.order_customer_email = $1
+                        AND ($2::integer[] IS NULL OR hainco_order.order_status = ANY($2))
+                        AND ($3::date IS NULL OR hainco_order.order_date >= $3)
+                        AND ($4::date IS NULL OR hainco_order.order_date < $4::date + 1)""")
+
+ADD_ORDER = register('add_order', """INSERT INTO hainco_order(
+                        order_product_code,
+                        order_customer_email,
+                        order_requests,
+                        order_date,
+                        order_staff_username,
+                        order_status
+                    ) VALUES($1, $2, $3, $4, $5, $6)
+                    RETURNING {}""".format(', '.join(ORDER_COLUMNS)))
+
+# created in the order they were sent, so the results line up with the request
+ADD_ORDERS = register('add_orders', """INSERT INTO hainco_order(
+                order_product_code,
+                order_customer_email,
+                order_requests,
+                order_date,
+                order_staff_username,
+                order_status
+                )
+                SELECT product_code, customer_email, requests, placed_at, staff_username, status
+                FROM unnest(
+                    $1::text[], $2::text[], $3::text[], $4::timestamp[], $5::text[], $6::integer[]
+                ) WITH ORDINALITY AS line(product_code, customer_email, requests, placed_at,
+                                          staff_username, status, position)
+                ORDER BY position
+                RETURNING {}""".format(', '.join(ORDER_COLUMNS)))
+
+# see scripts/create_checkout.sql
+PLACE_ORDER = register('place_order', """SELECT {}
+                FROM place_order($1, $2, $3, $4, $5::text[], $6::integer[], $7::text[])""".format(
+    ', '.join(ORDER_COLUMNS)))
+
+UPDATE_ORDER_STATUS = register('update_order_status', """UPDATE hainco_order
+                    SET order_status = $1
+                    FROM (
+                        SELECT order_number AS previous_number, order_status AS previous_status
+                        FROM hainco_order
+                        WHERE order_number = $2
+                        FOR UPDATE
+                    ) AS previous
+                    WHERE order_number = previous.previous_number
+                    RETURNING previous.previous_status, {}""".format(', '.join(ORDER_COLUMNS)))
+
+
+# === REPORT ===
+
+# the totals are split over shards, see scripts/create_sales_rollups.sql
+SALES_BY_DAY = register('sales_by_day', """SELECT
+                    rollup_date,
+                    dimension_key AS key,
+                    sum(transaction_amount) AS transaction_amount,
+                    sum(transaction_count)::bigint AS transaction_count,
+                    sum(order_count)::bigint AS order_count
+                    FROM hainco_sales_rollup
+                    WHERE dimension = $1 AND rollup_date BETWEEN $2 AND $3
+                    GROUP BY rollup_date, dimension_key
+                    ORDER BY rollup_date, transaction_amount DESC""")
+
+SALES_BY_WINDOW = register('sales_by_window', """SELECT
+                    dimension_key AS key,
+                    sum(transaction_amount) AS transaction_amount,
+                    sum(transaction_count) AS transaction_count,
+                    sum(order_count) AS order_count
+                    FROM hainco_sales_rollup
+                    WHERE dimension = $1 AND rollup_date BETWEEN $2 AND $3
+                    GROUP BY dimension_key
+                    ORDER BY transaction_amount DESC""")
+
+
+# === META ===
+
+# the versions are split over shards, see scripts/create_table_versions.sql
+TABLE_VERSION = register('table_version', """SELECT
+                        sum(version)::bigint AS version,
+                        max(modified_at) AS modified_at
+                        FROM hainco_table_version
+                        WHERE table_name = $1
+                        GROUP BY table_name""")
+
+# the counts are split over shards, see scripts/create_row_counters.sql
+ROW_COUNTS = register('row_counts', """SELECT
+                table_name,
+                sum(row_count)::bigint AS rows
+            FROM hainco_row_count
+            WHERE table_name = ANY($1)
+            GROUP BY
+                table_name
+            ORDER BY
+                table_name""")
+
+# a partitioned table has no statistics of its own, its partitions are added up
+ROW_COUNT_ESTIMATES = register('row_count_estimates', """SELECT
+                c.relname AS table_name,
+                CASE WHEN c.relkind = 'p' THEN (
+                    SELECT sum(COALESCE(NULLIF(leaf.reltuples, -1), leaf_stats.n_live_tup))
+                    FROM pg_partition_tree(c.oid) AS tree
+                    JOIN pg_class leaf ON leaf.oid = tree.relid
+                    LEFT JOIN pg_stat_user_tables leaf_stats ON leaf_stats.relid = leaf.oid
+                    WHERE tree.isleaf
+                ) ELSE COALESCE(NULLIF(c.reltuples, -1), s.n_live_tup) END::bigint AS rows
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE
+                n.nspname = current_schema() AND
+                c.relname = ANY($1)
+            ORDER BY
+                table_name""")
+
+# used until scripts/create_row_counters.sql is applied
+ROW_COUNTS_BY_COUNTING = register('row_counts_by_counting', """SELECT
+            table_name,
+            cnt_rows(table_schema, table_name) AS rows
+        FROM information_schema.tables
+        WHERE
+            table_schema NOT IN ('pg_catalog', 'information_schema') AND
+            table_name NOT LIKE ('%position') AND
+            table_name NOT LIKE ('%interval') AND
+            table_name NOT LIKE ('%type') AND
+            table_name NOT LIKE ('%status')
+            and table_type='BASE TABLE' AND
+            -- partitions are counted with their table
+            format('%I.%I', table_schema, table_name)::regclass NOT IN (
+                SELECT inhrelid::regclass FROM pg_inherits
+            )
+        ORDER BY
+            table_name""")
@@ -0,0 +1,49 @@
+import decimal
+from typing import Any
+
+import asyncpg
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic.json import decimal_encoder
+
+
+def _default(value: Any) -> Any:
+    # records are written as objects, the way dict(record) would be
+    if isinstance(value, asyncpg.Record):
+        return dict(value)
+    # the conversion jsonable_encoder uses, int when there are no decimal places
+    if isinstance(value, decimal.Decimal):
+        return decimal_encoder(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def encode_rows(rows: Any) -> bytes:
+    """
+    Encodes rows with orjson, giving the same JSON as jsonable_encoder followed by
+    JSONResponse: records and dicts become objects in column order, numeric columns
+    become numbers and dates become ISO 8601 strings
+
+    :param rows: The asyncpg records or dictionaries to encode
+    :return: Returns the encoded JSON
+    """
+    return orjson.dumps(rows, default=_default)
+
+
+class RowsResponse(JSONResponse):
+    """JSON response for database rows, encoded straight from the asyncpg records"""
+
+    def render(self, content: Any) -> bytes:
+        return encode_rows(content)
+
+
+def rows_response(rows: Any, response: Response) -> RowsResponse:
+    """
+    Returns rows without going through jsonable_encoder, which walks every value of every
+    row and costs more CPU than the query on the large lists
+
+    :param rows: The asyncpg records or dictionaries to send
+    :param Response response: The response of the endpoint, whose headers are carried over
+    :return: Returns the encoded response
+    """
+    return RowsResponse(rows, headers=dict(response.headers))
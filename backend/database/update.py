@@ -1,134 +1,254 @@
-import psycopg2
+from typing import Any
+
+from psycopg2.extras import RealDictCursor
 
 from backend.data_models import (
     Admin,
+    AdminPatch,
     Customer,
+    CustomerPatch,
     Product,
+    ProductPatch,
     Staff,
-    Transaction,
+    StaffPatch,
 )
 from backend.database.security import create_salt, encrypt_password
+from backend.operations.verification import hash_password
+from backend.database import queries
 from backend.database.database_operation import DatabaseOperator
-
-pg_heroku = DatabaseOperator()
+from backend.database.cache import catalog_cache, table_version_cache
+from backend.enums.order_status import OrderStatus
+from backend.enums.transaction_type import TransactionType
+from backend.operations import audit
+from backend.operations.order_feed import ORDER_STATUS_CHANGED, order_feed
 
 
 def update_admin(current_username: str, updated_admin: Admin):
+    # hash before borrowing a connection so it is not held while hashing
+    password_hash = hash_password(updated_admin.admin_password)
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     salt = create_salt()
     encrypted_password = encrypt_password(updated_admin.admin_password, salt)
     try:
-        sql = f"""UPDATE hainco_admin
-                    SET admin_full_name = %s,
-                    admin_username = %s,
-                    admin_position = %s, 
-                    admin_is_active = %s,
-                    admin_password_salt = %s,
-                    admin_password_hash = %s
-                    WHERE admin_username = '{current_username}'
-                    """
-        cursor.execute(sql, (updated_admin.admin_full_name,
-                             updated_admin.admin_username,
-                             updated_admin.admin_position,
-                             updated_admin.admin_is_active,
-                             salt,
-                             encrypted_password))
+        pg_heroku.execute(cursor, queries.UPDATE_ADMIN, (updated_admin.admin_full_name,
+                                                         updated_admin.admin_username,
+                                                         updated_admin.admin_position,
+                                                         updated_admin.admin_is_active,
+                                                         salt,
+                                                         encrypted_password,
+                                                         password_hash,
+                                                         current_username))
         pg_heroku.commit()
+        table_version_cache.invalidate('hainco_admin')
+        updated = cursor.rowcount
         cursor.close()
+        # nothing was updated when no row matched the current key
+        if not updated:
+            return None
+        audit.record('ADMIN', f'Updated admin information of: {updated_admin.admin_full_name}',
+                     TransactionType.ADMIN, audit.UPDATE_RECORD)
         return {'message': 'Record updated!'}
-    except (Exception, psycopg2.DatabaseError) as e:
-        print(e)
+    finally:
+        pg_heroku.close_connection()
 
 
 def update_product(current_product_code: str, updated_product: Product):
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     try:
-        sql = f"""UPDATE hainco_product
-                    SET product_name = %s, 
-                    product_price = %s,
-                    product_image_link = %s,
-                    product_stock = %s, 
-                    product_type = %s, 
-                    product_is_active = %s,
-                    product_description = %s,
-                    product_code = %s
-                    WHERE product_code = '{current_product_code}'
-                    """
-        cursor.execute(sql, (updated_product.product_name,
-                             updated_product.product_price,
-                             updated_product.product_image_link,
-                             updated_product.product_stock,
-                             updated_product.product_type,
-                             updated_product.product_is_active,
-                             updated_product.product_description,
-                             updated_product.product_code
-                             ))
+        pg_heroku.execute(cursor, queries.UPDATE_PRODUCT, (updated_product.product_name,
+                                                           updated_product.product_price,
+                                                           updated_product.product_image_link,
+                                                           updated_product.product_stock,
+                                                           updated_product.product_type,
+                                                           updated_product.product_is_active,
+                                                           updated_product.product_description,
+                                                           updated_product.product_code,
+                                                           current_product_code
+                                                           ))
 
         pg_heroku.commit()
+        catalog_cache.invalidate()
+        table_version_cache.invalidate('hainco_product')
+        updated = cursor.rowcount
         cursor.close()
+        # nothing was updated when no row matched the current key
+        if not updated:
+            return None
+        audit.record('ADMIN', f'Updated product information of: {updated_product.product_code}',
+                     TransactionType.ADMIN, audit.UPDATE_RECORD)
         return {'message': 'Record updated!'}
-    except (Exception, psycopg2.DatabaseError) as e:
-        print(e)
+    finally:
+        pg_heroku.close_connection()
 
 
 def update_staff(current_username: str, updated_staff: Staff):
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     salt = create_salt()
     encrypted_password = encrypt_password(updated_staff.staff_password, salt)
     try:
-        sql = f"""UPDATE hainco_staff
-                    SET staff_full_name = %s, 
-                        staff_contact_number = %s, 
-                        staff_username = %s, 
-                        staff_password_salt = %s,
-                        staff_password_hash = %s,
-                        staff_position = %s,
-                        staff_is_active = %s
-                    WHERE staff_username = '{current_username}'
-                    """
-        cursor.execute(sql, (updated_staff.staff_full_name,
-                             updated_staff.staff_contact_number,
-                             updated_staff.staff_username,
-                             salt,
-                             encrypted_password,
-                             updated_staff.staff_position,
-                             updated_staff.staff_is_active))
+        pg_heroku.execute(cursor, queries.UPDATE_STAFF, (updated_staff.staff_full_name,
+                                                         updated_staff.staff_contact_number,
+                                                         updated_staff.staff_username,
+                                                         salt,
+                                                         encrypted_password,
+                                                         updated_staff.staff_position,
+                                                         updated_staff.staff_is_active,
+                                                         current_username))
         pg_heroku.commit()
+        table_version_cache.invalidate('hainco_staff')
+        updated = cursor.rowcount
         cursor.close()
+        # nothing was updated when no row matched the current key
+        if not updated:
+            return None
+        audit.record('ADMIN', f'Updated staff information of: {updated_staff.staff_username}',
+                     TransactionType.ADMIN, audit.UPDATE_RECORD)
         return {'message': 'Record updated!'}
-    except (Exception, psycopg2.DatabaseError) as e:
-        cursor = pg_heroku.get_cursor()
-        cursor.execute("ROLLBACK")
-        print(e)
+    finally:
+        pg_heroku.close_connection()
 
 
 def update_customer(current_email: str, updated_customer: Customer):
+    pg_heroku = DatabaseOperator(pooled=True)
     cursor = pg_heroku.get_cursor()
     salt = create_salt()
     encrypted_password = encrypt_password(updated_customer.customer_password, salt)
     try:
-        sql = f"""UPDATE hainco_customer
-                    SET customer_first_name = %s, 
-                        customer_middle_name = %s,
-                        customer_last_name = %s,
-                        customer_email = %s, 
-                        customer_is_active = %s,
-                        customer_password_salt = %s,
-                        customer_password_hash = %s,
-                        customer_contact_number = %s
-                    WHERE customer_email = '{current_email}'
-                    """
-        cursor.execute(sql, (updated_customer.customer_first_name,
-                             updated_customer.customer_middle_name,
-                             updated_customer.customer_last_name,
-                             updated_customer.customer_email,
-                             updated_customer.customer_is_active,
-                             salt,
-                             encrypted_password,
-                             updated_customer.customer_contact_number
-                             ))
+        pg_heroku.execute(cursor, queries.UPDATE_CUSTOMER, (updated_customer.customer_first_name,
+                                                            updated_customer.customer_middle_name,
+                                                            updated_customer.customer_last_name,
+                                                            updated_customer.customer_email,
+                                                            updated_customer.customer_is_active,
+                                                            salt,
+                                                            encrypted_password,
+                                                            updated_customer.customer_contact_number,
+                                                            current_email
+                                                            ))
         pg_heroku.commit()
+        updated = cursor.rowcount
         cursor.close()
+        # nothing was updated when no row matched the current key
+        if not updated:
+            return None
+        audit.record('ADMIN', f'Updated customer information of: {updated_customer.customer_email}',
+                     TransactionType.ADMIN, audit.UPDATE_RECORD)
         return {'message': 'Record updated!'}
-    except (Exception, psycopg2.DatabaseError) as e:
-        print(e)
\ No newline at end of file
+    finally:
+        pg_heroku.close_connection()
+
+
+# === PARTIAL UPDATES ===
+# only the columns sent are written, and passwords are only hashed when a new one is sent
+
+def _update_columns(table: str, key_column: str, current_key: str, changes: dict[str, Any],
+                    returning: str) -> Any:
+    """
+    Updates only the given columns of a row
+
+    :param str table: The table of the row
+    :param str key_column: The column identifying the row
+    :param str current_key: The current key of the row
+    :param dict changes: The new values by column
+    :param str returning: The column to return for the updated row
+    :return: Returns the value of the returned column, or None when no row matched the key
+    """
+    columns = [column for column in queries.UPDATABLE_COLUMNS[table] if column in changes]
+    query = queries.partial_update(table, key_column, columns, returning)
+    with DatabaseOperator(pooled=True) as pg_heroku:
+        cursor = pg_heroku.get_cursor()
+        pg_heroku.execute(cursor, query, [changes[column] for column in columns] + [current_key])
+        row = cursor.fetchone()
+        pg_heroku.commit()
+        cursor.close()
+    return row[0] if row is not None else None
+
+
+def _password_columns(prefix: str, password: str) -> dict[str, str]:
+    salt = create_salt()
+    return {
+        f'{prefix}_password_salt': salt,
+        f'{prefix}_password_hash': encrypt_password(password, salt),
+    }
+
+
+def patch_admin(current_username: str, admin_patch: AdminPatch):
+    changes = admin_patch.changes()
+    password = changes.pop('admin_password', None)
+    if password is not None:
+        # hash before borrowing a connection so it is not held while hashing
+        changes['admin_password_argon2'] = hash_password(password)
+        changes.update(_password_columns('admin', password))
+    full_name = _update_columns('hainco_admin', 'admin_username', current_username, changes, 'admin_full_name')
+    table_version_cache.invalidate('hainco_admin')
+    if full_name is None:
+        return None
+    audit.record('ADMIN', f'Updated admin information of: {full_name}',
+                 TransactionType.ADMIN, audit.UPDATE_RECORD)
+    return {'message': 'Record updated!'}
+
+
+def patch_product(current_product_code: str, product_patch: ProductPatch):
+    product_code = _update_columns('hainco_product', 'product_code', current_product_code,
+                                   product_patch.changes(), 'product_code')
+    catalog_cache.invalidate()
+    table_version_cache.invalidate('hainco_product')
+    if product_code is None:
+        return None
+    audit.record('ADMIN', f'Updated product information of: {product_code}',
+                 TransactionType.ADMIN, audit.UPDATE_RECORD)
+    return {'message': 'Record updated!'}
+
+
+def patch_staff(current_username: str, staff_patch: StaffPatch):
+    changes = staff_patch.changes()
+    password = changes.pop('staff_password', None)
+    if password is not None:
+        changes.update(_password_columns('staff', password))
+    username = _update_columns('hainco_staff', 'staff_username', current_username, changes, 'staff_username')
+    table_version_cache.invalidate('hainco_staff')
+    if username is None:
+        return None
+    audit.record('ADMIN', f'Updated staff information of: {username}',
+                 TransactionType.ADMIN, audit.UPDATE_RECORD)
+    return {'message': 'Record updated!'}
+
+
+def patch_customer(current_email: str, customer_patch: CustomerPatch):
+    changes = customer_patch.changes()
+    password = changes.pop('customer_password', None)
+    if password is not None:
+        changes.update(_password_columns('customer', password))
+    email = _update_columns('hainco_customer', 'customer_email', current_email, changes, 'customer_email')
+    if email is None:
+        return None
+    audit.record('ADMIN', f'Updated customer information of: {email}',
+                 TransactionType.ADMIN, audit.UPDATE_RECORD)
+    return {'message': 'Record updated!'}
+
+
+def update_order_status(order_number: int, order_status: OrderStatus):
+    pg_heroku = DatabaseOperator(pooled=True, cursor_factory=RealDictCursor)
+    cursor = pg_heroku.get_cursor()
+    try:
+        # the previous status is read in the same statement, for the audit log
+        pg_heroku.execute(cursor, queries.UPDATE_ORDER_STATUS, (order_status, order_number))
+        order_record = cursor.fetchone()
+        pg_heroku.commit()
+        cursor.close()
+        # nothing was updated when no row matched the order number
+        if order_record is None:
+            return None
+        order_record = dict(order_record)
+        previous_status = order_record.pop('previous_status')
+        audit.record('STAFF',
+                     f"Updated Order by: {order_record['order_customer_email']} "
+                     f"ordering: {order_record['order_product_code']} "
+                     f"from status code: {previous_status} to status code: {order_record['order_status']}",
+                     TransactionType.ADMIN, audit.UPDATE_RECORD)
+        order_feed.publish_local(ORDER_STATUS_CHANGED, order_record)
+        return order_record
+    finally:
+        pg_heroku.close_connection()
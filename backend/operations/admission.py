@@ -0,0 +1,294 @@
+import asyncio
+import collections
+import enum
+import os
+import time
+
+from starlette.responses import JSONResponse
+
+from backend.database.database_operation import ASYNC_POOL_MAX_SIZE, POOL_MAX_SIZE
+from backend.operations import metrics
+
+# === ADMISSION SETTINGS ===
+# every worker serves at once as many requests of a pool as the pool has connections, so an
+# admitted request never waits on the pool: the writes, and the reads made through psycopg2, are
+# counted against the psycopg2 pool, the other reads against the asyncpg pool. The others wait in
+# a bounded queue per pool, order placement first, and are answered 503 with Retry-After when the
+# queue is full or they waited ADMISSION_QUEUE_TIMEOUT seconds, instead of piling up in the thread
+# pool. ADMISSION_CONTROL=false turns it off
+
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() not in ('0', 'false', 'no')
+ADMISSION_WRITE_CONCURRENCY = int(os.getenv('ADMISSION_WRITE_CONCURRENCY', POOL_MAX_SIZE))
+ADMISSION_READ_CONCURRENCY = int(os.getenv('ADMISSION_READ_CONCURRENCY', ASYNC_POOL_MAX_SIZE))
+# write slots only order placement may take, so it is served even while every other write is busy
+ADMISSION_CRITICAL_RESERVED = int(os.getenv('ADMISSION_CRITICAL_RESERVED', ADMISSION_WRITE_CONCURRENCY // 5))
+# most reporting requests served at once per pool, they scan the most rows
+ADMISSION_REPORTING_LIMIT = int(os.getenv('ADMISSION_REPORTING_LIMIT', max(1, ADMISSION_READ_CONCURRENCY // 2)))
+# most exports streamed at once, each one holds a connection until the last row is sent
+ADMISSION_EXPORT_LIMIT = int(os.getenv('ADMISSION_EXPORT_LIMIT', 1))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 2))
+
+
+class Priority(enum.IntEnum):
+    CRITICAL = 0
+    NORMAL = 1
+    REPORTING = 2
+
+
+class Pool(enum.Enum):
+    WRITE = 'write'
+    READ = 'read'
+
+
+# (method, route template) of the requests admitted before the others
+CRITICAL_ROUTES = {
+    ('POST', '/order/new_order'),
+    ('POST', '/order/checkout'),
+    ('PUT', '/order/update_status/{order_number}'),
+}
+REPORTING_ROUTES = {
+    ('GET', '/transaction'),
+    ('GET', '/transaction/export'),
+    ('GET', '/report/sales'),
+    ('GET', '/meta/row_count'),
+}
+# routes that hold no connection, or hold a request open for as long as a client listens
+EXEMPT_ROUTES = {
+    '/',
+    '/metrics',
+    '/order/feed',
+    '/docs',
+    '/docs/oauth2-redirect',
+    '/redoc',
+    '/openapi.json',
+    metrics.UNMATCHED_ROUTE,
+}
+# requests that rarely hold a connection: the menu is served from the catalog cache, and a login
+# reads one row and then waits for its turn to hash under the hashing slots of the worker
+UNCOUNTED_ROUTES = {
+    ('GET', '/product'),
+    ('GET', '/product/{product_code}'),
+    ('POST', '/token'),
+}
+# reads served through the psycopg2 pool
+WRITE_POOL_READS = {
+    ('GET', '/meta/row_count'),
+}
+# most requests of a route served at once, on top of the limit of its priority
+ROUTE_LIMITS = {
+    ('GET', '/transaction/export'): ADMISSION_EXPORT_LIMIT,
+}
+
+
+def priority_of(method: str, route: str) -> Priority | None:
+    """
+    :return: Returns the priority of a request, or None when it is admitted without counting
+    """
+    if method == 'OPTIONS' or route in EXEMPT_ROUTES or (method, route) in UNCOUNTED_ROUTES:
+        return None
+    if (method, route) in CRITICAL_ROUTES:
+        return Priority.CRITICAL
+    if (method, route) in REPORTING_ROUTES:
+        return Priority.REPORTING
+    return Priority.NORMAL
+
+
+def pool_of(method: str, route: str) -> Pool:
+    """
+    :return: Returns the pool whose connections serve a request
+    """
+    if method in ('GET', 'HEAD') and (method, route) not in WRITE_POOL_READS:
+        return Pool.READ
+    return Pool.WRITE
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('priority', 'route', 'future')
+
+    def __init__(self, priority: Priority, route: tuple[str, str]):
+        self.priority = priority
+        self.route = route
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    def __init__(self, concurrency: int, critical_reserved: int, reporting_limit: int,
+                 queue_size: int, queue_timeout: float, route_limits: dict[tuple[str, str], int]):
+        """
+        Counts the requests a worker serves, and queues the others by priority. Not thread
+        safe, every method is called from the event loop of the worker
+        """
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.route_limits = route_limits
+        # the critical routes may use every slot, the others leave the reserved ones free
+        shared = max(1, concurrency - critical_reserved)
+        self.limits = {
+            Priority.CRITICAL: concurrency,
+            Priority.NORMAL: shared,
+            Priority.REPORTING: min(shared, reporting_limit),
+        }
+        self.in_flight = 0
+        self.in_flight_by_priority = {priority: 0 for priority in Priority}
+        self.in_flight_by_route = {route: 0 for route in route_limits}
+        self.waiting = {priority: collections.deque() for priority in Priority}
+        self.queued = 0
+
+    def _admissible(self, priority: Priority, route: tuple[str, str]) -> bool:
+        # a priority is limited by the slots taken by itself and every lower priority, so the
+        # reporting requests can never hold the slots the normal ones leave for order placement
+        taken = sum(count for other, count in self.in_flight_by_priority.items() if other >= priority)
+        if self.in_flight >= self.concurrency or taken >= self.limits[priority]:
+            return False
+        return route not in self.route_limits or self.in_flight_by_route[route] < self.route_limits[route]
+
+    def _take(self, priority: Priority, route: tuple[str, str]):
+        self.in_flight += 1
+        self.in_flight_by_priority[priority] += 1
+        if route in self.in_flight_by_route:
+            self.in_flight_by_route[route] += 1
+
+    def _evict(self, priority: Priority) -> bool:
+        """
+        Makes room in a full queue for a request of the given priority, rejecting the newest
+        request of the lowest priority waiting
+
+        :return: Returns whether a request of a lower priority was rejected
+        """
+        for lower in sorted(Priority, reverse=True):
+            if lower <= priority:
+                return False
+            while self.waiting[lower]:
+                waiter = self.waiting[lower].pop()
+                self.queued -= 1
+                if not waiter.future.done():
+                    waiter.future.set_exception(Rejected('evicted'))
+                    return True
+        return False
+
+    def _forget(self, waiter: _Waiter):
+        try:
+            self.waiting[waiter.priority].remove(waiter)
+            self.queued -= 1
+        except ValueError:
+            pass
+
+    def _grant(self):
+        """
+        Admits the waiting requests that fit, highest priority and oldest first. A request held
+        back by the limit of its route does not hold back the ones queued behind it
+        """
+        for priority in Priority:
+            queue = self.waiting[priority]
+            for waiter in list(queue):
+                if waiter.future.done():
+                    # timed out, it leaves the queue as soon as its request runs again
+                    continue
+                if self.in_flight >= self.concurrency:
+                    return
+                if not self._admissible(priority, waiter.route):
+                    continue
+                queue.remove(waiter)
+                self.queued -= 1
+                self._take(priority, waiter.route)
+                waiter.future.set_result(None)
+
+    async def acquire(self, priority: Priority, route: tuple[str, str]):
+        """
+        Waits for a slot, raising Rejected when the queue is full or the wait too long. Call
+        release once the request is served
+        """
+        ahead = any(self.waiting[other] for other in Priority if other <= priority)
+        if not ahead and self._admissible(priority, route):
+            self._take(priority, route)
+            return
+        if self.queued >= self.queue_size and not self._evict(priority):
+            raise Rejected('queue_full')
+
+        waiter = _Waiter(priority, route)
+        self.waiting[priority].append(waiter)
+        self.queued += 1
+        # a request queued behind a full route or priority may fit now
+        self._grant()
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            raise Rejected('timeout')
+        except asyncio.CancelledError:
+            # the slot may have been granted just as the request was cancelled
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(priority, route)
+            else:
+                self._forget(waiter)
+            raise
+
+    def release(self, priority: Priority, route: tuple[str, str]):
+        self.in_flight -= 1
+        self.in_flight_by_priority[priority] -= 1
+        if route in self.in_flight_by_route:
+            self.in_flight_by_route[route] -= 1
+        self._grant()
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, write_concurrency: int = ADMISSION_WRITE_CONCURRENCY,
+                 read_concurrency: int = ADMISSION_READ_CONCURRENCY,
+                 critical_reserved: int = ADMISSION_CRITICAL_RESERVED,
+                 reporting_limit: int = ADMISSION_REPORTING_LIMIT, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, retry_after: int = ADMISSION_RETRY_AFTER,
+                 route_limits: dict[tuple[str, str], int] | None = None):
+        """
+        ASGI middleware admitting every request through the AdmissionController of the pool
+        serving it, and answering 503 with Retry-After to the requests it rejects
+        """
+        self.app = app
+        self.retry_after = retry_after
+        route_limits = ROUTE_LIMITS if route_limits is None else route_limits
+        self.controllers = {
+            Pool.WRITE: AdmissionController(write_concurrency, critical_reserved, reporting_limit, queue_size,
+                                            queue_timeout, route_limits),
+            # order placement only writes, no read slot is kept for it
+            Pool.READ: AdmissionController(read_concurrency, 0, reporting_limit, queue_size,
+                                           queue_timeout, route_limits),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        route = metrics.route_template(scope)
+        priority = priority_of(method, route)
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controllers[pool_of(method, route)]
+        started = time.perf_counter()
+        try:
+            await controller.acquire(priority, (method, route))
+        except Rejected as e:
+            metrics.ADMISSION_REJECTED.labels(priority.name.lower(), e.reason).inc()
+            response = JSONResponse(
+                {'detail': 'Server is busy, try again later'},
+                status_code=503,
+                headers={'Retry-After': str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        metrics.ADMISSION_WAIT.labels(priority.name.lower()).observe(time.perf_counter() - started)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(priority, (method, route))
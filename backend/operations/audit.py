@@ -0,0 +1,184 @@
+import datetime as dt
+import os
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+import psycopg2
+
+from backend.database import queries
+from backend.database.database_operation import AUDIT_MODE, DatabaseOperator
+from backend.enums.transaction_type import TransactionType
+
+# === AUDIT SETTINGS ===
+# with AUDIT_MODE=batched the API connections tell the log_* triggers to skip their insert into
+# hainco_transaction (see scripts/create_triggers.sql) and the API writes the same entries
+# itself, a batch at a time, from a background thread of every worker
+
+AUDIT_BATCHED = AUDIT_MODE == 'batched'
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1))
+# seconds a write waits for room in a full queue before saving its entry by itself
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', 2))
+AUDIT_SHUTDOWN_TIMEOUT = float(os.getenv('AUDIT_SHUTDOWN_TIMEOUT', 10))
+
+ADD_RECORD = 'ADD RECORD'
+UPDATE_RECORD = 'UPDATE RECORD'
+
+
+class AuditEvent(NamedTuple):
+    agent: str
+    description: str
+    transaction_type: int
+    state: str
+    date: dt.datetime
+    amount: float | None = None
+    # orders are priced from the product when written, like log_add_order does
+    product_code: str | None = None
+
+
+_STOP = object()
+
+
+class AuditWriter:
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float):
+        """
+        The constructor creates the batched writer of the audit log. Entries are queued by the
+        request threads and written by a background thread with one INSERT per batch.
+        The queue is bounded, a full queue first slows the writes down and then makes them
+        save their own entry, so nothing is dropped
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = AUDIT_SHUTDOWN_TIMEOUT):
+        """
+        Writes the queued entries and stops the background thread
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f'Audit writer did not finish within {timeout}s, {self._queue.qsize()} entries left')
+
+    def reset_after_fork(self):
+        """
+        Drops the queue and the thread inherited by a forked worker: the entries queued by the
+        parent are written by the parent, and the thread does not exist in the child
+        """
+        self._queue = queue.Queue(self._queue.maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, event: AuditEvent):
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put(event, timeout=AUDIT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            write_events([event])
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            # anything queued behind the stop marker is written too
+            if stopping:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+            if batch:
+                self._flush(batch, retry=not stopping)
+
+    def _flush(self, batch: list[AuditEvent], retry: bool):
+        delay = 0.5
+        while True:
+            try:
+                write_events(batch)
+                return
+            except psycopg2.Error as e:
+                print(f'Failed to write {len(batch)} audit entries: {e}')
+                if not retry:
+                    return
+                # the queue fills up meanwhile and slows the writes down
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+def write_events(events: list[AuditEvent]):
+    """
+    Inserts audit entries into hainco_transaction with a single statement
+
+    :param list events: The entries to write
+    """
+    columns = ([event.agent for event in events],
+               [event.description for event in events],
+               [event.amount for event in events],
+               [int(event.transaction_type) for event in events],
+               [event.date for event in events],
+               [event.state for event in events],
+               [event.product_code for event in events])
+    with DatabaseOperator(pooled=True) as pg_heroku:
+        cursor = pg_heroku.get_cursor()
+        pg_heroku.execute(cursor, queries.ADD_AUDIT_ENTRIES, columns)
+        pg_heroku.commit()
+        cursor.close()
+
+
+audit_writer = AuditWriter(AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=audit_writer.reset_after_fork)
+
+
+def record(agent: str, description: str, transaction_type: TransactionType, state: str,
+           amount: float | None = None, product_code: str | None = None):
+    """
+    Queues an audit entry when AUDIT_MODE is batched, the triggers write it otherwise.
+    Call it once the audited write is committed
+
+    :param str agent: Who made the change, as in transaction_agent
+    :param str description: What changed
+    :param TransactionType transaction_type: The type of the entry
+    :param str state: Either ADD_RECORD or UPDATE_RECORD
+    :param float amount: The amount of the entry
+    :param str product_code: The ordered product, to price the entry with
+    """
+    if not AUDIT_BATCHED:
+        return
+    audit_writer.enqueue(AuditEvent(agent, description, transaction_type, state,
+                                    dt.datetime.now(), amount, product_code))
@@ -0,0 +1,222 @@
+import functools
+import os
+import re
+import time
+from typing import Any
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from psycopg2 import extensions as pg_extensions
+from starlette.responses import Response
+from starlette.routing import Match
+
+from backend.database import queries
+
+# === METRICS ===
+# under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (set up by
+# gunicorn.conf.py) and /metrics adds up the files of all workers
+
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUESTS = Counter(
+    'hainco_http_requests_total',
+    'HTTP requests served, by route and status code',
+    ['method', 'route', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'hainco_http_request_duration_seconds',
+    'Time to serve an HTTP request, until the last byte of the body is sent',
+    ['method', 'route']
+)
+HTTP_IN_PROGRESS = Gauge(
+    'hainco_http_requests_in_progress',
+    'HTTP requests being served right now',
+    ['method', 'route'],
+    multiprocess_mode='livesum'
+)
+ADMISSION_WAIT = Histogram(
+    'hainco_admission_wait_seconds',
+    'Time a request waited for admission, by priority',
+    ['priority'],
+    buckets=DB_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    'hainco_admission_rejected_total',
+    'Requests answered 503 by the admission control, by priority and reason',
+    ['priority', 'reason']
+)
+DB_QUERY_LATENCY = Histogram(
+    'hainco_db_query_duration_seconds',
+    'Time spent running a statement, by driver and statement',
+    ['driver', 'statement'],
+    buckets=DB_BUCKETS
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'hainco_db_connections_opened_total',
+    'Database connections opened',
+    ['driver']
+)
+DB_CURSORS = Counter(
+    'hainco_db_cursors_total',
+    'Database cursors created',
+    ['driver']
+)
+
+UNMATCHED_ROUTE = '<unmatched>'
+ROUTE_TEMPLATE_KEY = 'hainco.route_template'
+
+_PREPARED_PATTERN = re.compile(r'^\s*(PREPARE|EXECUTE)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+("?[A-Za-z_][A-Za-z0-9_.]*"?)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """
+    Names a statement by its name in backend/database/queries.py, e.g. order_list, or else by
+    its command and first table, e.g. SELECT hainco_order, so the label stays readable and
+    its values stay few. Preparing a registered statement is labelled PREPARE order_list
+
+    :param str sql: The statement text
+    :return: Returns the label of the statement
+    """
+    name = queries.name_of(sql)
+    if name is not None:
+        return name
+    prepared = _PREPARED_PATTERN.match(sql)
+    if prepared is not None:
+        command, name = prepared.groups()
+        return name if command.upper() == 'EXECUTE' else f'PREPARE {name}'
+    words = sql.split(maxsplit=1)
+    if not words:
+        return 'EMPTY'
+    table = _TABLE_PATTERN.search(sql)
+    if table is None:
+        return words[0].upper()
+    return f'{words[0].upper()} {table.group(1).strip(chr(34))}'
+
+
+def observe_query(driver: str, sql: str, seconds: float):
+    DB_QUERY_LATENCY.labels(driver, statement_label(sql)).observe(seconds)
+
+
+class CountedConnection(pg_extensions.connection):
+    """psycopg2 connection that counts itself when opened"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        DB_CONNECTIONS_OPENED.labels('psycopg2').inc()
+
+
+@functools.lru_cache(maxsize=None)
+def timed_cursor_factory(base: type | None = None) -> type:
+    """
+    Builds a cursor class that times every statement it runs
+
+    :param base: The cursor class to extend, the plain psycopg2 cursor when None
+    :return: Returns the timed subclass of base
+    """
+    base = base or pg_extensions.cursor
+
+    class TimedCursor(base):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                observe_query('psycopg2', _query_text(query, self), time.perf_counter() - started)
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                observe_query('psycopg2', _query_text(query, self), time.perf_counter() - started)
+
+    TimedCursor.__name__ = f'Timed{base.__name__}'
+    return TimedCursor
+
+
+def _query_text(query: Any, cursor) -> str:
+    if isinstance(query, bytes):
+        return query.decode(errors='replace')
+    if isinstance(query, str):
+        return query
+    # psycopg2.sql compositions
+    return query.as_string(cursor)
+
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware recording the latency, status code and concurrency of every request,
+        labelled by the route template (e.g. /order/{order_number}) instead of the raw path
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        route = route_template(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
+
+
+def route_template(scope) -> str:
+    """
+    Finds the template of the route a request goes to, e.g. /order/{order_number}. The template
+    is kept in the scope, so the middlewares after the first one do not match the routes again
+
+    :param scope: The ASGI scope of the request
+    :return: Returns the template, or UNMATCHED_ROUTE when no route matches
+    """
+    template = scope.get(ROUTE_TEMPLATE_KEY)
+    if template is not None:
+        return template
+    template = UNMATCHED_ROUTE
+    app = scope.get('app')
+    if app is not None:
+        for route in app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                template = getattr(route, 'path', UNMATCHED_ROUTE)
+                break
+    scope[ROUTE_TEMPLATE_KEY] = template
+    return template
+
+
+def latest() -> Response:
+    """
+    Renders the metrics in the Prometheus text format, adding up every worker in multiprocess mode
+
+    :return: Returns the response of the /metrics endpoint
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
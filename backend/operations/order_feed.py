@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Iterable, NamedTuple
+
+from fastapi.encoders import jsonable_encoder
+
+# === ORDER FEED SETTINGS ===
+
+ORDER_FEED_BUFFER_SIZE = int(os.getenv('ORDER_FEED_BUFFER_SIZE', 1000))
+ORDER_FEED_QUEUE_SIZE = int(os.getenv('ORDER_FEED_QUEUE_SIZE', 256))
+ORDER_FEED_HEARTBEAT = float(os.getenv('ORDER_FEED_HEARTBEAT', 15))
+# milliseconds browsers wait before reconnecting a dropped EventSource
+ORDER_FEED_RETRY = int(os.getenv('ORDER_FEED_RETRY', 3000))
+
+ORDER_CREATED = 'order_created'
+ORDER_STATUS_CHANGED = 'order_status_changed'
+# tells a station its history is gone and it has to fetch GET /order again
+RESET = 'reset'
+
+
+class OrderEvent(NamedTuple):
+    id: int
+    type: str
+    order: dict[str, Any]
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: asyncio.Queue[OrderEvent] = asyncio.Queue(ORDER_FEED_QUEUE_SIZE)
+        self.lagging = False
+
+
+class OrderFeed:
+    def __init__(self, buffer_size: int):
+        """
+        The constructor creates the in-process broker of order events. The latest events are
+        kept in a ring buffer so a station that reconnects with the id of the last event it
+        received gets what it missed. Events can be published from the worker threads
+        running the sync database writes
+        """
+        self._buffer: deque[OrderEvent] = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._subscribers: set[_Subscriber] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # ids are microseconds since the epoch, events older than the horizon are not buffered
+        self._last_id = time.time_ns() // 1000
+        self._horizon = self._last_id
+        # set while the database notifications deliver every order event to this worker
+        self.fed_by_database = False
+
+    def publish(self, event_type: str, order: dict[str, Any], event_id: int | None = None) -> OrderEvent:
+        """
+        Records an order event and sends it to every connected station
+
+        :param str event_type: Either ORDER_CREATED or ORDER_STATUS_CHANGED
+        :param dict order: The order row as returned by GET /order/{order_number}
+        :param int event_id: The time based id given by the database, the current time when None
+        :return: Returns the published event
+        """
+        with self._lock:
+            # ids only go up, so a station resuming from an id never skips a later event
+            event_id = max(event_id or time.time_ns() // 1000, self._last_id + 1)
+            self._last_id = event_id
+            event = OrderEvent(event_id, event_type, jsonable_encoder(order))
+            if len(self._buffer) == self._buffer.maxlen:
+                self._horizon = self._buffer[0].id
+            self._buffer.append(event)
+            loop = self._loop
+
+        if loop is None or loop.is_closed():
+            return event
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event)
+        return event
+
+    def publish_local(self, event_type: str, order: dict[str, Any]) -> OrderEvent | None:
+        """
+        Publishes an event for a write made by this worker, unless the database notifications
+        already deliver it (see backend/database/notifications.py)
+
+        :param str event_type: Either ORDER_CREATED or ORDER_STATUS_CHANGED
+        :param dict order: The order row as returned by GET /order/{order_number}
+        :return: Returns the published event, or None when it is left to the notifications
+        """
+        if self.fed_by_database:
+            return None
+        return self.publish(event_type, order)
+
+    def _deliver(self, event: OrderEvent):
+        for subscriber in self._subscribers:
+            if subscriber.lagging:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # a station that stopped reading is cut off instead of holding events in memory
+                subscriber.lagging = True
+
+    def history(self, last_event_id: int) -> list[OrderEvent] | None:
+        """
+        Returns the buffered events newer than last_event_id
+
+        :param int last_event_id: The id of the last event the station received
+        :return: Returns the missed events, or None when some of them are no longer buffered
+        """
+        with self._lock:
+            if last_event_id < self._horizon:
+                return None
+            return [event for event in self._buffer if event.id > last_event_id]
+
+    async def subscribe(self, last_event_id: int | None = None) -> AsyncIterator[OrderEvent | None]:
+        """
+        Follows the feed, starting after last_event_id when given. None is yielded when no
+        event arrived for ORDER_FEED_HEARTBEAT seconds so the caller can keep the
+        connection alive
+
+        :param int last_event_id: The id of the last event the station received
+        :return: Yields the events as they are published
+        """
+        self._loop = asyncio.get_running_loop()
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+        try:
+            sent_through = last_event_id
+            if last_event_id is not None:
+                missed = self.history(last_event_id)
+                if missed is None:
+                    yield OrderEvent(self._last_id, RESET, {})
+                    return
+                for event in missed:
+                    sent_through = event.id
+                    yield event
+
+            while True:
+                if subscriber.lagging:
+                    yield OrderEvent(sent_through or self._last_id, RESET, {})
+                    return
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), ORDER_FEED_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # events published while the history was replayed are already sent
+                if sent_through is not None and event.id <= sent_through:
+                    continue
+                sent_through = event.id
+                yield event
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+def matches(event: OrderEvent, statuses: Iterable[int] | None, staff: str | None) -> bool:
+    """
+    Checks an event against the filters of a station
+
+    :param OrderEvent event: The event to check
+    :param statuses: The order statuses the station follows, every status when None
+    :param str staff: The staff username the station follows, every staff when None
+    :return: Returns True when the event should be sent
+    """
+    if event.type == RESET:
+        return True
+    if statuses is not None and event.order.get('order_status') not in statuses:
+        return False
+    if staff is not None and event.order.get('order_staff_username') != staff:
+        return False
+    return True
+
+
+async def server_sent_events(last_event_id: int | None, statuses: Iterable[int] | None,
+                             staff: str | None) -> AsyncIterator[bytes]:
+    """
+    Encodes the filtered feed as a text/event-stream body
+
+    :param int last_event_id: The id of the last event the station received
+    :param statuses: The order statuses to send, every status when None
+    :param str staff: The staff username to send orders of, every staff when None
+    :return: Yields the encoded events, and comment lines as heartbeats
+    """
+    statuses = None if statuses is None else {int(status) for status in statuses}
+    yield f'retry: {ORDER_FEED_RETRY}\n\n'.encode()
+    async for event in order_feed.subscribe(last_event_id):
+        if event is None:
+            yield b': heartbeat\n\n'
+        elif matches(event, statuses, staff):
+            yield f'id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.order)}\n\n'.encode()
+
+
+order_feed = OrderFeed(ORDER_FEED_BUFFER_SIZE)
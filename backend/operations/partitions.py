@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import datetime as dt
+import gzip
+import os
+
+import asyncpg
+from psycopg2 import OperationalError, sql
+
+import backend.database.async_operation as async_db
+from backend.database import queries
+from backend.database.database_operation import DatabaseOperator
+
+# === PARTITION SETTINGS ===
+# scripts/partition_transactions.sql partitions hainco_transaction by month. Every worker creates
+# the partitions of the coming months when it starts, and the archive command of this module
+# moves the months older than the retention to gzipped CSV files, run it once a month:
+#   python -m backend.operations.partitions archive
+
+TRANSACTION_PARTITIONS_AHEAD = int(os.getenv('TRANSACTION_PARTITIONS_AHEAD', 3))
+TRANSACTION_RETENTION_MONTHS = int(os.getenv('TRANSACTION_RETENTION_MONTHS', 24))
+TRANSACTION_ARCHIVE_DIR = os.getenv('TRANSACTION_ARCHIVE_DIR', 'archive')
+# seconds the archive waits to detach a month before giving up on it, inserts queue behind the wait
+TRANSACTION_ARCHIVE_LOCK_TIMEOUT = int(os.getenv('TRANSACTION_ARCHIVE_LOCK_TIMEOUT', 5))
+
+# the columns of the archives, in order
+ARCHIVE_COLUMNS = queries.TRANSACTION_COLUMNS + ('transaction_state',)
+ARCHIVE_SUFFIX = '.csv.gz'
+
+_create_task: asyncio.Task | None = None
+
+
+# === RUNTIME ===
+
+def create_partitions_in_background():
+    """
+    Starts creating the partitions of the coming months without waiting for them, so rows
+    never land in the default partition while the workers keep being restarted
+    """
+    global _create_task
+    if _create_task is None or _create_task.done():
+        _create_task = asyncio.get_running_loop().create_task(create_partitions())
+
+
+async def create_partitions() -> list[str]:
+    """
+    Creates the partitions of hainco_transaction from the current month to
+    TRANSACTION_PARTITIONS_AHEAD months later. Does nothing until the table is partitioned
+
+    :return: Returns the names of the partitions created
+    """
+    try:
+        created = await async_db.fetch_all(queries.CREATE_TRANSACTION_PARTITIONS.sql,
+                                           TRANSACTION_PARTITIONS_AHEAD)
+    except asyncpg.UndefinedFunctionError:
+        # scripts/partition_transactions.sql was not applied
+        return []
+    except (OperationalError, asyncpg.PostgresError) as e:
+        print(f'Could not create the transaction partitions: {e}')
+        return []
+    partitions = [row['created'] for row in created]
+    if partitions:
+        print(f'Created the transaction partitions {", ".join(partitions)}')
+    return partitions
+
+
+# === MAINTENANCE ===
+
+def archive_path(archive_dir: str, partition: str) -> str:
+    return os.path.join(archive_dir, partition + ARCHIVE_SUFFIX)
+
+
+def retention_cutoff(retention_months: int, today: dt.date | None = None) -> dt.date:
+    """
+    :return: Returns the first day of the oldest month kept, the current month counting as one
+    """
+    today = today or dt.date.today()
+    months = today.year * 12 + today.month - 1 - (retention_months - 1)
+    return dt.date(months // 12, months % 12 + 1, 1)
+
+
+def create_partitions_now(months_ahead: int) -> list[str]:
+    """
+    Creates the partitions of the coming months, like the workers do when they start
+
+    :param int months_ahead: The months after the current one to create a partition for
+    :return: Returns the names of the partitions created
+    """
+    with DatabaseOperator() as db:
+        cursor = db.get_cursor()
+        db.execute(cursor, queries.CREATE_TRANSACTION_PARTITIONS, (months_ahead,))
+        created = [row[0] for row in cursor.fetchall()]
+        db.commit()
+    return created
+
+
+def archive_partition(db: DatabaseOperator, partition: str, archive_dir: str) -> int:
+    """
+    Writes a partition to a gzipped CSV file and drops it. The partition is locked against
+    writes while it is written out, and only dropped once the file holds all of its rows
+
+    :param DatabaseOperator db: The connection to use, outside of a transaction
+    :param str partition: The name of the partition
+    :param str archive_dir: The directory of the archives
+    :return: Returns the rows archived
+    """
+    path = archive_path(archive_dir, partition)
+    partial = path + '.partial'
+    cursor = db.get_cursor()
+    try:
+        cursor.execute(sql.SQL('LOCK TABLE {} IN SHARE MODE').format(sql.Identifier(partition)))
+        # COPY cannot be prepared, so it is not in the query registry
+        copy = sql.SQL("""COPY (SELECT {} FROM {} ORDER BY transaction_date, transaction_id)
+                          TO STDOUT WITH (FORMAT csv, HEADER)""").format(
+            sql.SQL(', ').join(map(sql.Identifier, ARCHIVE_COLUMNS)),
+            sql.Identifier(partition)
+        )
+        with open(partial, 'wb') as file:
+            with gzip.GzipFile(fileobj=file, mode='wb') as archive:
+                cursor.copy_expert(copy, archive)
+            file.flush()
+            os.fsync(file.fileno())
+        written = cursor.rowcount
+
+        cursor.execute('SET LOCAL lock_timeout = %s', (f'{TRANSACTION_ARCHIVE_LOCK_TIMEOUT}s',))
+        db.execute(cursor, queries.DROP_TRANSACTION_PARTITION, (partition,))
+        dropped = cursor.fetchone()[0]
+        if dropped != written:
+            raise RuntimeError(f'{partition} holds {dropped} rows but {written} were archived')
+        os.replace(partial, path)
+        db.commit()
+        return written
+    except BaseException:
+        db.conn.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def archive_partitions(retention_months: int, archive_dir: str, today: dt.date | None = None) -> list[tuple[str, int]]:
+    """
+    Archives the partitions of the months older than the retention, oldest first. The sales
+    rollups of the archived months are kept, so the sales report still covers them
+
+    :param int retention_months: The months kept in the database, the current one included
+    :param str archive_dir: The directory of the archives, created when missing
+    :param date today: The day the retention is counted from, today by default
+    :return: Returns the archived partitions and their rows
+    """
+    cutoff = retention_cutoff(retention_months, today)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    with DatabaseOperator() as db:
+        cursor = db.get_cursor()
+        db.execute(cursor, queries.TRANSACTION_PARTITIONS)
+        expired = [partition for partition, month in cursor.fetchall() if month < cutoff]
+        db.commit()
+        for partition in expired:
+            archived.append((partition, archive_partition(db, partition, archive_dir)))
+    return archived
+
+
+def restore_archive(path: str) -> int:
+    """
+    Loads an archive back into the partition of its month, creating the partition when needed
+
+    :param str path: The archive, named like the partition it was made from
+    :return: Returns the rows restored
+    """
+    partition = os.path.basename(path).removesuffix(ARCHIVE_SUFFIX)
+    try:
+        month = dt.datetime.strptime(partition.removeprefix('hainco_transaction_'), '%Y_%m').date()
+    except ValueError:
+        raise ValueError(f'{path} is not named like a transaction partition archive')
+
+    with DatabaseOperator() as db:
+        cursor = db.get_cursor()
+        try:
+            db.execute(cursor, queries.CREATE_TRANSACTION_PARTITION, (month,))
+            copy = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER)').format(
+                sql.Identifier(partition),
+                sql.SQL(', ').join(map(sql.Identifier, ARCHIVE_COLUMNS))
+            )
+            with gzip.open(path, 'rb') as archive:
+                cursor.copy_expert(copy, archive)
+            restored = cursor.rowcount
+            # the rows are copied into the partition, past the triggers of hainco_transaction, so
+            # the sales rollups are not added to twice and only the row counter is updated
+            db.execute(cursor, queries.ADJUST_TRANSACTION_ROW_COUNT, (restored,))
+            db.commit()
+        except BaseException:
+            db.conn.rollback()
+            raise
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintenance of the monthly partitions of hainco_transaction')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help='create the partitions of the coming months')
+    create.add_argument('--months-ahead', type=int, default=TRANSACTION_PARTITIONS_AHEAD)
+
+    archive = commands.add_parser('archive', help='archive and drop the months older than the retention')
+    archive.add_argument('--retention-months', type=int, default=TRANSACTION_RETENTION_MONTHS)
+    archive.add_argument('--archive-dir', default=TRANSACTION_ARCHIVE_DIR)
+
+    restore = commands.add_parser('restore', help='load archives back into their partitions')
+    restore.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        created = create_partitions_now(args.months_ahead)
+        print(f'Created {", ".join(created)}' if created else 'Every partition already exists')
+    elif args.command == 'archive':
+        if args.retention_months < 1:
+            parser.error('--retention-months must keep at least the current month')
+        archived = archive_partitions(args.retention_months, args.archive_dir)
+        for partition, rows in archived:
+            print(f'Archived {rows} rows of {partition} to {archive_path(args.archive_dir, partition)}')
+        if not archived:
+            print('No partition is older than the retention')
+    else:
+        for path in args.paths:
+            print(f'Restored {restore_archive(path)} rows from {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import os
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+
+# === HASHING SETTINGS ===
+# the defaults follow the OWASP recommendation for argon2id (19 MiB, 2 passes), which keeps
+# a whole shift logging in at once from exhausting the memory of a dyno
+
+password_hasher = PasswordHasher(
+    time_cost=int(os.getenv('ARGON2_TIME_COST', 2)),
+    memory_cost=int(os.getenv('ARGON2_MEMORY_COST', 19456)),
+    parallelism=int(os.getenv('ARGON2_PARALLELISM', 1)),
+)
+
+
+def hash_password(password: str) -> str:
+    """Hashes a password one way with argon2id
+
+    :param str password: The plain text password
+    :return: The encoded argon2 hash, which includes its own salt and parameters
+    """
+    return password_hasher.hash(password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """Checks a password against an argon2 hash
+
+    :param str password_hash: The encoded hash stored in the database
+    :param str password: The plain text password to check
+    :return: True when the password matches the hash
+    """
+    try:
+        return password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHash):
+        return False
+
+
+_dummy_hash: str | None = None
+
+
+def verify_dummy_password(password: str) -> bool:
+    """Spends the time of a failed check when no account can be checked, so the response time
+    of a login does not tell which usernames exist. The hash is made on first use, to keep it
+    out of the import of the server
+
+    :param str password: The plain text password sent
+    :return: Always False
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password('hainco-dummy-password')
+    verify_password(_dummy_hash, password)
+    return False
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Checks if a hash was made with different parameters than the current ones
+
+    :param str password_hash: The encoded hash stored in the database
+    :return: True when the hash should be replaced on the next successful login
+    """
+    return password_hasher.check_needs_rehash(password_hash)
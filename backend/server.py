@@ -1,26 +1,64 @@
-from typing import Any
-from fastapi import FastAPI, Depends
+from typing import Any, Optional
+from fastapi import FastAPI, Depends, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from psycopg2 import OperationalError
-from psycopg2.extras import RealDictCursor
+from psycopg2 import DatabaseError, DataError, IntegrityError, OperationalError
+from psycopg2.errors import UniqueViolation
 from starlette import status
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException
 from backend.data_models import (
     Product,
+    ProductPatch,
     Staff,
+    StaffPatch,
     Customer,
+    CustomerPatch,
     Admin,
+    AdminPatch,
     Transaction,
-    Order
+    Order,
+    OrderStatusUpdate,
+    Checkout
 )
-from backend.database.database_operation import DatabaseOperator
+from backend.enums.order_status import OrderStatus
+from backend.enums.product_type import ProductType
+from backend.enums.record_interval import RecordInterval
+from backend.enums.transaction_type import TransactionType
+
+from backend.database.cache import catalog_cache, row_count_cache, cached_fetch_all, cached_fetch_one
+from backend.database.conditional import is_not_modified, not_modified, set_validators, table_version
+from backend.database.pagination import (
+    Keyset,
+    MAX_PAGE_SIZE,
+    STREAM_PREFETCH,
+    accepts_gzip,
+    csv_lines,
+    gzip_chunks,
+    paginate
+)
+from backend.database.serialization import rows_response
 
+import asyncio
+import datetime as dt
+import decimal
+import os
 import jwt
+import backend.database.async_operation as async_db
 import backend.database.database_operation as DB_STATIC
+import backend.database.notifications as notifications
+import backend.database.queries as queries
 import backend.database.create as db_create
 import backend.database.update as db_update
 import backend.database.security as sec
+import backend.operations.admission as admission
+import backend.operations.audit as audit
+import backend.operations.metrics as metrics
+import backend.operations.order_feed as order_feed
+import backend.operations.partitions as partitions
+import backend.operations.verification as verification
 
 app = FastAPI(
     title='Hain.co Web API',
@@ -39,6 +77,10 @@ origins = [
 
 # === ADD MIDDLEWARE TO APPLICATION ===
 
+# admission control runs inside CORS, so its 503 answers reach browsers, and inside the metrics,
+# so they are counted
+if admission.ADMISSION_CONTROL:
+    app.add_middleware(admission.AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -46,35 +88,184 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.PrometheusMiddleware)
+
+# === APPLICATION EVENTS ===
+# nothing connects to the database at import time, every worker opens its own pools once it
+# has started, and gives them back on shutdown
+
+@app.on_event('startup')
+async def open_database_pools():
+    """
+    Opens the database pools of the worker in the background, so a slow or unreachable
+    database does not hold up the start of the worker
+    """
+    async_db.open_pools_in_background()
+
+
+@app.on_event('startup')
+async def prepare_transaction_partitions():
+    """
+    Creates the partitions of hainco_transaction for the coming months in the background,
+    once scripts/partition_transactions.sql has partitioned it
+    """
+    partitions.create_partitions_in_background()
+
+
+@app.on_event('startup')
+async def listen_for_database_changes():
+    """
+    Starts following the changes notified by the database, which keep the caches and
+    the order feed of the worker up to date with the writes of the other workers
+    """
+    await notifications.start_listener()
+
+
+@app.on_event('startup')
+async def start_audit_writer():
+    """
+    Starts the background writer of the audit log when AUDIT_MODE is batched
+    """
+    if audit.AUDIT_BATCHED:
+        audit.audit_writer.start()
+
+
+@app.on_event('shutdown')
+async def close_database_pools():
+    """
+    Writes the queued audit entries and closes the database pools of the worker
+    when the server shuts down
+    """
+    await notifications.stop_listener()
+    await run_in_threadpool(audit.audit_writer.stop)
+    await async_db.close_async_pool()
+    DB_STATIC.close_pool()
+
+
+# === PAGINATION KEYSETS ===
+
+PRODUCT_KEYSET = Keyset(('product_id', int))
+# best match first, the rank is rounded so it reads back exactly from the cursor
+PRODUCT_SEARCH_KEYSET = Keyset(
+    ('rank', lambda value: decimal.Decimal(str(value))),
+    ('product_id', int),
+    descending=True
+)
+STAFF_KEYSET = Keyset(('staff_id', int))
+CUSTOMER_KEYSET = Keyset(('customer_id', int))
+ORDER_KEYSET = Keyset(('order_id', int))
+CUSTOMER_ORDER_KEYSET = Keyset(
+    ('order_date', dt.datetime.fromisoformat),
+    ('order_id', int),
+    descending=True
+)
+TRANSACTION_KEYSET = Keyset(
+    ('transaction_date', dt.datetime.fromisoformat),
+    ('transaction_id', int),
+    descending=True
+)
+# the CSV export lists the transactions oldest first
+TRANSACTION_EXPORT_KEYSET = Keyset(
+    ('transaction_date', dt.datetime.fromisoformat),
+    ('transaction_id', int)
+)
+
+# === BULK UTILS ===
+
+def check_bulk_size(records: list):
+    if len(records) > db_create.BULK_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f'Send at most {db_create.BULK_MAX_SIZE} records per request'
+        )
+
+
+def count_created(results: list[dict]) -> int:
+    return sum(1 for result in results if result['status'] == 'created')
+
 
 # === AUTHENTICATION VARIABLES ===
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 JWT_SECRET = 'hainco_tokenizer'
+JWT_EXPIRE_MINUTES = int(os.getenv('JWT_EXPIRE_MINUTES', 60))
+# password hashing runs on worker threads, this bounds how many run at once
+hashing_slots = asyncio.Semaphore(int(os.getenv('HASHING_CONCURRENCY', os.cpu_count() or 1)))
 
 
 # === AUTHENTICATION UTILS ===
 
-def authenticate_admin(username: str, password: str):
-    admin = get_admin_by_username(username)
-    verified = admin.get('admin_password') == password
-    if not admin:
-        return False
+async def verify_off_loop(function, *args):
+    async with hashing_slots:
+        return await run_in_threadpool(function, *args)
+
+
+def verify_legacy_password(admin: dict, password: str) -> bool:
+    decrypted_password = sec.decrypt_password(
+        admin.get('admin_password_hash'),
+        admin.get('admin_password_salt')
+    )
+    return decrypted_password == password
+
+
+async def authenticate_admin(username: str, password: str):
+    """
+    Checks the credentials of an admin with a single lookup by username. Admins still
+    without an argon2 hash are checked against their Fernet password once, and their
+    argon2 hash is stored so later logins skip the decryption
+
+    :param str username: The username of the admin
+    :param str password: The password sent by the admin
+    :return: Returns the admin record, or False when the credentials are invalid
+    """
+    admin = await async_db.fetch_one(queries.ADMIN_CREDENTIALS.sql, username)
+    if not admin or not admin.get('admin_is_active'):
+        # as slow as a wrong password, so unknown and inactive usernames cannot be told apart
+        return await verify_off_loop(verification.verify_dummy_password, password)
+
+    password_hash = admin.get('admin_password_argon2')
+    if password_hash:
+        verified = await verify_off_loop(verification.verify_password, password_hash, password)
+        upgrade = verified and verification.needs_rehash(password_hash)
+    else:
+        verified = await verify_off_loop(verify_legacy_password, admin, password)
+        upgrade = verified
     if not verified:
         return False
+
+    if upgrade:
+        password_hash = await verify_off_loop(verification.hash_password, password)
+        full_name = await async_db.fetch_value(queries.REHASH_ADMIN_PASSWORD.sql, password_hash, admin['admin_id'])
+        # the session skips the trigger entry when AUDIT_MODE is batched, like every other update
+        if full_name is not None:
+            audit.record('ADMIN', f'Updated admin information of: {full_name}',
+                         TransactionType.ADMIN, audit.UPDATE_RECORD)
     return admin
 
 
 @app.post('/token')
-def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        user = authenticate_admin(form_data.username, form_data.password)
-        token = jwt.encode(user, JWT_SECRET)
+        user = await authenticate_admin(form_data.username, form_data.password)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Invalid credentials'
+            )
+        issued_at = dt.datetime.now(tz=dt.timezone.utc)
+        # keep the claims minimal, the token only identifies the admin
+        token = jwt.encode({
+            'sub': user['admin_username'],
+            'admin_id': user['admin_id'],
+            'position': user['admin_position'],
+            'iat': issued_at,
+            'exp': issued_at + dt.timedelta(minutes=JWT_EXPIRE_MINUTES)
+        }, JWT_SECRET)
         return {'access_token': token, 'token_type': 'bearer'}
-    except TypeError:
+    except OperationalError:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Invalid credentials'
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
         )
 
 
@@ -96,33 +287,77 @@ def index():
 
 @app.get('/product',
          status_code=status.HTTP_200_OK)
-def get_all_product() -> list[Product]:
+async def get_all_product(response: Response,
+                          limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                          after: Optional[str] = None,
+                          stream: bool = False,
+                          if_none_match: Optional[str] = Header(None),
+                          if_modified_since: Optional[str] = Header(None)) -> list[Product]:
     """
-    Function to handle the endpoint to fetch all products from the database
+    Function to handle the endpoint to fetch all products from the database.
+    Pass limit to get one page at a time, sending the X-Next-Cursor header of a page back
+    as after to get the next one, or stream to receive newline delimited JSON.
+    Send the ETag back in If-None-Match to get a 304 while the products are unchanged
 
     :return: Returns the list of Product objects fetched from the database
     """
+    sql = queries.PRODUCT_LIST.sql
     try:
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute("""SELECT 
-                            product_id,
-                            product_name,
-                            product_price,
-                            product_image_link,
-                            product_stock,
-                            product_description,
-                            product_type,
-                            product_is_active,
-                            product_code
-                            FROM hainco_product""")
-        all_product = cursor.fetchall()
+        version = await table_version('hainco_product')
+        if is_not_modified(version, if_none_match, if_modified_since):
+            return not_modified(version)
+        set_validators(response, version)
+        if stream or limit is not None:
+            return await paginate(PRODUCT_KEYSET, sql, response, limit, after, stream)
+        # cached by version, so the rows are never older than the ETag sent with them
+        all_product = await cached_fetch_all(catalog_cache, ('product', version), sql)
         if not all_product:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='No products exist'
             )
-        return all_product
+        return rows_response(all_product, response)
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+@app.get('/product/search',
+         status_code=status.HTTP_200_OK)
+async def search_product(response: Response,
+                         q: Optional[str] = Query(None, max_length=200),
+                         product_type: Optional[list[ProductType]] = Query(None),
+                         is_active: Optional[bool] = None,
+                         in_stock: bool = False,
+                         min_price: Optional[float] = Query(None, ge=0),
+                         max_price: Optional[float] = Query(None, ge=0),
+                         limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                         after: Optional[str] = None):
+    """
+    Function to handle the endpoint searching the products, so clients no longer download
+    the whole catalog to filter it. Every word of q matches the words of the name or
+    description starting with it (scripts/create_product_search.sql), best matches first.
+    Filter by product_type (repeatable), is_active, in_stock and the min_price to max_price
+    range. Results come a page at a time, send the X-Next-Cursor header of a page back as
+    after to get the next one
+
+    :return: Returns the matching Product objects with their rank
+    """
+    filters = [
+        [int(value) for value in product_type] if product_type else None,
+        is_active,
+        in_stock,
+        decimal.Decimal(str(min_price)) if min_price is not None else None,
+        decimal.Decimal(str(max_price)) if max_price is not None else None,
+    ]
+    if q and q.strip():
+        sql, args = queries.PRODUCT_SEARCH.sql, [q] + filters
+    else:
+        sql, args = queries.PRODUCT_FILTER.sql, filters
+    try:
+        return await paginate(PRODUCT_SEARCH_KEYSET, sql, response, limit, after, False, tuple(args))
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -132,42 +367,28 @@ def get_all_product() -> list[Product]:
 
 @app.get('/product/{product_code}',
          status_code=status.HTTP_200_OK)
-def get_product_by_product_code(product_code: str) -> Product:
+async def get_product_by_product_code(product_code: str,
+                                      response: Response,
+                                      if_none_match: Optional[str] = Header(None),
+                                      if_modified_since: Optional[str] = Header(None)) -> Product:
     """
-    Function to handle the endpoint to fetch a single product from the database by product code
+    Function to handle the endpoint to fetch a single product from the database by product code.
+    Send the ETag back in If-None-Match to get a 304 while the products are unchanged
 
     :return: Returns the Product object fetched
     """
     try:
-        existing = False
-        # check product if existing
-        all_products = get_all_product()
-        for record in all_products:
-            # convert to a dictionary
-            db_product = dict(record)
-            if product_code == db_product['product_code']:
-                existing = True
-        if not existing:
+        version = await table_version('hainco_product')
+        if is_not_modified(version, if_none_match, if_modified_since):
+            return not_modified(version)
+        set_validators(response, version)
+        product_record = await cached_fetch_one(catalog_cache, ('product', product_code, version),
+                                                queries.PRODUCT_BY_CODE.sql, product_code)
+        if product_record is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Product does not exist.'
             )
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute(f"""SELECT 
-                            product_id,
-                            product_name,
-                            product_price,
-                            product_image_link,
-                            product_stock,
-                            product_description,
-                            product_type,
-                            product_is_active,
-                            product_code
-                            FROM hainco_product
-                            WHERE product_code = '{product_code}'
-                            """)
-        product_record = cursor.fetchone()
         return product_record
     except OperationalError:
         raise HTTPException(
@@ -178,7 +399,7 @@ def get_product_by_product_code(product_code: str) -> Product:
 
 @app.post('/product/new_product',
           status_code=status.HTTP_201_CREATED)
-def add_product(product: Product):
+async def add_product(product: Product):
     """
     Function to handle the endpoint for adding a new product
 
@@ -186,20 +407,15 @@ def add_product(product: Product):
     :return: Returns the new product object and a message
     """
     try:
-        code = product.product_code
-        # check username if taken
-        all_product = get_all_product()
-        for record in all_product:
-            # convert to a dictionary
-            db_product = dict(record)
-            if code == db_product['product_code']:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail='Username is already taken'
-                )
+        # check product code if taken
+        if await async_db.fetch_value(queries.PRODUCT_CODE_TAKEN.sql, product.product_code):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail='Product code is already taken'
+            )
 
         return {
-            "data": db_create.add_product_to_database(product),
+            "data": await run_in_threadpool(db_create.add_product_to_database, product),
             "detail": "Product added to database"
         }
     except OperationalError:
@@ -209,9 +425,38 @@ def add_product(product: Product):
         )
 
 
+@app.post('/product/bulk',
+          status_code=status.HTTP_201_CREATED)
+async def add_products(products: list[Product]):
+    """
+    Function to handle the endpoint for adding many products in a single transaction.
+    Products with a code that is already taken are skipped and reported as duplicates
+
+    :param list[Product] products: Pydantic models containing the products to be added
+    :return: Returns the result of every product in the request and a message
+    """
+    check_bulk_size(products)
+    try:
+        results = await run_in_threadpool(db_create.add_products_to_database, products)
+        return {
+            "data": results,
+            "detail": f"{count_created(results)} products added to database"
+        }
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+    except DatabaseError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+
+
 @app.put('/product/update_product/{current_product_code}',
          status_code=status.HTTP_200_OK)
-def update_product(current_product_code: str, updated_product: Product) -> dict[str, dict[str, str] | str]:
+async def update_product(current_product_code: str, updated_product: Product) -> dict[str, dict[str, str] | str]:
     """
     Function to handle the endpoint for updating an Product object.
 
@@ -220,59 +465,107 @@ def update_product(current_product_code: str, updated_product: Product) -> dict[
     :return: Returns the updated Product object along with a message
     """
     try:
-        existing = False
-        # check product if existing
-        all_products = get_all_product()
-        for record in all_products:
-            # convert to a dictionary
-            db_product = dict(record)
-            if current_product_code == db_product['product_code']:
-                existing = True
-        if not existing:
+        result = await run_in_threadpool(db_update.update_product, current_product_code, updated_product)
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Product does not exist.'
             )
 
         return {
-            "data": db_update.update_product(current_product_code, updated_product),
+            "data": result,
             "detail": "Product updated to database"
         }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Product code is already taken'
+        )
+    except (DataError, IntegrityError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
     except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+@app.patch('/product/update_product/{current_product_code}',
+           status_code=status.HTTP_200_OK)
+async def patch_product(current_product_code: str, product_patch: ProductPatch) -> dict[str, dict[str, str] | str]:
+    """
+    Function to handle the endpoint for updating some fields of a Product object, e.g. only
+    the price or the stock. Only the fields sent are written
+
+    :param str current_product_code: The current code of the Product to be updated
+    :param ProductPatch product_patch: The Pydantic model containing the fields to update
+    :return: Returns a message once the Product is updated
+    """
+    try:
+        result = await run_in_threadpool(db_update.patch_product, current_product_code, product_patch)
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Product does not exist.'
+            )
+
+        return {
+            "data": result,
+            "detail": "Product updated to database"
+        }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Product code is already taken'
+        )
+    except (DataError, IntegrityError):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail='Invalid data format received'
         )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
 
 
 # === CANTEEN STAFF ===
 
 @app.get('/staff',
          status_code=status.HTTP_200_OK)
-def get_all_canteen_staff() -> list[Staff]:
+async def get_all_canteen_staff(response: Response,
+                                limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                                after: Optional[str] = None,
+                                stream: bool = False,
+                                if_none_match: Optional[str] = Header(None),
+                                if_modified_since: Optional[str] = Header(None)) -> list[Staff]:
     """
-    Function to handle the endpoint to fetch all staffs from the database
+    Function to handle the endpoint to fetch all staffs from the database.
+    Pass limit to get one page at a time, sending the X-Next-Cursor header of a page back
+    as after to get the next one, or stream to receive newline delimited JSON.
+    Send the ETag back in If-None-Match to get a 304 while the staffs are unchanged
 
     :return: Returns the list of Staff objects fetched from the database
     """
+    sql = queries.STAFF_LIST.sql
     try:
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute("""SELECT 
-                            staff_id,
-                            staff_full_name,
-                            staff_contact_number,
-                            staff_username,
-                            staff_position,
-                            staff_is_active
-                            FROM hainco_staff""")
-        all_staff = cursor.fetchall()
+        version = await table_version('hainco_staff')
+        if is_not_modified(version, if_none_match, if_modified_since):
+            return not_modified(version)
+        set_validators(response, version)
+        if stream or limit is not None:
+            return await paginate(STAFF_KEYSET, sql, response, limit, after, stream)
+        all_staff = await async_db.fetch_records(sql)
         if not all_staff:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='No staff records exist'
             )
-        return all_staff
+        return rows_response(all_staff, response)
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -282,41 +575,19 @@ def get_all_canteen_staff() -> list[Staff]:
 
 @app.get('/staff/{username}',
          status_code=status.HTTP_200_OK)
-def get_staff_by_username(username: str) -> dict[str | Any, str | Any]:
+async def get_staff_by_username(username: str) -> dict[str | Any, str | Any]:
     """
     Function to handle the endpoint to fetch a single staff from the database by username
 
     :return: Returns the Staff object fetched
     """
     try:
-        existing = False
-        # check username if existing
-        all_staff = get_all_canteen_staff()
-        for record in all_staff:
-            # convert to a dictionary
-            db_staff = dict(record)
-            if username == db_staff['staff_username']:
-                existing = True
-        if not existing:
+        staff_record = await async_db.fetch_one(queries.STAFF_BY_USERNAME.sql, username)
+        if staff_record is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Username does not exist.'
             )
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute(f"""SELECT 
-                            staff_id,
-                            staff_full_name,
-                            staff_contact_number,
-                            staff_username,
-                            staff_password_salt,
-                            staff_password_hash,
-                            staff_position,
-                            staff_is_active
-                            FROM hainco_staff
-                            WHERE staff_username = '{username}'
-                            """)
-        staff_record = cursor.fetchone()
         # convert the result to a dictionary to modify its values
         staff_dict = dict(staff_record)
         # decrypt the password
@@ -340,7 +611,7 @@ def get_staff_by_username(username: str) -> dict[str | Any, str | Any]:
 
 @app.post('/staff/new_staff',
           status_code=status.HTTP_201_CREATED)
-def add_staff(staff: Staff):
+async def add_staff(staff: Staff):
     """
     Function to handle the endpoint for adding a new staff
 
@@ -348,20 +619,15 @@ def add_staff(staff: Staff):
     :return: Returns the new staff object and a message
     """
     try:
-        username = staff.staff_username
         # check username if taken
-        all_staff = get_all_canteen_staff()
-        for record in all_staff:
-            # convert to a dictionary
-            db_staff = dict(record)
-            if username == db_staff['staff_username']:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail='Username is already taken'
-                )
+        if await async_db.fetch_value(queries.STAFF_USERNAME_TAKEN.sql, staff.staff_username):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail='Username is already taken'
+            )
 
         return {
-            "data": db_create.add_staff_to_database(staff),
+            "data": await run_in_threadpool(db_create.add_staff_to_database, staff),
             "detail": "Staff added to database"
         }
     except OperationalError:
@@ -371,9 +637,38 @@ def add_staff(staff: Staff):
         )
 
 
+@app.post('/staff/bulk',
+          status_code=status.HTTP_201_CREATED)
+async def add_staffs(staffs: list[Staff]):
+    """
+    Function to handle the endpoint for adding many staffs in a single transaction.
+    Staffs with a username that is already taken are skipped and reported as duplicates
+
+    :param list[Staff] staffs: Pydantic models containing the staffs to be added
+    :return: Returns the result of every staff in the request and a message
+    """
+    check_bulk_size(staffs)
+    try:
+        results = await run_in_threadpool(db_create.add_staffs_to_database, staffs)
+        return {
+            "data": results,
+            "detail": f"{count_created(results)} staffs added to database"
+        }
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+    except DatabaseError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+
+
 @app.put('/staff/update_staff/{current_username}',
          status_code=status.HTTP_200_OK)
-def update_staff(current_username: str, updated_staff: Staff) -> dict[str, dict[str, str] | str]:
+async def update_staff(current_username: str, updated_staff: Staff) -> dict[str, dict[str, str] | str]:
     """
     Function to handle the endpoint for updating an Staff object.
 
@@ -382,60 +677,101 @@ def update_staff(current_username: str, updated_staff: Staff) -> dict[str, dict[
     :return: Returns the updated Staff object along with a message
     """
     try:
-        existing = False
-        # check product if existing
-        all_staff = get_all_canteen_staff()
-        for record in all_staff:
-            # convert to a dictionary
-            db_staff = dict(record)
-            if current_username == db_staff['staff_username']:
-                existing = True
-        if not existing:
+        result = await run_in_threadpool(db_update.update_staff, current_username, updated_staff)
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Staff does not exist.'
             )
 
         return {
-            "data": db_update.update_staff(current_username, updated_staff),
+            "data": result,
             "detail": "Staff updated to database"
         }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Username is already taken'
+        )
+    except (DataError, IntegrityError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
     except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+@app.patch('/staff/update_staff/{current_username}',
+           status_code=status.HTTP_200_OK)
+async def patch_staff(current_username: str, staff_patch: StaffPatch) -> dict[str, dict[str, str] | str]:
+    """
+    Function to handle the endpoint for updating some fields of a Staff object, e.g. only
+    the contact number. Only the fields sent are written, and the password is only hashed
+    when a new one is sent
+
+    :param str current_username: The current username of the Staff to be updated
+    :param StaffPatch staff_patch: The Pydantic model containing the fields to update
+    :return: Returns a message once the Staff is updated
+    """
+    try:
+        result = await run_in_threadpool(db_update.patch_staff, current_username, staff_patch)
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Staff does not exist.'
+            )
+
+        return {
+            "data": result,
+            "detail": "Staff updated to database"
+        }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Username is already taken'
+        )
+    except (DataError, IntegrityError):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail='Invalid data format received'
         )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
 
 
 # === CUSTOMER ===
 
 @app.get('/customer',
          status_code=status.HTTP_200_OK)
-def get_all_customer() -> list[Customer]:
+async def get_all_customer(response: Response,
+                           limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                           after: Optional[str] = None,
+                           stream: bool = False) -> list[Customer]:
     """
-    Function to handle the endpoint to fetch all customers from the database
+    Function to handle the endpoint to fetch all customers from the database.
+    Pass limit to get one page at a time, sending the X-Next-Cursor header of a page back
+    as after to get the next one, or stream to receive newline delimited JSON
 
     :return: Returns the list of Customer objects fetched from the database
     """
+    sql = queries.CUSTOMER_LIST.sql
     try:
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute("""SELECT 
-                            customer_id,
-                            customer_first_name,
-                            customer_middle_name,
-                            customer_last_name,
-                            customer_email,
-                            customer_contact_number,
-                            customer_is_active
-                            FROM hainco_customer""")
-        all_customer = cursor.fetchall()
+        if stream or limit is not None:
+            return await paginate(CUSTOMER_KEYSET, sql, response, limit, after, stream)
+        all_customer = await async_db.fetch_records(sql)
         if not all_customer:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='No customer records exist'
             )
-        return all_customer
+        return rows_response(all_customer, response)
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -445,42 +781,19 @@ def get_all_customer() -> list[Customer]:
 
 @app.get('/customer/{email}',
          status_code=status.HTTP_200_OK)
-def get_customer_by_email(email: str):
+async def get_customer_by_email(email: str):
     """
     Function to handle the endpoint to fetch a single customer from the database by email
 
     :return: Returns the Customer object fetched
     """
     try:
-        existing = False
-        # check username if existing
-        all_customers = get_all_customer()
-        for record in all_customers:
-            # convert to a dictionary
-            db_customer = dict(record)
-            if email == db_customer['customer_email']:
-                existing = True
-        if not existing:
+        customer_record = await async_db.fetch_one(queries.CUSTOMER_BY_EMAIL.sql, email)
+        if customer_record is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Account does not exist.'
             )
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute(f"""SELECT 
-                            customer_id,
-                            customer_first_name,
-                            customer_middle_name,
-                            customer_last_name,
-                            customer_email,
-                            customer_password_salt,
-                            customer_password_hash,
-                            customer_contact_number,
-                            customer_is_active
-                            FROM hainco_customer
-                            WHERE customer_email = '{email}'
-                            """)
-        customer_record = cursor.fetchone()
         # convert the result to a dictionary to modify its values
         customer_dict = dict(customer_record)
         # decrypt the password
@@ -502,9 +815,50 @@ def get_customer_by_email(email: str):
         )
 
 
+@app.get('/customer/{email}/orders',
+         status_code=status.HTTP_200_OK)
+async def get_customer_orders(email: str,
+                              response: Response,
+                              order_status: Optional[list[OrderStatus]] = Query(None),
+                              from_date: Optional[dt.date] = Query(None, alias='from'),
+                              to_date: Optional[dt.date] = Query(None, alias='to'),
+                              limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                              after: Optional[str] = None):
+    """
+    Function to handle the endpoint listing the orders of a single customer, newest first, with
+    the name and price of the ordered product. Filter them by order_status (repeatable) and by
+    the from and to dates (both included). The orders come one page at a time, send the
+    X-Next-Cursor header of a page back as after to get the next one
+
+    :return: Returns the page of orders of the customer
+    """
+    args = (
+        email,
+        [int(value) for value in order_status] if order_status else None,
+        from_date,
+        to_date
+    )
+    try:
+        page = await paginate(CUSTOMER_ORDER_KEYSET, queries.CUSTOMER_ORDERS.sql, response, limit, after,
+                              False, args)
+        # only an empty first page needs telling an unknown customer from one without orders
+        if after is None and page.body == b'[]':
+            if not await async_db.fetch_value(queries.CUSTOMER_EMAIL_TAKEN.sql, email):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail='Account does not exist.'
+                )
+        return page
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
 @app.post('/customer/new_customer',
           status_code=status.HTTP_201_CREATED)
-def add_customer(customer: Customer) -> dict[str, Customer | str]:
+async def add_customer(customer: Customer) -> dict[str, Customer | str]:
     """
     Function to handle the endpoint for adding a new customer
 
@@ -512,20 +866,15 @@ def add_customer(customer: Customer) -> dict[str, Customer | str]:
     :return: Returns the new customer object and a message
     """
     try:
-        email = customer.customer_email
         # check username if taken
-        all_customers = get_all_customer()
-        for record in all_customers:
-            # convert to a dictionary
-            db_customer = dict(record)
-            if email == db_customer['customer_email']:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail='Email is already taken'
-                )
+        if await async_db.fetch_value(queries.CUSTOMER_EMAIL_TAKEN.sql, customer.customer_email):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail='Email is already taken'
+            )
 
         return {
-            "data": db_create.add_customer_to_database(customer),
+            "data": await run_in_threadpool(db_create.add_customer_to_database, customer),
             "detail": "Customer added to database"
         }
     except OperationalError:
@@ -535,9 +884,38 @@ def add_customer(customer: Customer) -> dict[str, Customer | str]:
         )
 
 
+@app.post('/customer/bulk',
+          status_code=status.HTTP_201_CREATED)
+async def add_customers(customers: list[Customer]):
+    """
+    Function to handle the endpoint for adding many customers in a single transaction.
+    Customers with an email that is already taken are skipped and reported as duplicates
+
+    :param list[Customer] customers: Pydantic models containing the customers to be added
+    :return: Returns the result of every customer in the request and a message
+    """
+    check_bulk_size(customers)
+    try:
+        results = await run_in_threadpool(db_create.add_customers_to_database, customers)
+        return {
+            "data": results,
+            "detail": f"{count_created(results)} customers added to database"
+        }
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+    except DatabaseError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+
+
 @app.put('/customer/update_customer/{current_email}',
          status_code=status.HTTP_200_OK)
-def update_customer(current_email: str, updated_customer: Customer) -> dict[str, dict[str, str] | str]:
+async def update_customer(current_email: str, updated_customer: Customer) -> dict[str, dict[str, str] | str]:
     """
     Function to handle the endpoint for updating an Customer object.
 
@@ -546,58 +924,100 @@ def update_customer(current_email: str, updated_customer: Customer) -> dict[str,
     :return: Returns the updated Customer object along with a message
     """
     try:
-        existing = False
-        # check product if existing
-        all_customers = get_all_customer()
-        for record in all_customers:
-            # convert to a dictionary
-            db_customer = dict(record)
-            if current_email == db_customer['customer_email']:
-                existing = True
-        if not existing:
+        result = await run_in_threadpool(db_update.update_customer, current_email, updated_customer)
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Customer does not exist.'
             )
 
         return {
-            "data": db_update.update_customer(current_email, updated_customer),
+            "data": result,
             "detail": "Customer updated to database"
         }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Email is already taken'
+        )
+    except (DataError, IntegrityError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
     except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+@app.patch('/customer/update_customer/{current_email}',
+           status_code=status.HTTP_200_OK)
+async def patch_customer(current_email: str, customer_patch: CustomerPatch) -> dict[str, dict[str, str] | str]:
+    """
+    Function to handle the endpoint for updating some fields of a Customer object, e.g. only
+    the contact number. Only the fields sent are written, and the password is only hashed
+    when a new one is sent
+
+    :param str current_email: The current email of the Customer to be updated
+    :param CustomerPatch customer_patch: The Pydantic model containing the fields to update
+    :return: Returns a message once the Customer is updated
+    """
+    try:
+        result = await run_in_threadpool(db_update.patch_customer, current_email, customer_patch)
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Customer does not exist.'
+            )
+
+        return {
+            "data": result,
+            "detail": "Customer updated to database"
+        }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Email is already taken'
+        )
+    except (DataError, IntegrityError):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail='Invalid data format received'
         )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
 
 
 # === ADMIN ===
 
 @app.get('/admin',
          status_code=status.HTTP_200_OK)
-def get_all_admin():
+async def get_all_admin(response: Response,
+                        if_none_match: Optional[str] = Header(None),
+                        if_modified_since: Optional[str] = Header(None)):
     """
-    Function to handle the endpoint to fetch all admins from the database
+    Function to handle the endpoint to fetch all admins from the database.
+    Send the ETag back in If-None-Match to get a 304 while the admins are unchanged
 
     :return: Returns the list of Admin objects fetched from the database
     """
     try:
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute("""SELECT 
-                        admin_id,
-                        admin_full_name,
-                        admin_username,
-                        admin_position,
-                        admin_is_active
-                        FROM hainco_admin""")
-        all_admin = cursor.fetchall()
+        version = await table_version('hainco_admin')
+        if is_not_modified(version, if_none_match, if_modified_since):
+            return not_modified(version)
+        set_validators(response, version)
+        all_admin = await async_db.fetch_records(queries.ADMIN_LIST.sql)
         if not all_admin:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='No admin records found'
             )
-        return all_admin
+        return rows_response(all_admin, response)
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -607,40 +1027,19 @@ def get_all_admin():
 
 @app.get('/admin/{username}',
          status_code=status.HTTP_200_OK)
-def get_admin_by_username(username: str):
+async def get_admin_by_username(username: str):
     """
     Function to handle the endpoint to fetch a single admin from the database by username
 
     :return: Returns the Admin object fetched
     """
     try:
-        existing = False
-        # check product if existing
-        all_admins = get_all_admin()
-        for record in all_admins:
-            # convert to a dictionary
-            db_admin = dict(record)
-            if username == db_admin['admin_username']:
-                existing = True
-        if not existing:
+        admin_record = await async_db.fetch_one(queries.ADMIN_BY_USERNAME.sql, username)
+        if admin_record is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail='Product does not exist.'
+                detail='Admin does not exist.'
             )
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute(f"""SELECT 
-                        admin_id,
-                        admin_full_name,
-                        admin_username,
-                        admin_password_salt,
-                        admin_password_hash,
-                        admin_position,
-                        admin_is_active
-                        FROM hainco_admin
-                        WHERE admin_username = '{username}'
-                        """)
-        admin_record = cursor.fetchone()
         # convert the result to a dictionary to modify its values
         admin_dict = dict(admin_record)
         # decrypt the password
@@ -664,7 +1063,7 @@ def get_admin_by_username(username: str):
 
 @app.post('/admin/new_admin',
           status_code=status.HTTP_201_CREATED)
-def add_admin(admin: Admin):
+async def add_admin(admin: Admin):
     """
     Function to handle the endpoint for adding a new admin
 
@@ -672,20 +1071,15 @@ def add_admin(admin: Admin):
     :return: Returns the new admin object and a message
     """
     try:
-        username = admin.admin_username
         # check username if taken
-        all_admin = get_all_admin()
-        for record in all_admin:
-            # convert to a dictionary
-            db_admin = dict(record)
-            if username == db_admin['admin_username']:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail='Username is already taken'
-                )
+        if await async_db.fetch_value(queries.ADMIN_USERNAME_TAKEN.sql, admin.admin_username):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail='Username is already taken'
+            )
 
         return {
-            "data": db_create.add_admin_to_database(admin),
+            "data": await run_in_threadpool(db_create.add_admin_to_database, admin),
             "detail": "Admin added to database"
         }
     except OperationalError:
@@ -697,7 +1091,7 @@ def add_admin(admin: Admin):
 
 @app.put('/admin/update_admin/{current_username}',
          status_code=status.HTTP_200_OK)
-def update_admin(current_username: str, updated_admin: Admin) -> dict[str, dict[str, str] | str]:
+async def update_admin(current_username: str, updated_admin: Admin) -> dict[str, dict[str, str] | str]:
     """
     Function to handle the endpoint for updating an Admin object.
 
@@ -706,24 +1100,68 @@ def update_admin(current_username: str, updated_admin: Admin) -> dict[str, dict[
     :return: Returns the updated Admin object along with a message
     """
     try:
-        existing = False
-        # check product if existing
-        all_admins = get_all_admin()
-        for record in all_admins:
-            # convert to a dictionary
-            db_admin = dict(record)
-            if current_username == db_admin['admin_username']:
-                existing = True
-        if not existing:
+        result = await run_in_threadpool(db_update.update_admin, current_username, updated_admin)
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Admin does not exist.'
+            )
+
+        return {
+            "data": result,
+            "detail": "Admin updated to database"
+        }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Username is already taken'
+        )
+    except (DataError, IntegrityError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+@app.patch('/admin/update_admin/{current_username}',
+           status_code=status.HTTP_200_OK)
+async def patch_admin(current_username: str, admin_patch: AdminPatch) -> dict[str, dict[str, str] | str]:
+    """
+    Function to handle the endpoint for updating some fields of a Admin object, e.g. only
+    the position. Only the fields sent are written, and the password is only hashed when a
+    new one is sent
+
+    :param str current_username: The current username of the Admin to be updated
+    :param AdminPatch admin_patch: The Pydantic model containing the fields to update
+    :return: Returns a message once the Admin is updated
+    """
+    try:
+        result = await run_in_threadpool(db_update.patch_admin, current_username, admin_patch)
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Admin does not exist.'
             )
 
         return {
-            "data": db_update.update_admin(current_username, updated_admin),
+            "data": result,
             "detail": "Admin updated to database"
         }
+    except UniqueViolation:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Username is already taken'
+        )
+    except (DataError, IntegrityError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -733,39 +1171,93 @@ def update_admin(current_username: str, updated_admin: Admin) -> dict[str, dict[
 
 # === TRANSACTION ===
 
+def transaction_filters(from_date: Optional[dt.date] = Query(None, alias='from'),
+                        to_date: Optional[dt.date] = Query(None, alias='to'),
+                        transaction_type: Optional[list[TransactionType]] = Query(None),
+                        transaction_agent: Optional[str] = None) -> tuple[str, tuple]:
+    """
+    Reads the filters shared by the transaction list and its CSV export: the transactions
+    from one date to another (both included), of the given types and of an agent
+
+    :return: Returns the query of the transactions with only the filters sent, and its arguments
+    """
+    values = {
+        'from': from_date,
+        'to': to_date,
+        'transaction_type': [int(value) for value in transaction_type] if transaction_type else None,
+        'transaction_agent': transaction_agent
+    }
+    used = {name: value for name, value in values.items() if value is not None}
+    return queries.transaction_list(list(used)).sql, tuple(used.values())
+
+
 @app.get('/transaction',
          status_code=status.HTTP_200_OK)
-def get_all_transaction() -> list[Transaction]:
+async def get_all_transaction(response: Response,
+                              limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                              after: Optional[str] = None,
+                              stream: bool = False,
+                              filtered: tuple[str, tuple] = Depends(transaction_filters)) -> list[Transaction]:
     """
-    Function to handle the endpoint to fetch all transactions from the database
+    Function to handle the endpoint to fetch all transactions from the database, newest first.
+    Filter them by from and to dates, transaction_type (repeatable) and transaction_agent.
+    Pass limit to get one page at a time, sending the X-Next-Cursor header of a page back
+    as after to get the next one, or stream to receive newline delimited JSON
 
     :return: Returns the list of Transaction objects fetched from the database
     """
+    sql, args = filtered
     try:
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute("""SELECT 
-                        transaction_id,
-                        transaction_agent,
-                        transaction_description,
-                        transaction_type,
-                        transaction_amount,
-                        transaction_date
-                        FROM hainco_transaction
-                        ORDER BY transaction_date DESC""")
-        all_transaction = cursor.fetchall()
+        if stream or limit is not None:
+            return await paginate(TRANSACTION_KEYSET, sql, response, limit, after, stream, args)
+        ordered_sql, ordered_args = TRANSACTION_KEYSET.query(sql, args)
+        all_transaction = await async_db.fetch_records(ordered_sql, *ordered_args)
         if not all_transaction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='No transactions found'
             )
-        return all_transaction
+        return rows_response(all_transaction, response)
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+@app.get('/transaction/export',
+         status_code=status.HTTP_200_OK)
+async def export_transaction(filtered: tuple[str, tuple] = Depends(transaction_filters),
+                             accept_encoding: Optional[str] = Header(None)):
+    """
+    Function to handle the endpoint exporting the transactions as CSV, oldest first, with the
+    filters of GET /transaction. The rows are read through a server side cursor and sent as
+    they arrive, so the memory of the worker stays the same whatever the number of rows.
+    The CSV is compressed with gzip when the client accepts it
+
+    :return: Returns the streamed CSV file
+    """
+    sql, args = filtered
+    ordered_sql, ordered_args = TRANSACTION_EXPORT_KEYSET.query(sql, args)
+    try:
+        records = await async_db.stream(ordered_sql, *ordered_args, prefetch=STREAM_PREFETCH)
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail='Failed to connect to database'
         )
 
+    body = csv_lines(records, queries.TRANSACTION_COLUMNS)
+    headers = {
+        'Content-Disposition': 'attachment; filename="transactions.csv"',
+        'Vary': 'Accept-Encoding'
+    }
+    if accepts_gzip(accept_encoding):
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type='text/csv', headers=headers,
+                             background=BackgroundTask(records.aclose))
+
 
 # === RECORD ===
 #
@@ -791,34 +1283,38 @@ def get_all_transaction() -> list[Transaction]:
 
 """
 GET all orders (canteen)
+GET the live feed of new orders and status changes (canteen)
 GET a single order by order number (canteen) 
 POST a new order (customer)
+POST a cart of orders, reserving their stock (customer)
+PUT the status of an order (canteen)
 """
 
 
 @app.get('/order',
          status_code=status.HTTP_200_OK)
-def get_all_order():
-    try:
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute("""SELECT 
-                        order_id,
-                        order_product_code,
-                        order_customer_email,
-                        order_requests,
-                        order_date,
-                        order_staff_username,
-                        order_status,
-                        order_number
-                        FROM hainco_order""")
-        all_order = cursor.fetchall()
+async def get_all_order(response: Response,
+                        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                        after: Optional[str] = None,
+                        stream: bool = False):
+    """
+    Function to handle the endpoint to fetch all orders from the database.
+    Pass limit to get one page at a time, sending the X-Next-Cursor header of a page back
+    as after to get the next one, or stream to receive newline delimited JSON
+
+    :return: Returns the list of Order objects fetched from the database
+    """
+    sql = queries.ORDER_LIST.sql
+    try:
+        if stream or limit is not None:
+            return await paginate(ORDER_KEYSET, sql, response, limit, after, stream)
+        all_order = await async_db.fetch_records(sql)
         if not all_order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='No order found'
             )
-        return all_order
+        return rows_response(all_order, response)
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -826,38 +1322,40 @@ def get_all_order():
         )
 
 
+@app.get('/order/feed',
+         status_code=status.HTTP_200_OK)
+async def get_order_feed(order_status: Optional[list[OrderStatus]] = Query(None),
+                         staff: Optional[str] = None,
+                         last_event_id: Optional[int] = Query(None),
+                         last_event_id_header: Optional[int] = Header(None, alias='Last-Event-ID')):
+    """
+    Function to handle the endpoint streaming order events as Server-Sent Events, so stations
+    receive new orders and status changes as they happen instead of polling GET /order.
+    Events can be filtered by order_status (repeatable) and by the staff username, and a
+    station that reconnects with the Last-Event-ID header (or last_event_id) receives the
+    events it missed. A reset event means the missed events are gone and GET /order has to
+    be fetched again
+
+    :return: Returns the text/event-stream of order_created and order_status_changed events
+    """
+    resume_from = last_event_id_header if last_event_id_header is not None else last_event_id
+    return StreamingResponse(
+        order_feed.server_sent_events(resume_from, order_status, staff),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.get('/order/{order_number}',
          status_code=status.HTTP_200_OK)
-def get_order_by_order_number(order_number: int):
-    try:
-        existing = False
-        # check product if existing
-        all_orders = get_all_order()
-        for record in all_orders:
-            # convert to a dictionary
-            db_order = dict(record)
-            if order_number == db_order['order_number']:
-                existing = True
-        if not existing:
+async def get_order_by_order_number(order_number: int):
+    try:
+        order_record = await async_db.fetch_one(queries.ORDER_BY_NUMBER.sql, order_number)
+        if order_record is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Order does not exist.'
             )
-        db = DatabaseOperator(cursor_factory=RealDictCursor)
-        cursor = db.get_cursor()
-        cursor.execute(f"""SELECT 
-                        order_id,
-                        order_product_code,
-                        order_customer_email,
-                        order_requests,
-                        order_date,
-                        order_staff_username,
-                        order_status,
-                        order_number
-                        FROM hainco_order
-                        WHERE order_number = '{order_number}'
-                        """)
-        order_record = cursor.fetchone()
         return order_record
     except OperationalError:
         raise HTTPException(
@@ -868,10 +1366,16 @@ def get_order_by_order_number(order_number: int):
 
 @app.post('/order/new_order',
           status_code=status.HTTP_201_CREATED)
-def add_order(order: Order):
+async def add_order(order: Order):
     try:
+        order_record = await run_in_threadpool(db_create.add_order_to_database, order)
+        if order_record is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail='Invalid data format received'
+            )
         return {
-            "data": db_create.add_order_to_database(order),
+            "data": order_record,
             "detail": "Order added to database"
         }
     except OperationalError:
@@ -881,23 +1385,186 @@ def add_order(order: Order):
         )
 
 
+@app.post('/order/bulk',
+          status_code=status.HTTP_201_CREATED)
+async def add_orders(orders: list[Order]):
+    """
+    Function to handle the endpoint for adding many orders in a single transaction
+
+    :param list[Order] orders: Pydantic models containing the orders to be added
+    :return: Returns the result of every order in the request and a message
+    """
+    check_bulk_size(orders)
+    try:
+        results = await run_in_threadpool(db_create.add_orders_to_database, orders)
+        return {
+            "data": results,
+            "detail": f"{count_created(results)} orders added to database"
+        }
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+    except DatabaseError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+
+
+@app.post('/order/checkout',
+          status_code=status.HTTP_201_CREATED)
+async def checkout_order(checkout: Checkout):
+    """
+    Function to handle the endpoint placing every line of a cart at once. The stock of the
+    products is checked and taken in the same transaction as the orders are created, so
+    either the whole cart is ordered or, with 409, nothing is. A cart with an unknown or
+    inactive product is refused with 422
+
+    :param Checkout checkout: Pydantic model containing the customer, staff and lines of the cart
+    :return: Returns the created orders, one per unit ordered, and a message
+    """
+    if sum(line.quantity for line in checkout.lines) > db_create.BULK_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f'Order at most {db_create.BULK_MAX_SIZE} items per checkout'
+        )
+    try:
+        order_records = await run_in_threadpool(db_create.place_order_in_database, checkout)
+        return {
+            "data": order_records,
+            "detail": f"{len(order_records)} orders added to database"
+        }
+    except db_create.InsufficientStock as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                'message': 'Insufficient stock',
+                'products': e.products
+            }
+        )
+    except db_create.UnavailableProducts as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                'message': 'Unknown or inactive products',
+                'products': e.product_codes
+            }
+        )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+    except DatabaseError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+
+
+@app.put('/order/update_status/{order_number}',
+         status_code=status.HTTP_200_OK)
+async def update_order_status(order_number: int, update: OrderStatusUpdate):
+    """
+    Function to handle the endpoint moving an order to another status, which is sent
+    to the stations following the order feed
+
+    :param int order_number: The number of the order to update
+    :param OrderStatusUpdate update: The new status of the order
+    :return: Returns the updated order
+    """
+    try:
+        order_record = await run_in_threadpool(db_update.update_order_status, order_number,
+                                               update.order_status)
+        if order_record is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Order does not exist.'
+            )
+        return {
+            "data": order_record,
+            "detail": "Order status updated"
+        }
+    except (DataError, IntegrityError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Invalid data format received'
+        )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
+# === REPORT ===
+
+@app.get('/report/sales',
+         status_code=status.HTTP_200_OK)
+async def get_sales_report(interval: RecordInterval = RecordInterval.WEEKLY,
+                           by: str = Query('total', regex='^(total|product|transaction_type|staff)$'),
+                           end: Optional[dt.date] = None,
+                           daily: bool = False):
+    """
+    Function to handle the endpoint reporting the sales of a RecordInterval window (7, 14 or 30 days
+    up to end, today by default). The figures are read from the daily rollups kept by
+    scripts/create_sales_rollups.sql instead of the transactions, grouped by total, product,
+    transaction_type or staff. Pass daily to get one row per day instead of one per window
+
+    :return: Returns the window and its transaction amount, transaction count and order count
+    """
+    end = end or dt.date.today()
+    start = end - dt.timedelta(days=interval.value - 1)
+    sql = queries.SALES_BY_DAY.sql if daily else queries.SALES_BY_WINDOW.sql
+    try:
+        return {
+            "interval": interval.name,
+            "from": start,
+            "to": end,
+            "by": by,
+            "data": await async_db.fetch_all(sql, by, start, end)
+        }
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Failed to connect to database'
+        )
+
+
 # === META ===
 
 @app.get('/meta/row_count')
-def get_row_count() -> list[tuple]:
+async def get_row_count(mode: str = Query('exact', regex='^(exact|estimate)$')) -> list[tuple]:
     """
-    Counts the rows using the count_rows method in the DatabaseOperator class
+    Counts the rows using the count_rows method in the DatabaseOperator class.
+    The counts are cached for a few seconds, pass mode=estimate to read the planner
+    statistics instead of the exact counters
 
     :return: Returns the tuples containing the table name and the corresponding row count
     """
     try:
-        return DB_STATIC.count_rows()
+        return await row_count_cache.get_or_load(
+            mode,
+            lambda: run_in_threadpool(DB_STATIC.count_rows, mode)
+        )
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail='Failed to connect to database'
         )
 
+
+@app.get('/metrics', include_in_schema=False)
+def get_metrics():
+    """
+    Exposes the request and database metrics of every worker for Prometheus to scrape
+
+    :return: Returns the metrics in the Prometheus text format
+    """
+    return metrics.latest()
+
 # TODO add the authentication
 
 # TODO add the email endpoint
@@ -0,0 +1,101 @@
+"""
+Order placement while reporting clients overload the server, with and without admission control
+
+Runs the same overload against a server with admission control and against one started with
+ADMISSION_CONTROL=false: many clients reading /transaction, /report/sales and /meta/row_count,
+a few browsing the menu and a few placing orders, all at the same time:
+
+    python -m benchmarks.seed --database hainco_bench
+    python -m benchmarks.admission --database hainco_bench --reporting-clients 48 --target-p95 500
+
+Reports every mix of both runs. Exits with 1 when, with admission control, the p95 latency of
+order placement misses the target or an order is answered anything but 201
+"""
+import argparse
+import os
+import sys
+import threading
+
+from benchmarks import seed as bench_seed
+from benchmarks.driver import Request, run_load
+from benchmarks.run import scenarios, start_server
+
+REPORTS = [
+    '/transaction?limit=500',
+    '/transaction?limit=500&transaction_type=2',
+    '/report/sales?daily=true',
+    '/meta/row_count',
+]
+
+
+def overload(url: str, mixes: dict, clients: dict, duration: float) -> dict:
+    """
+    Runs every mix at once, each with its own clients
+
+    :return: Returns the summary of every mix, keyed like mixes
+    """
+    summaries = {}
+
+    def run(name: str):
+        summaries[name] = run_load(url, mixes[name], clients[name], duration, warmup=2)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in mixes if clients[name]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    bench_seed.add_volume_arguments(parser)
+    parser.add_argument('--port', type=int, default=8093)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--reporting-clients', type=int, default=48)
+    parser.add_argument('--menu-clients', type=int, default=8)
+    parser.add_argument('--order-clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--target-p95', type=float, default=500, help='p95 target of order placement in ms')
+    args = parser.parse_args()
+
+    mixes = {
+        'order_create': scenarios(args)['order_create'],
+        'product_list': lambda rng: Request('GET', '/product'),
+        'reporting': lambda rng: Request('GET', rng.choice(REPORTS)),
+    }
+    clients = {'order_create': args.order_clients, 'product_list': args.menu_clients,
+               'reporting': args.reporting_clients}
+
+    results = {}
+    for label, control in (('admission control', 'true'), ('no admission control', 'false')):
+        env = dict(os.environ)
+        os.environ['ADMISSION_CONTROL'] = control
+        try:
+            server = start_server(args.database, args.port, args.workers)
+        finally:
+            os.environ.clear()
+            os.environ.update(env)
+        try:
+            results[label] = overload(f'http://127.0.0.1:{args.port}', mixes, clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        print(label)
+        for name, summary in results[label].items():
+            latency = summary['latency_ms']
+            print(f'  {name:<13} {clients[name]:>3} clients: {summary["throughput_rps"]:>8} req/s, '
+                  f'p50 {latency["p50"]}ms p95 {latency["p95"]}ms p99 {latency["p99"]}ms max {latency["max"]}ms, '
+                  f'codes {summary["status_codes"]}, errors {summary["errors"]}')
+
+    orders = results['admission control']['order_create']
+    failed = orders['latency_ms']['p95'] > args.target_p95 or set(orders['status_codes']) != {'201'}
+    if failed:
+        print(f'FAIL: order placement p95 {orders["latency_ms"]["p95"]}ms (target {args.target_p95}ms), '
+              f'codes {orders["status_codes"]}', file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
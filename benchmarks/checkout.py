@@ -0,0 +1,216 @@
+"""
+Concurrency check of POST /order/checkout against a product that is about to run out
+
+Sets the stock of one product of the benchmark database low, fires many checkouts at the
+same instant and verifies that exactly the available stock was sold, without oversells,
+lost updates, deadlocks or server errors:
+
+    python -m benchmarks.checkout --checkouts 500 --stock 25
+
+Every cart orders the low-stock product together with a second product, listed in random
+order, so carts lock their products in different orders. Then --clients clients place carts of
+two products drawn from a hundred others for --duration seconds, and the checkouts placed per
+second are reported together with the installed triggers every checkout writes through. Pass
+--url to use a running server started against the database given by --database
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+
+from benchmarks import seed as bench_seed
+from benchmarks.driver import Request, percentile, run_load
+from benchmarks.run import start_server
+
+LOW_STOCK_PRODUCT = 'P000001'
+# products ordered alongside the low-stock one, with plenty of stock
+OTHER_PRODUCTS = ['P000002', 'P000003', 'P000004', 'P000005']
+# products of the sustained checkouts, so they rarely share a product
+THROUGHPUT_PRODUCTS = ['P{:06d}'.format(number) for number in range(10, 110)]
+PLENTY = 1000000
+# statement triggers of the other scripts that every checkout goes through
+CHECKOUT_TRIGGERS = ['version_product', 'count_new_order', 'count_new_transaction', 'rollup_order',
+                     'rollup_transaction']
+
+
+def prepare(database: str, stock: int) -> int:
+    """
+    Sets the stock of the products used by the carts
+
+    :return: Returns the highest order_id before the run
+    """
+    conn = bench_seed.connect(database)
+    with conn.cursor() as cursor:
+        cursor.execute("""UPDATE hainco_product
+                            SET product_stock = CASE WHEN product_code = %s THEN %s ELSE %s END,
+                                product_is_active = true
+                            WHERE product_code = ANY(%s)""",
+                       (LOW_STOCK_PRODUCT, stock, PLENTY, [LOW_STOCK_PRODUCT] + OTHER_PRODUCTS + THROUGHPUT_PRODUCTS))
+        cursor.execute('SELECT coalesce(max(order_id), 0) FROM hainco_order')
+        last_order_id = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return last_order_id
+
+
+def outcome(database: str, last_order_id: int) -> tuple[int, int]:
+    """
+    :return: Returns the stock left of the low-stock product and the units of it ordered by the run
+    """
+    conn = bench_seed.connect(database)
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT product_stock FROM hainco_product WHERE product_code = %s', (LOW_STOCK_PRODUCT,))
+        stock_left = cursor.fetchone()[0]
+        cursor.execute('SELECT count(*) FROM hainco_order WHERE order_id > %s AND order_product_code = %s',
+                       (last_order_id, LOW_STOCK_PRODUCT))
+        ordered = cursor.fetchone()[0]
+    conn.close()
+    return stock_left, ordered
+
+
+def installed_triggers(database: str) -> list[str]:
+    """
+    :return: Returns the triggers of CHECKOUT_TRIGGERS installed in the database
+    """
+    conn = bench_seed.connect(database)
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT DISTINCT tgname FROM pg_trigger WHERE tgname = ANY(%s) ORDER BY tgname',
+                       (CHECKOUT_TRIGGERS,))
+        triggers = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return triggers
+
+
+def cart(rng: random.Random) -> Request:
+    lines = [{'product_code': code, 'quantity': 1} for code in rng.sample(THROUGHPUT_PRODUCTS, 2)]
+    return Request('POST', '/order/checkout', json.dumps({
+        'order_customer_email': 'customer{}@example.com'.format(rng.randint(1, 1000)),
+        'order_staff_username': 'staff1',
+        'lines': lines,
+    }).encode(), {'Content-Type': 'application/json'})
+
+
+def fire(url: str, checkouts: int, quantity: int, seed: int) -> tuple[Counter, list[float]]:
+    """
+    Sends every checkout from its own thread and connection, released together by a barrier
+
+    :return: Returns the count of every status code and the latency of every checkout
+    """
+    target = urllib.parse.urlsplit(url)
+    rng = random.Random(seed)
+    carts = []
+    for _ in range(checkouts):
+        lines = [
+            {'product_code': LOW_STOCK_PRODUCT, 'quantity': quantity},
+            {'product_code': rng.choice(OTHER_PRODUCTS), 'quantity': 1},
+        ]
+        rng.shuffle(lines)
+        carts.append(json.dumps({
+            'order_customer_email': 'customer{}@example.com'.format(rng.randint(1, 1000)),
+            'order_staff_username': 'staff1',
+            'lines': lines,
+        }).encode())
+
+    codes = Counter()
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(checkouts)
+
+    def checkout(body: bytes):
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        try:
+            conn.connect()
+            barrier.wait()
+            started = time.perf_counter()
+            conn.request('POST', '/order/checkout', body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            with lock:
+                codes[response.status] += 1
+                latencies.append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException, threading.BrokenBarrierError):
+            with lock:
+                codes['error'] += 1
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=checkout, args=(body,)) for body in carts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return codes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='hainco_bench')
+    parser.add_argument('--url', help='use an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--checkouts', type=int, default=500)
+    parser.add_argument('--stock', type=int, default=25)
+    parser.add_argument('--quantity', type=int, default=1, help='units of the low-stock product per cart')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clients', type=int, default=16, help='clients of the sustained checkouts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of the sustained checkouts')
+    args = parser.parse_args()
+
+    last_order_id = prepare(args.database, args.stock)
+    server = None
+    if not args.url:
+        env = dict(os.environ)
+        # every checkout of the burst waits for its turn, this measures the database and not
+        # the admission control
+        os.environ['ADMISSION_QUEUE_SIZE'] = str(args.checkouts)
+        os.environ['ADMISSION_QUEUE_TIMEOUT'] = '60'
+        try:
+            server = start_server(args.database, args.port, args.workers)
+        finally:
+            os.environ.clear()
+            os.environ.update(env)
+    url = args.url.rstrip('/') if args.url else f'http://127.0.0.1:{args.port}'
+    try:
+        started = time.perf_counter()
+        codes, latencies = fire(url, args.checkouts, args.quantity, args.seed)
+        elapsed = time.perf_counter() - started
+        sustained = run_load(url, cart, args.clients, args.duration, warmup=1, seed=args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    stock_left, ordered = outcome(args.database, last_order_id)
+
+    expected = min(args.checkouts, args.stock // args.quantity)
+    print(f'{args.checkouts} checkouts in {elapsed:.2f}s, codes={dict(codes)}, '
+          f'p50={percentile(latencies, 0.5) * 1000:.1f}ms p99={percentile(latencies, 0.99) * 1000:.1f}ms')
+    print(f'{LOW_STOCK_PRODUCT}: stock {args.stock} -> {stock_left}, {ordered} units ordered')
+    latency = sustained['latency_ms']
+    print(f'{args.clients} clients for {args.duration:g}s: {sustained["throughput_rps"]} checkouts/s, '
+          f'p50={latency["p50"]}ms p95={latency["p95"]}ms, codes={sustained["status_codes"]}, '
+          f'through {", ".join(installed_triggers(args.database)) or "no other triggers"}')
+
+    failures = []
+    if codes[201] != expected:
+        failures.append(f'{codes[201]} checkouts succeeded, expected {expected}')
+    if codes[201] + codes[409] != args.checkouts:
+        failures.append('some checkouts were neither placed nor refused for lack of stock')
+    if ordered != codes[201] * args.quantity:
+        failures.append(f'{ordered} units ordered for {codes[201]} placed checkouts')
+    if stock_left != args.stock - ordered or stock_left < 0:
+        failures.append(f'{stock_left} left in stock after selling {ordered} of {args.stock}')
+    if set(sustained['status_codes']) != {'201'} or sustained['errors']:
+        failures.append(f'sustained checkouts answered {sustained["status_codes"]}, {sustained["errors"]} errors')
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Puts two result files of benchmarks.run side by side
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+
+COLUMNS = [
+    ('req/s', lambda result: result['throughput_rps']),
+    ('p50 ms', lambda result: result['latency_ms']['p50']),
+    ('p95 ms', lambda result: result['latency_ms']['p95']),
+    ('p99 ms', lambda result: result['latency_ms']['p99']),
+    ('db/req', lambda result: result.get('db_round_trips_per_request')),
+]
+
+
+def load(path: str) -> dict:
+    with open(path) as result_file:
+        report = json.load(result_file)
+    return {(result['scenario'], result['concurrency']): result for result in report['results']}
+
+
+def change(before, after) -> str:
+    if before is None or after is None:
+        return '-'
+    if not before:
+        return f'{after:g}'
+    return f'{after:g} ({(after - before) / before:+.0%})'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    print('{:<14} {:>4}  '.format('scenario', 'c') + '  '.join(f'{title:>20}' for title, _ in COLUMNS))
+    for key in sorted(baseline.keys() & candidate.keys()):
+        cells = [change(value(baseline[key]), value(candidate[key])) for _, value in COLUMNS]
+        print('{:<14} {:>4}  '.format(*key) + '  '.join(f'{cell:>20}' for cell in cells))
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print('{:<14} {:>4}  only in {}'.format(*key, 'baseline' if key in baseline else 'candidate'))
+
+
+if __name__ == '__main__':
+    main()
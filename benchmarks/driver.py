@@ -0,0 +1,119 @@
+"""
+Closed loop HTTP load generator shared by the benchmark scripts. Every worker thread keeps one
+keep-alive connection open and sends its next request as soon as the previous one answers
+"""
+import http.client
+import random
+import statistics
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    body: bytes | None = None
+    headers: dict[str, str] | None = None
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(latencies: list[float], codes: dict[int, int], errors: int, elapsed: float) -> dict:
+    """
+    Turns raw samples into the figures every benchmark reports
+
+    :param list latencies: The latency of every answered request, in seconds
+    :param dict codes: The count of every received status code
+    :param int errors: The requests that failed without a response
+    :param float elapsed: The wall time of the run, in seconds
+    :return: Returns the summary as a JSON friendly dict
+    """
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'status_codes': {str(code): count for code, count in sorted(codes.items())},
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            'max': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def run_load(url: str, make_request: Callable[[random.Random], Request], concurrency: int,
+             duration: float, warmup: float = 0.0, seed: int = 0) -> dict:
+    """
+    Sends requests from concurrency workers until the duration is over
+
+    :param str url: The base URL of the server
+    :param make_request: Builds the next request from the worker's random generator
+    :param int concurrency: The number of requests kept in flight
+    :param float duration: The seconds to measure for
+    :param float warmup: The seconds to send requests for before measuring
+    :param int seed: The seed of the workers' random generators, for repeatable request mixes
+    :return: Returns the summary made by summarize, with the count of requests sent during the warmup too
+    """
+    parsed = urllib.parse.urlsplit(url)
+    lock = threading.Lock()
+    latencies: list[float] = []
+    codes: dict[int, int] = {}
+    errors = 0
+    sent = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    def worker(index: int):
+        nonlocal errors, sent
+        rng = random.Random(seed * 1000003 + index)
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+        local_latencies = []
+        local_codes: dict[int, int] = {}
+        local_errors = 0
+        local_sent = 0
+        try:
+            while (now := time.perf_counter()) < deadline:
+                request = make_request(rng)
+                local_sent += 1
+                try:
+                    conn.request(request.method, parsed.path.rstrip('/') + request.path,
+                                 body=request.body, headers=request.headers or {})
+                    response = conn.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    if now >= measure_from:
+                        local_errors += 1
+                    continue
+                finished = time.perf_counter()
+                if now >= measure_from:
+                    local_latencies.append(finished - now)
+                    local_codes[response.status] = local_codes.get(response.status, 0) + 1
+        finally:
+            conn.close()
+            with lock:
+                latencies.extend(local_latencies)
+                for code, count in local_codes.items():
+                    codes[code] = codes.get(code, 0) + count
+                errors += local_errors
+                sent += local_sent
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index in range(concurrency):
+            executor.submit(worker, index)
+    summary = summarize(latencies, codes, errors, time.perf_counter() - measure_from)
+    summary['sent_with_warmup'] = sent
+    return summary
@@ -0,0 +1,151 @@
+"""
+Memory of a worker while GET /transaction/export streams a large export
+
+Seed a year of transactions first, then export them, plain or compressed:
+
+    python -m benchmarks.seed --database hainco_bench --transactions 1000000
+    python -m benchmarks.export --database hainco_bench --from 2025-01-01 --gzip
+
+Starts a single worker and samples its resident memory while the export is read, reporting
+the rows, bytes and time of the export. Exits with 1 when the memory of the worker grows by
+more than the allowed megabytes, or when the export does not list every transaction
+"""
+import argparse
+import gzip
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from benchmarks import seed as bench_seed
+from benchmarks.run import start_server
+
+
+def resident_mb(pid: int) -> float:
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker_pids(pid: int) -> list[int]:
+    with open(f'/proc/{pid}/task/{pid}/children') as children:
+        return [int(child) for child in children.read().split()]
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pids: list[int], interval: float = 0.05):
+        """
+        The constructor starts nothing, call start to sample the memory of the processes every interval
+        """
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak = self.current()
+        self.stopped = threading.Event()
+
+    def current(self) -> float:
+        return sum(resident_mb(pid) for pid in self.pids)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+
+def count_transactions(database: str, from_date: str | None, to_date: str | None) -> int:
+    conn = bench_seed.connect(database)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""SELECT count(*) FROM hainco_transaction
+                              WHERE (%(from)s::date IS NULL OR transaction_date >= %(from)s::date)
+                              AND (%(to)s::date IS NULL OR transaction_date < %(to)s::date + 1)""",
+                           {'from': from_date, 'to': to_date})
+            return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+class CountingReader:
+    def __init__(self, response):
+        """
+        The constructor wraps a response, counting the bytes read from it
+        """
+        self.response = response
+        self.received = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.response.read(size)
+        self.received += len(chunk)
+        return chunk
+
+
+def export(url: str, params: dict, compressed: bool) -> tuple[int, int]:
+    """
+    Reads an export as a client would, without keeping it
+
+    :return: Returns the bytes received and the rows of the CSV, header left out
+    """
+    request = urllib.request.Request(f'{url}/transaction/export?{urllib.parse.urlencode(params)}')
+    if compressed:
+        request.add_header('Accept-Encoding', 'gzip')
+    rows = 0
+    with urllib.request.urlopen(request, timeout=600) as response:
+        if compressed and response.headers.get('Content-Encoding') != 'gzip':
+            raise SystemExit('FAIL: the export was not compressed')
+        reader = CountingReader(response)
+        body = gzip.GzipFile(fileobj=reader) if compressed else reader
+        while chunk := body.read(1024 * 1024):
+            rows += chunk.count(b'\n')
+    return reader.received, rows - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='hainco_bench')
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--from', dest='from_date', help='first day exported, YYYY-MM-DD')
+    parser.add_argument('--to', dest='to_date', help='last day exported, YYYY-MM-DD')
+    parser.add_argument('--gzip', action='store_true', help='ask for a compressed export')
+    parser.add_argument('--max-growth', type=float, default=32, help='megabytes the worker may grow by')
+    args = parser.parse_args()
+
+    params = {name: value for name, value in (('from', args.from_date), ('to', args.to_date)) if value}
+    expected = count_transactions(args.database, args.from_date, args.to_date)
+    server = start_server(args.database, args.port, 1)
+    url = f'http://127.0.0.1:{args.port}'
+    try:
+        sampler = MemorySampler(worker_pids(server.pid))
+        # a first small export opens the pools and warms the worker up, so they are not counted
+        export(url, {'from': '2100-01-01'}, args.gzip)
+        baseline = sampler.current()
+        sampler.peak = baseline
+        sampler.start()
+        started = time.perf_counter()
+        received, rows = export(url, params, args.gzip)
+        elapsed = time.perf_counter() - started
+        sampler.stopped.set()
+        sampler.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    growth = sampler.peak - baseline
+    print(f'exported {rows} rows, {received / 1024 / 1024:.1f}MB{" gzip" if args.gzip else ""} in {elapsed:.1f}s '
+          f'({rows / elapsed:.0f} rows/s)')
+    print(f'worker memory: {baseline:.1f}MB before, {sampler.peak:.1f}MB at the peak, grew {growth:.1f}MB '
+          f'(allowed {args.max_growth:.1f}MB)')
+
+    failed = False
+    if rows != expected:
+        print(f'FAIL: exported {rows} rows, the database has {expected}', file=sys.stderr)
+        failed = True
+    if growth > args.max_growth:
+        print(f'FAIL: the worker grew by {growth:.1f}MB while exporting', file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Import time budget of backend.server, the time a worker needs before it can serve
+
+Imports the app in a fresh interpreter with the database pointed at an unroutable address,
+and with the connect functions of psycopg2 and asyncpg replaced by ones that fail, so any
+connection opened at import time is reported instead of hanging:
+
+    python -m benchmarks.import_time --budget 1.5 --repeat 5
+
+Prints the best wall time of the runs and the modules of the project taking the most time
+to import (from python -X importtime), and exits with 1 when the budget is exceeded or
+when something connected to the database while importing
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# an address nothing answers on, a connection attempt would wait for the connect timeout
+UNREACHABLE_HOST = '10.255.255.1'
+
+PROBE = """
+import asyncpg, psycopg2
+
+def refuse(*args, **kwargs):
+    raise SystemExit('connected to the database while importing')
+
+psycopg2.connect = refuse
+asyncpg.connect = refuse
+asyncpg.create_pool = refuse
+import backend.server
+"""
+
+
+def run_import(importtime: bool = False) -> tuple[float, str]:
+    """
+    Imports backend.server in a new interpreter
+
+    :param bool importtime: Whether to report the import time of every module
+    :return: Returns the wall time of the interpreter and its standard error
+    """
+    env = dict(os.environ, DB_HOST=UNREACHABLE_HOST, DB_CONNECT_TIMEOUT='30')
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    started = time.perf_counter()
+    result = subprocess.run(command, env=env, capture_output=True, text=True, timeout=120)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(f'Importing backend.server failed:\n{result.stderr}')
+    return elapsed, result.stderr
+
+
+def slowest_modules(report: str, prefix: str, count: int) -> list[tuple[str, int]]:
+    """
+    :return: Returns the modules starting with prefix and their cumulative import time in microseconds
+    """
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        if name.startswith(prefix) and cumulative.strip().isdigit():
+            modules.append((name, int(cumulative)))
+    return sorted(modules, key=lambda module: module[1], reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=1.5, help='most seconds the import may take')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='project modules to list')
+    args = parser.parse_args()
+
+    # the first run also fills the bytecode cache, like the first start of a dyno would
+    timings = [run_import()[0] for _ in range(args.repeat)]
+    best = min(timings)
+    _, report = run_import(importtime=True)
+
+    print(f'import backend.server: best {best:.3f}s, worst {max(timings):.3f}s of {args.repeat} runs, '
+          f'budget {args.budget:.3f}s')
+    for name, cumulative in slowest_modules(report, 'backend', args.top):
+        print(f'  {cumulative / 1000:8.1f}ms  {name}')
+
+    if best > args.budget:
+        print(f'FAIL: importing backend.server took {best:.3f}s, over the budget of {args.budget:.3f}s',
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
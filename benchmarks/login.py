@@ -0,0 +1,118 @@
+"""
+Measures how many admin logins per second POST /token sustains
+
+Against a running server (uvicorn backend.server:app --port 8080):
+
+    python -m benchmarks.login --url http://localhost:8080 --username admin --password secret
+
+Without a server, to see the password verification throughput of this machine:
+
+    python -m benchmarks.login --hash-only
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.driver import percentile
+
+
+def login_once(url: str, username: str, password: str) -> tuple[float, int]:
+    body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    request = urllib.request.Request(f'{url}/token', data=body, method='POST')
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            code = response.status
+    except urllib.error.HTTPError as e:
+        code = e.code
+    return time.perf_counter() - started, code
+
+
+def run_http(url: str, username: str, password: str, concurrency: int, duration: float) -> dict:
+    deadline = time.perf_counter() + duration
+    latencies: list[float] = []
+    codes: dict[int, int] = {}
+
+    def worker():
+        while time.perf_counter() < deadline:
+            latency, code = login_once(url, username, password)
+            latencies.append(latency)
+            codes[code] = codes.get(code, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': 'http',
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'logins_per_second': codes.get(200, 0) / elapsed,
+        'status_codes': codes,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'mean': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        },
+    }
+
+
+def run_hash_only(concurrency: int, duration: float) -> dict:
+    from backend.operations.verification import hash_password, verify_password
+
+    password_hash = hash_password('benchmark-password')
+    deadline = time.perf_counter() + duration
+    counts = []
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            verify_password(password_hash, 'benchmark-password')
+            count += 1
+        counts.append(count)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': 'hash-only',
+        'concurrency': concurrency,
+        'verifications': sum(counts),
+        'logins_per_second': sum(counts) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--hash-only', action='store_true')
+    parser.add_argument('--output', help='file to write the JSON result to')
+    args = parser.parse_args()
+
+    if args.hash_only:
+        result = run_hash_only(args.concurrency, args.duration)
+    else:
+        result = run_http(args.url.rstrip('/'), args.username, args.password, args.concurrency, args.duration)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
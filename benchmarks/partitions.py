@@ -0,0 +1,94 @@
+"""
+Hot path of hainco_transaction before and after scripts/partition_transactions.sql
+
+Measures the single row inserts every write of the API makes into hainco_transaction, with its
+triggers, and the page of the last week of transactions GET /transaction?from= reads, on each
+database given. Seed a database without the partitions next to the default one to compare both
+layouts:
+
+    python -m benchmarks.seed --database hainco_single --unpartitioned
+    python -m benchmarks.seed --database hainco_bench
+    python -m benchmarks.partitions --databases hainco_single hainco_bench
+
+The inserts are rolled back. Exits with 1 when a partitioned table reads the last week without
+pruning the partitions of the older months
+"""
+import argparse
+import datetime as dt
+import sys
+import time
+
+from benchmarks import seed as bench_seed
+from benchmarks.driver import percentile
+from backend.database import queries
+from backend.database.pagination import Keyset
+
+RECENT_DAYS = 7
+PAGE_SIZE = 50
+
+
+def timed(cursor, statement: str, args: tuple, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(statement, args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def measure(database: str, repeat: int) -> dict:
+    conn = bench_seed.connect(database)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'hainco_transaction'::regclass")
+            partitioned = cursor.fetchone()[0]
+            cursor.execute('SELECT count(*) FROM hainco_transaction')
+            rows = cursor.fetchone()[0]
+
+            # prepared like the API runs them, the reads with the generic plan they end up on
+            cursor.execute('SET plan_cache_mode = force_generic_plan')
+            cursor.execute(f'PREPARE bench_insert AS {queries.ADD_TRANSACTION.sql}')
+            recent, _ = Keyset(('transaction_date', str), ('transaction_id', int), descending=True).query(
+                queries.transaction_list(['from']).sql, ('from',), None, PAGE_SIZE)
+            cursor.execute(f'PREPARE bench_recent AS {recent}')
+            since = dt.date.today() - dt.timedelta(days=RECENT_DAYS)
+
+            reads = timed(cursor, 'EXECUTE bench_recent(%s, %s)', (since, PAGE_SIZE), repeat)
+            cursor.execute('EXPLAIN (ANALYZE, FORMAT TEXT) EXECUTE bench_recent(%s, %s)', (since, PAGE_SIZE))
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            inserts = timed(cursor, 'EXECUTE bench_insert(%s, %s, %s, %s, %s)',
+                            ('BENCH', 'Benchmark insert', 2, 10, dt.datetime.now()), repeat)
+        conn.rollback()
+    finally:
+        conn.close()
+    return {
+        'database': database,
+        'partitioned': partitioned,
+        'rows': rows,
+        'insert_ms': (percentile(inserts, 0.5), percentile(inserts, 0.95)),
+        'recent_ms': (percentile(reads, 0.5), percentile(reads, 0.95)),
+        'pruned': 'Subplans Removed' in plan,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--databases', nargs='+', default=['hainco_bench'])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    failed = False
+    for database in args.databases:
+        result = measure(database, args.repeat)
+        layout = 'partitioned' if result['partitioned'] else 'single table'
+        print(f'{database} ({layout}, {result["rows"]} rows): '
+              f'insert p50 {result["insert_ms"][0]:.3f}ms p95 {result["insert_ms"][1]:.3f}ms, '
+              f'last {RECENT_DAYS} days p50 {result["recent_ms"][0]:.3f}ms p95 {result["recent_ms"][1]:.3f}ms')
+        if result['partitioned'] and not result['pruned']:
+            print(f'FAIL: {database} reads the last {RECENT_DAYS} days from every partition', file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Reproducible load test of the hot API endpoints
+
+Seeds a benchmark database on the Postgres server named by the DB_* variables, starts the
+server the way the Procfile does against it and measures every scenario at every concurrency level:
+
+    python -m benchmarks.run --concurrency 1 8 32 --duration 15
+
+Results are written as JSON to benchmarks/results/ and two runs can be put side by side with
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+
+Pass --skip-seed to reuse a database seeded earlier, or --url to measure a server that is
+already running (the database round trips are then read from the database given by --database)
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks import seed as bench_seed
+from benchmarks.driver import Request, run_load
+
+RESULTS_DIR = os.path.join(bench_seed.ROOT, 'benchmarks', 'results')
+
+
+def scenarios(volumes: argparse.Namespace) -> dict:
+    """
+    The request mixes that are measured, keyed by scenario name. Random keys are drawn
+    from the seeded ranges so lookups hit existing rows
+    """
+    token_body = urllib.parse.urlencode({
+        'username': bench_seed.BENCH_ADMIN_USERNAME,
+        'password': bench_seed.BENCH_ADMIN_PASSWORD,
+    }).encode()
+    form = {'Content-Type': 'application/x-www-form-urlencoded'}
+    json_headers = {'Content-Type': 'application/json'}
+
+    def new_order(rng):
+        body = json.dumps({
+            'order_product_code': 'P{:06d}'.format(rng.randint(1, volumes.products)),
+            'order_customer_email': 'customer{}@example.com'.format(rng.randint(1, volumes.customers)),
+            'order_request': '',
+            'order_staff_username': 'staff{}'.format(rng.randint(1, volumes.staff)),
+            'order_status': 1,
+        }).encode()
+        return Request('POST', '/order/new_order', body, json_headers)
+
+    return {
+        'product_list': lambda rng: Request('GET', '/product'),
+        'order_list': lambda rng: Request('GET', '/order'),
+        'order_page': lambda rng: Request('GET', '/order?limit=100'),
+        'order_lookup': lambda rng: Request('GET', '/order/{}'.format(rng.randint(1, volumes.orders))),
+        'order_create': new_order,
+        'customer_orders': lambda rng: Request(
+            'GET', '/customer/customer{}@example.com/orders?limit=20'.format(rng.randint(1, volumes.customers))),
+        'token': lambda rng: Request('POST', '/token', token_body, form),
+    }
+
+
+class RoundTripCounter:
+    """
+    Reads how many statements the server sent to the database, from pg_stat_statements when
+    the extension is installed and from the committed transactions of pg_stat_database otherwise
+    """
+
+    def __init__(self, database: str):
+        self.conn = bench_seed.connect(database)
+        self.conn.autocommit = True
+        self.source = 'pg_stat_database'
+        with self.conn.cursor() as cursor:
+            try:
+                cursor.execute("""SELECT sum(calls) FROM pg_stat_statements
+                                  WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())""")
+                self.source = 'pg_stat_statements'
+            except Exception:
+                pass
+
+    def read(self) -> int:
+        # pg_stat_statements counts right away, while idle backends flush their transaction
+        # counters to pg_stat_database only every 10 seconds
+        time.sleep(0.5 if self.source == 'pg_stat_statements' else 11)
+        with self.conn.cursor() as cursor:
+            cursor.execute('SELECT pg_stat_clear_snapshot()')
+            if self.source == 'pg_stat_statements':
+                cursor.execute("""SELECT coalesce(sum(calls), 0) FROM pg_stat_statements
+                                  WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())""")
+            else:
+                cursor.execute("""SELECT xact_commit + xact_rollback FROM pg_stat_database
+                                  WHERE datname = current_database()""")
+            return int(cursor.fetchone()[0])
+
+    def close(self):
+        self.conn.close()
+
+
+def start_server(database: str, port: int, workers: int) -> subprocess.Popen:
+    # the workers split the connection budget by WEB_CONCURRENCY, like under the Procfile
+    env = dict(os.environ, DB_NAME=database, WEB_CONCURRENCY=str(workers))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'uvicorn.workers.UvicornWorker',
+         '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'backend.server:app'],
+        cwd=bench_seed.ROOT, env=env
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'the server exited with code {server.returncode}')
+        try:
+            with urllib.request.urlopen(f'{url}/', timeout=1):
+                return server
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('the server did not start within 30 seconds')
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=bench_seed.ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    bench_seed.add_volume_arguments(parser)
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--url', help='measure an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--scenarios', nargs='+', help='the scenarios to run, all of them by default')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the request mix')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    mixes = scenarios(args)
+    selected = args.scenarios or list(mixes)
+    unknown = set(selected) - set(mixes)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    report = {
+        'meta': {
+            'started_at': dt.datetime.now(dt.timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': args.database,
+            'volumes': {
+                'products': args.products,
+                'customers': args.customers,
+                'staff': args.staff,
+                'orders': args.orders,
+                'transactions': args.transactions,
+            },
+            'workers': None if args.url else args.workers,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'seed': args.seed,
+        },
+        'results': [],
+    }
+
+    if not args.skip_seed:
+        elapsed = bench_seed.build(args.database, args.products, args.customers, args.staff,
+                                   args.orders, args.transactions)
+        report['meta']['seed_s'] = round(elapsed, 1)
+        print(f'Seeded {args.database} in {elapsed:.1f}s', file=sys.stderr)
+
+    server = None if args.url else start_server(args.database, args.port, args.workers)
+    url = args.url.rstrip('/') if args.url else f'http://127.0.0.1:{args.port}'
+    counter = RoundTripCounter(args.database)
+    report['meta']['round_trip_source'] = counter.source
+    try:
+        for name in selected:
+            for concurrency in args.concurrency:
+                before = counter.read()
+                result = run_load(url, mixes[name], concurrency, args.duration, args.warmup, args.seed)
+                # the counter's own read is part of the delta
+                trips = counter.read() - before - 1
+                sent = result.pop('sent_with_warmup')
+                result['db_round_trips_per_request'] = round(trips / sent, 3) if sent else None
+                result.update(scenario=name, concurrency=concurrency)
+                report['results'].append(result)
+                latency = result['latency_ms']
+                print(f'{name:<14} c={concurrency:<4} {result["throughput_rps"]:>9.1f} req/s  '
+                      f'p50={latency["p50"]:.1f}ms p95={latency["p95"]:.1f}ms p99={latency["p99"]:.1f}ms  '
+                      f'codes={result["status_codes"]}', file=sys.stderr)
+    finally:
+        counter.close()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, dt.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as result_file:
+        json.dump(report, result_file, indent=2)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
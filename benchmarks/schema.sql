@@ -0,0 +1,82 @@
+-- TABLE CREATION
+-- Stand-in for the production schema, with the columns the API reads and writes.
+-- The benchmark suite applies it to an empty database before the scripts/ files
+
+CREATE TABLE hainco_admin(
+    admin_id serial PRIMARY KEY,
+    admin_full_name text NOT NULL,
+    admin_username text NOT NULL,
+    admin_position integer NOT NULL DEFAULT 1,
+    admin_is_active boolean NOT NULL DEFAULT true,
+    admin_password_salt text,
+    admin_password_hash text
+);
+
+CREATE TABLE hainco_product(
+    product_id serial PRIMARY KEY,
+    product_name text NOT NULL,
+    product_price numeric(10, 2) NOT NULL,
+    product_image_link text,
+    product_stock integer NOT NULL DEFAULT 0,
+    product_description text,
+    product_type integer NOT NULL,
+    product_is_active boolean NOT NULL DEFAULT true,
+    product_code text NOT NULL
+);
+
+CREATE TABLE hainco_customer(
+    customer_id serial PRIMARY KEY,
+    customer_first_name text NOT NULL,
+    customer_middle_name text,
+    customer_last_name text NOT NULL,
+    customer_email text NOT NULL,
+    customer_is_active boolean NOT NULL DEFAULT true,
+    customer_password_salt text,
+    customer_password_hash text,
+    customer_contact_number text
+);
+
+CREATE TABLE hainco_staff(
+    staff_id serial PRIMARY KEY,
+    staff_full_name text NOT NULL,
+    staff_contact_number text,
+    staff_username text NOT NULL,
+    staff_password_salt text,
+    staff_password_hash text,
+    staff_address text,
+    staff_position integer NOT NULL,
+    staff_is_active boolean NOT NULL DEFAULT true
+);
+
+CREATE TABLE hainco_transaction(
+    transaction_id serial PRIMARY KEY,
+    transaction_agent text NOT NULL,
+    transaction_description text,
+    transaction_type integer NOT NULL,
+    transaction_amount numeric(10, 2),
+    transaction_date timestamp NOT NULL DEFAULT current_timestamp,
+    transaction_state text
+);
+
+CREATE TABLE hainco_order(
+    order_id serial PRIMARY KEY,
+    order_product_code text NOT NULL,
+    order_customer_email text NOT NULL,
+    order_requests text,
+    order_date timestamp NOT NULL DEFAULT current_timestamp,
+    order_staff_username text,
+    order_status integer NOT NULL DEFAULT 1,
+    order_number serial
+);
+
+CREATE OR REPLACE FUNCTION cnt_rows(schema text, tablename text)
+    RETURNS integer AS
+$$
+DECLARE
+    result integer;
+BEGIN
+    EXECUTE format('SELECT count(1) FROM %I.%I', schema, tablename) INTO result;
+    RETURN result;
+END;
+$$
+LANGUAGE 'plpgsql';
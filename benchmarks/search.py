@@ -0,0 +1,112 @@
+"""
+Latency of GET /product/search over a large catalog
+
+Seed a catalog first, then measure a mix of searches: selective and broad words, word
+prefixes, filters only, and searches combined with filters:
+
+    python -m benchmarks.seed --database hainco_search --products 100000 --customers 100 --orders 100 --transactions 100
+    python -m benchmarks.search --database hainco_search --target-p95 50
+
+Every query of the mix is also checked once through EXPLAIN to use the search index when it
+has search text. Exits with 1 when the p95 latency of a concurrency level misses the target.
+The target is the latency of a single client by default, higher concurrency levels measure
+the cores of the machine as much as the queries
+"""
+import argparse
+import json
+import sys
+import urllib.parse
+
+from benchmarks import seed as bench_seed
+from benchmarks.driver import Request, run_load
+from benchmarks.run import start_server
+from backend.database import queries
+
+# (search text, filters) of the measured mix
+SEARCHES = [
+    ('adobo', {}),
+    ('chick ado', {}),
+    ('spicy sisig', {'in_stock': 'true'}),
+    ('halo', {'product_type': '4', 'is_active': 'true'}),
+    ('mango', {'min_price': '50', 'max_price': '120'}),
+    ('chicken', {}),
+    ('ube turon', {'product_type': ['3', '4']}),
+    ('', {'product_type': '2', 'in_stock': 'true'}),
+    ('', {'min_price': '190'}),
+]
+
+
+def search_path(text: str, filters: dict, limit: int) -> str:
+    params = dict(filters, limit=str(limit))
+    if text:
+        params['q'] = text
+    return '/product/search?' + urllib.parse.urlencode(params, doseq=True)
+
+
+def check_plans(database: str):
+    """
+    Fails when a search with text does not use hainco_product_search_idx
+    """
+    conn = bench_seed.connect(database)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'PREPARE bench_search AS {queries.PRODUCT_SEARCH.sql}')
+            cursor.execute("""EXPLAIN (FORMAT JSON)
+                              EXECUTE bench_search('chick ado', NULL, NULL, false, NULL, NULL)""")
+            plan = json.dumps(cursor.fetchone()[0])
+    finally:
+        conn.close()
+    if 'hainco_product_search_idx' not in plan:
+        raise SystemExit('FAIL: product searches do not use hainco_product_search_idx, '
+                         'apply scripts/create_product_search.sql')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='hainco_search')
+    parser.add_argument('--url', help='use an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=8091)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--limit', type=int, default=20, help='page size of the searches')
+    parser.add_argument('--target-p95', type=float, default=50, help='p95 latency target in milliseconds')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    check_plans(args.database)
+    paths = [search_path(text, filters, args.limit) for text, filters in SEARCHES]
+
+    def make_request(rng):
+        return Request('GET', rng.choice(paths))
+
+    server = None if args.url else start_server(args.database, args.port, args.workers)
+    url = args.url.rstrip('/') if args.url else f'http://127.0.0.1:{args.port}'
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            summary = run_load(url, make_request, concurrency, args.duration, warmup=2)
+            summary['concurrency'] = concurrency
+            results.append(summary)
+            latency = summary['latency_ms']
+            print(f'concurrency {concurrency:>3}: {summary["throughput_rps"]:>8} req/s, p50 {latency["p50"]}ms '
+                  f'p95 {latency["p95"]}ms p99 {latency["p99"]}ms, codes {summary["status_codes"]}')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    failures = [result for result in results
+                if result['latency_ms']['p95'] > args.target_p95 or set(result['status_codes']) != {'200'}]
+    for result in failures:
+        print(f'FAIL: concurrency {result["concurrency"]} p95 {result["latency_ms"]["p95"]}ms '
+              f'(target {args.target_p95}ms), codes {result["status_codes"]}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
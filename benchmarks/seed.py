@@ -0,0 +1,242 @@
+"""
+Creates the benchmark database and fills it with realistic volumes
+
+    python -m benchmarks.seed --products 1000 --customers 100000 --orders 200000 --transactions 1000000
+
+The connection comes from the same DB_* variables as the API, and the database named by
+--database is dropped and created again
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+from psycopg2 import sql as pg_sql
+
+from backend.database.database_operation import connection_params
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# applied in order after the stand-in schema, files that do not exist yet are skipped
+SCRIPTS = [
+    'scripts/create_triggers.sql',
+    'scripts/update_triggers.sql',
+    'scripts/create_indexes.sql',
+    'scripts/create_row_counters.sql',
+    'scripts/alter_admin_password.sql',
+    'scripts/create_sales_rollups.sql',
+    'scripts/create_table_versions.sql',
+    'scripts/create_checkout.sql',
+    'scripts/create_product_search.sql',
+    'scripts/partition_transactions.sql',
+]
+PARTITION_SCRIPT = 'scripts/partition_transactions.sql'
+# applied again once the seeded rows are in, as they backfill from the existing rows
+BACKFILLED_SCRIPTS = ['scripts/create_sales_rollups.sql']
+
+# words the seeded product names and descriptions are made of, so searches find a realistic share
+PRODUCT_DISHES = ['Adobo', 'Sinigang', 'Tinola', 'Kare-Kare', 'Sisig', 'Lumpia', 'Pancit', 'Tapa',
+                  'Longganisa', 'Bistek', 'Menudo', 'Afritada', 'Halo-Halo', 'Turon', 'Leche Flan',
+                  'Puto', 'Bibingka', 'Ensaymada', 'Champorado', 'Arroz Caldo']
+PRODUCT_STYLES = ['Chicken', 'Pork', 'Beef', 'Fish', 'Shrimp', 'Vegetable', 'Spicy', 'Classic',
+                  'Special', 'Mini', 'Family', 'Ube', 'Mango', 'Coconut', 'Garlic', 'Cheesy']
+
+TABLES = [
+    'hainco_admin',
+    'hainco_customer',
+    'hainco_order',
+    'hainco_product',
+    'hainco_staff',
+    'hainco_transaction',
+]
+
+BENCH_ADMIN_USERNAME = 'bench'
+BENCH_ADMIN_PASSWORD = 'bench-password'
+BENCH_PASSWORD = 'password'
+
+
+def connect(database: str | None = None):
+    params = connection_params()
+    if database is not None:
+        params['database'] = database
+    return psycopg2.connect(**params)
+
+
+def recreate_database(database: str):
+    conn = connect()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(pg_sql.SQL('DROP DATABASE IF EXISTS {}').format(pg_sql.Identifier(database)))
+        cursor.execute(pg_sql.SQL('CREATE DATABASE {}').format(pg_sql.Identifier(database)))
+    conn.close()
+
+
+def apply_schema(conn, partitioned: bool = True):
+    scripts = [path for path in SCRIPTS if partitioned or path != PARTITION_SCRIPT]
+    apply_scripts(conn, [os.path.join(ROOT, 'benchmarks', 'schema.sql')] + [os.path.join(ROOT, path) for path in scripts])
+
+
+def apply_scripts(conn, paths: list[str]):
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as script, conn.cursor() as cursor:
+            cursor.execute(script.read())
+        conn.commit()
+
+
+def seed(conn, products: int, customers: int, staff: int, orders: int, transactions: int):
+    """
+    Fills the tables with generated rows. The logging triggers are switched off while seeding
+    so the volumes of every table are exactly the ones asked for
+    """
+    from backend.database.security import create_salt, encrypt_password
+    from backend.operations.verification import hash_password
+
+    salt = create_salt()
+    encrypted = encrypt_password(BENCH_PASSWORD, salt)
+    admin_salt = create_salt()
+
+    with conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(pg_sql.SQL('ALTER TABLE {} DISABLE TRIGGER USER').format(pg_sql.Identifier(table)))
+
+        cursor.execute("""INSERT INTO hainco_admin(
+                            admin_full_name, admin_username, admin_position, admin_is_active,
+                            admin_password_salt, admin_password_hash)
+                          VALUES ('Benchmark Admin', %s, 1, true, %s, %s)""",
+                       (BENCH_ADMIN_USERNAME, admin_salt, encrypt_password(BENCH_ADMIN_PASSWORD, admin_salt)))
+        cursor.execute("""SELECT EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_name = 'hainco_admin' AND column_name = 'admin_password_argon2')""")
+        if cursor.fetchone()[0]:
+            cursor.execute('UPDATE hainco_admin SET admin_password_argon2 = %s WHERE admin_username = %s',
+                           (hash_password(BENCH_ADMIN_PASSWORD), BENCH_ADMIN_USERNAME))
+
+        cursor.execute("""INSERT INTO hainco_product(
+                            product_name, product_price, product_image_link, product_stock,
+                            product_description, product_type, product_is_active, product_code)
+                          SELECT
+                            style || ' ' || dish || ' ' || g,
+                            round((20 + random() * 180)::numeric, 2),
+                            'https://example.com/products/' || g || '.png',
+                            (random() * 200)::int,
+                            lower(style) || ' ' || lower(dish),
+                            1 + g %% 4,
+                            g %% 10 <> 0,
+                            'P' || lpad(g::text, 6, '0')
+                          FROM generate_series(1, %s) AS g,
+                            LATERAL (SELECT (%s::text[])[1 + g %% %s] AS style,
+                                            (%s::text[])[1 + (g / %s) %% %s] AS dish) AS words""",
+                       (products, PRODUCT_STYLES, len(PRODUCT_STYLES),
+                        PRODUCT_DISHES, len(PRODUCT_STYLES), len(PRODUCT_DISHES)))
+
+        cursor.execute("""INSERT INTO hainco_customer(
+                            customer_first_name, customer_middle_name, customer_last_name,
+                            customer_email, customer_is_active, customer_password_salt,
+                            customer_password_hash, customer_contact_number)
+                          SELECT
+                            'First' || g, NULL, 'Last' || g,
+                            'customer' || g || '@example.com', true, %s, %s,
+                            '09' || lpad(g::text, 9, '0')
+                          FROM generate_series(1, %s) AS g""", (salt, encrypted, customers))
+
+        cursor.execute("""INSERT INTO hainco_staff(
+                            staff_full_name, staff_contact_number, staff_username,
+                            staff_password_salt, staff_password_hash, staff_position, staff_is_active)
+                          SELECT
+                            'Staff ' || g, '09' || lpad(g::text, 9, '0'), 'staff' || g,
+                            %s, %s, 1 + g %% 3, true
+                          FROM generate_series(1, %s) AS g""", (salt, encrypted, staff))
+
+        cursor.execute("""INSERT INTO hainco_order(
+                            order_product_code, order_customer_email, order_requests,
+                            order_date, order_staff_username, order_status)
+                          SELECT
+                            'P' || lpad((1 + (random() * (%s - 1))::int)::text, 6, '0'),
+                            'customer' || (1 + (random() * (%s - 1))::int) || '@example.com',
+                            CASE WHEN g %% 5 = 0 THEN 'No onions' ELSE '' END,
+                            now() - random() * interval '180 days',
+                            'staff' || (1 + (random() * (%s - 1))::int),
+                            1 + g %% 3
+                          FROM generate_series(1, %s) AS g""", (products, customers, staff, orders))
+
+        cursor.execute("""INSERT INTO hainco_transaction(
+                            transaction_agent, transaction_description, transaction_amount,
+                            transaction_type, transaction_date, transaction_state)
+                          SELECT
+                            (ARRAY['CUSTOMER', 'STAFF', 'ADMIN'])[1 + g %% 3],
+                            'Generated transaction ' || g,
+                            CASE WHEN g %% 3 = 2 THEN NULL ELSE round((20 + random() * 500)::numeric, 2) END,
+                            1 + g %% 3,
+                            now() - random() * interval '365 days',
+                            'ADD RECORD'
+                          FROM generate_series(1, %s) AS g""", (transactions,))
+
+        for table in TABLES:
+            cursor.execute(pg_sql.SQL('ALTER TABLE {} ENABLE TRIGGER USER').format(pg_sql.Identifier(table)))
+
+        # the seeded months went to the default partition, they are moved to their own like the
+        # workers do on start
+        cursor.execute("SELECT to_regproc('create_transaction_partitions') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute('SELECT create_transaction_partitions(3)')
+
+        # the counters were bypassed together with the other triggers
+        cursor.execute("SELECT to_regclass('hainco_row_count') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute('DELETE FROM hainco_row_count')
+            for table in TABLES:
+                cursor.execute(pg_sql.SQL("""INSERT INTO hainco_row_count(table_name, row_count)
+                                             SELECT %s, count(*) FROM {}""").format(
+                    pg_sql.Identifier(table)), (table,))
+    conn.commit()
+    apply_scripts(conn, [os.path.join(ROOT, path) for path in BACKFILLED_SCRIPTS])
+
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute('VACUUM ANALYZE')
+    conn.autocommit = False
+
+
+def build(database: str, products: int, customers: int, staff: int, orders: int, transactions: int,
+          partitioned: bool = True) -> float:
+    """
+    Creates and seeds the benchmark database, with hainco_transaction partitioned by month like
+    production unless partitioned is False
+
+    :return: Returns the seconds it took
+    """
+    started = time.perf_counter()
+    recreate_database(database)
+    conn = connect(database)
+    try:
+        apply_schema(conn, partitioned)
+        seed(conn, products, customers, staff, orders, transactions)
+    finally:
+        conn.close()
+    return time.perf_counter() - started
+
+
+def add_volume_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--database', default='hainco_bench')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--staff', type=int, default=20)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--transactions', type=int, default=1000000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_arguments(parser)
+    parser.add_argument('--unpartitioned', action='store_true',
+                        help=f'leave out {PARTITION_SCRIPT}, to compare against a single table')
+    args = parser.parse_args()
+    elapsed = build(args.database, args.products, args.customers, args.staff, args.orders, args.transactions,
+                    not args.unpartitioned)
+    print(f'Seeded {args.database} in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+CPU spent encoding list responses, default FastAPI path against the orjson rows path
+
+Fetches rows of the large list endpoints from the benchmark database once, then encodes
+them repeatedly both ways and reports the CPU time per response:
+
+    python -m benchmarks.serialization --rows 100 1000 10000 --repeat 20
+
+The default path is the one FastAPI takes for the endpoints: dict(record) for every row,
+jsonable_encoder, then json.dumps in JSONResponse. The rows path hands the asyncpg records
+to serialization.RowsResponse. Both bodies are checked to be byte for byte the same
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.database.database_operation import connection_params
+from backend.database.serialization import RowsResponse
+
+# the SELECT lists of GET /transaction, /order and /product
+QUERIES = {
+    'transaction': """SELECT
+                        transaction_id,
+                        transaction_agent,
+                        transaction_description,
+                        transaction_type,
+                        transaction_amount,
+                        transaction_date
+                        FROM hainco_transaction
+                        ORDER BY transaction_id
+                        LIMIT $1""",
+    'order': """SELECT
+                        order_id,
+                        order_product_code,
+                        order_customer_email,
+                        order_requests,
+                        order_date,
+                        order_staff_username,
+                        order_status,
+                        order_number
+                        FROM hainco_order
+                        ORDER BY order_id
+                        LIMIT $1""",
+    'product': """SELECT
+                        product_id,
+                        product_name,
+                        product_price,
+                        product_image_link,
+                        product_stock,
+                        product_description,
+                        product_type,
+                        product_is_active,
+                        product_code
+                        FROM hainco_product
+                        ORDER BY product_id
+                        LIMIT $1""",
+}
+
+
+def default_path(records: list) -> bytes:
+    return JSONResponse(jsonable_encoder([dict(record) for record in records])).body
+
+
+def rows_path(records: list) -> bytes:
+    return RowsResponse(records).body
+
+
+def cpu_per_response(encode, records: list, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        encode(records)
+    return (time.process_time() - started) / repeat
+
+
+async def fetch(database: str, query: str, rows: int) -> list:
+    params = connection_params()
+    conn = await asyncpg.connect(
+        host=params['host'],
+        port=int(params['port']),
+        user=params['user'],
+        password=params['password'],
+        database=database,
+    )
+    try:
+        return await conn.fetch(query, rows)
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='hainco_bench')
+    parser.add_argument('--endpoints', nargs='+', choices=sorted(QUERIES), default=['transaction', 'order'])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"endpoint":<12} {"rows":>7} {"bytes":>10} {"default ms":>11} {"rows ms":>9} {"speedup":>8}')
+    for endpoint in args.endpoints:
+        for rows in args.rows:
+            records = asyncio.run(fetch(args.database, QUERIES[endpoint], rows))
+            body = default_path(records)
+            if rows_path(records) != body:
+                raise SystemExit(f'{endpoint}: the rows path does not give the same JSON as the default path')
+            default_cpu = cpu_per_response(default_path, records, args.repeat)
+            rows_cpu = cpu_per_response(rows_path, records, args.repeat)
+            result = {
+                'endpoint': endpoint,
+                'rows': len(records),
+                'bytes': len(body),
+                'default_cpu_ms': round(default_cpu * 1000, 3),
+                'rows_cpu_ms': round(rows_cpu * 1000, 3),
+                'speedup': round(default_cpu / rows_cpu, 1) if rows_cpu else None,
+            }
+            results.append(result)
+            print(f'{endpoint:<12} {result["rows"]:>7} {result["bytes"]:>10} {result["default_cpu_ms"]:>11}'
+                  f' {result["rows_cpu_ms"]:>9} {result["speedup"]:>7}x')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import os
+import shutil
+import tempfile
+
+# === PROMETHEUS MULTIPROCESS MODE ===
+# the workers share their metrics through files in this directory, it has to be set
+# before prometheus_client is imported and emptied whenever the server starts
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'hainco-prometheus'))
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,6 @@
+-- COLUMN CREATION
+-- One way argon2 hash of the admin password used by POST /token. Existing admins
+-- get it filled in the first time they log in after this change
+
+ALTER TABLE hainco_admin
+    ADD COLUMN IF NOT EXISTS admin_password_argon2 text;
@@ -0,0 +1,120 @@
+-- CHECKOUT
+-- place_order places every line of a cart with a single call, in the transaction of the caller:
+-- it locks the ordered products, checks their stock, takes the ordered quantities off
+-- product_stock and inserts one hainco_order row per unit. When a product is unknown or
+-- inactive, nothing is changed and SQLSTATE HC002 is raised, with the codes of those products
+-- listed as JSON in its DETAIL. When a product is short, nothing is changed and SQLSTATE HC001
+-- is raised, with the short products listed as JSON in its DETAIL
+-- Products are locked in product_code order so concurrent carts never deadlock, and the stock
+-- is checked once before locking too, so carts of a sold out product are refused without
+-- queueing for its lock. Until it commits a cart also holds the rows it writes through the
+-- triggers of the other scripts: the version of hainco_product (create_table_versions.sql),
+-- the counters of hainco_order and hainco_transaction (create_row_counters.sql) and the
+-- rollups of the day (create_sales_rollups.sql). Those are split over 16 shards picked by the
+-- backend pid, so a cart waits for the carts sharing one of its products and, rarely, for one
+-- of a session on the same shard. The hainco_changes notifications of the log triggers still
+-- make the commits of every notifying transaction, carts included, take turns
+-- Requires update_triggers.sql, whose log_update_product leaves the stock reservation to the
+-- order log instead of logging it as a product update
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION checkout_shortage(product_codes text[], quantities integer[])
+    RETURNS json AS
+$$
+    SELECT json_agg(json_build_object(
+            'product_code', wanted.product_code,
+            'requested', wanted.quantity,
+            'available', COALESCE(hainco_product.product_stock, 0)
+        ) ORDER BY wanted.product_code)
+        FROM (
+            SELECT line.product_code, sum(line.quantity) AS quantity
+            FROM unnest(product_codes, quantities) AS line(product_code, quantity)
+            GROUP BY line.product_code
+        ) AS wanted
+        LEFT JOIN hainco_product
+            ON hainco_product.product_code = wanted.product_code
+            AND hainco_product.product_is_active
+        WHERE COALESCE(hainco_product.product_stock, 0) < wanted.quantity;
+$$
+LANGUAGE 'sql' STABLE;
+
+CREATE OR REPLACE FUNCTION checkout_unavailable(product_codes text[])
+    RETURNS json AS
+$$
+    SELECT json_agg(DISTINCT wanted.product_code ORDER BY wanted.product_code)
+        FROM unnest(product_codes) AS wanted(product_code)
+        LEFT JOIN hainco_product
+            ON hainco_product.product_code = wanted.product_code
+        WHERE NOT COALESCE(hainco_product.product_is_active, false);
+$$
+LANGUAGE 'sql' STABLE;
+
+CREATE OR REPLACE FUNCTION place_order(
+    customer_email text,
+    staff_username text,
+    initial_status integer,
+    placed_at timestamp,
+    product_codes text[],
+    quantities integer[],
+    line_requests text[]
+)
+    RETURNS SETOF hainco_order AS
+$$
+DECLARE
+    unavailable json;
+    shortage json;
+BEGIN
+    unavailable := checkout_unavailable(product_codes);
+    IF unavailable IS NULL THEN
+        shortage := checkout_shortage(product_codes, quantities);
+    END IF;
+    IF unavailable IS NULL AND shortage IS NULL THEN
+        PERFORM 1
+            FROM hainco_product
+            WHERE product_code = ANY(product_codes)
+            ORDER BY product_code
+            FOR UPDATE;
+        -- the products may have been deactivated or their stock taken while waiting for the locks
+        unavailable := checkout_unavailable(product_codes);
+        shortage := checkout_shortage(product_codes, quantities);
+    END IF;
+
+    IF unavailable IS NOT NULL THEN
+        RAISE EXCEPTION 'Unavailable products' USING ERRCODE = 'HC002', DETAIL = unavailable::text;
+    END IF;
+    IF shortage IS NOT NULL THEN
+        RAISE EXCEPTION 'Insufficient stock' USING ERRCODE = 'HC001', DETAIL = shortage::text;
+    END IF;
+
+    PERFORM set_config('hainco.stock_reservation', 'on', true);
+    UPDATE hainco_product
+        SET product_stock = hainco_product.product_stock - wanted.quantity
+        FROM (
+            SELECT line.product_code, sum(line.quantity) AS quantity
+            FROM unnest(product_codes, quantities) AS line(product_code, quantity)
+            GROUP BY line.product_code
+        ) AS wanted
+        WHERE hainco_product.product_code = wanted.product_code;
+    PERFORM set_config('hainco.stock_reservation', 'off', true);
+
+    RETURN QUERY
+        INSERT INTO hainco_order(
+            order_product_code,
+            order_customer_email,
+            order_requests,
+            order_date,
+            order_staff_username,
+            order_status
+        )
+            SELECT line.product_code, customer_email, line.request, placed_at, staff_username, initial_status
+            FROM unnest(product_codes, quantities, line_requests)
+                WITH ORDINALITY AS line(product_code, quantity, request, position)
+            CROSS JOIN generate_series(1, line.quantity)
+            ORDER BY line.position
+        RETURNING *;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+COMMIT;
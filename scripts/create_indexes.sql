@@ -0,0 +1,35 @@
+-- INDEX CREATION
+-- Unique indexes on the natural keys used by the single record lookups,
+-- existence checks and updates of the API
+
+CREATE UNIQUE INDEX IF NOT EXISTS hainco_product_product_code_key
+    ON hainco_product (product_code);
+
+CREATE UNIQUE INDEX IF NOT EXISTS hainco_staff_staff_username_key
+    ON hainco_staff (staff_username);
+
+CREATE UNIQUE INDEX IF NOT EXISTS hainco_customer_customer_email_key
+    ON hainco_customer (customer_email);
+
+CREATE UNIQUE INDEX IF NOT EXISTS hainco_admin_admin_username_key
+    ON hainco_admin (admin_username);
+
+CREATE UNIQUE INDEX IF NOT EXISTS hainco_order_order_number_key
+    ON hainco_order (order_number);
+
+-- Keyset pagination of GET /transaction, newest first
+CREATE INDEX IF NOT EXISTS hainco_transaction_date_id_idx
+    ON hainco_transaction (transaction_date DESC, transaction_id DESC);
+
+-- Filters of GET /transaction and /transaction/export, each in the keyset order of the lists
+CREATE INDEX IF NOT EXISTS hainco_transaction_agent_date_idx
+    ON hainco_transaction (transaction_agent, transaction_date DESC, transaction_id DESC);
+
+CREATE INDEX IF NOT EXISTS hainco_transaction_type_date_idx
+    ON hainco_transaction (transaction_type, transaction_date DESC, transaction_id DESC);
+
+-- Order history of GET /customer/{email}/orders, newest first. Holds every order column the
+-- endpoint lists, so a customer's orders are read from the index without visiting the table
+CREATE INDEX IF NOT EXISTS hainco_order_customer_date_idx
+    ON hainco_order (order_customer_email, order_date DESC, order_id DESC)
+    INCLUDE (order_number, order_status, order_product_code);
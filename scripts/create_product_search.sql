@@ -0,0 +1,36 @@
+-- PRODUCT SEARCH
+-- Full text search of the products behind GET /product/search. Every word typed matches the
+-- words of the name or description starting with it, so 'chick ado' finds 'Chicken Adobo',
+-- and matches in the name rank above matches in the description.
+-- Uses the 'simple' configuration, which lowercases words without stemming them, as product
+-- names are mostly proper and Filipino dish names
+-- The document is kept in the stored column product_search, so ranking and rechecking the
+-- matches reads it instead of parsing the name and description of every matching row again
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION product_document(product_name text, product_description text)
+    RETURNS tsvector AS
+$$
+    SELECT setweight(to_tsvector('simple'::regconfig, coalesce(product_name, '')), 'A')
+        || setweight(to_tsvector('simple'::regconfig, coalesce(product_description, '')), 'B');
+$$
+LANGUAGE 'sql' IMMUTABLE PARALLEL SAFE;
+
+-- the words of the search text as prefixes that must all match, NULL when it has no words
+CREATE OR REPLACE FUNCTION product_search_query(search text)
+    RETURNS tsquery AS
+$$
+    SELECT to_tsquery('simple'::regconfig, string_agg(quote_literal(word.lexeme) || ':*', ' & '))
+        FROM unnest(to_tsvector('simple'::regconfig, coalesce(search, ''))) AS word;
+$$
+LANGUAGE 'sql' IMMUTABLE PARALLEL SAFE;
+
+ALTER TABLE hainco_product
+    ADD COLUMN IF NOT EXISTS product_search tsvector
+        GENERATED ALWAYS AS (product_document(product_name, product_description)) STORED;
+
+CREATE INDEX IF NOT EXISTS hainco_product_search_idx
+    ON hainco_product USING gin (product_search);
+
+COMMIT;
@@ -0,0 +1,148 @@
+-- ROW COUNTERS
+-- Keeps the row count of every API table in hainco_row_count so GET /meta/row_count
+-- does not count(*) the tables. The counters are updated by statement level triggers,
+-- once per INSERT or DELETE statement no matter how many rows it touched
+-- The count of a table is split over up to 16 shards, picked by the backend pid of the writing
+-- session, and read as their sum. A counter row stays locked until its writer commits, with a
+-- single row per table every order placed would wait for the previous one to commit
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS hainco_row_count(
+    table_name text NOT NULL,
+    shard integer NOT NULL DEFAULT 0,
+    row_count bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, shard)
+);
+
+-- the counters created before the shards keep their count in shard 0
+ALTER TABLE hainco_row_count ADD COLUMN IF NOT EXISTS shard integer NOT NULL DEFAULT 0;
+ALTER TABLE hainco_row_count
+    DROP CONSTRAINT IF EXISTS hainco_row_count_pkey,
+    ADD PRIMARY KEY (table_name, shard);
+
+CREATE OR REPLACE FUNCTION count_inserted_rows()
+    RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO hainco_row_count(table_name, shard, row_count)
+        SELECT TG_TABLE_NAME, pg_backend_pid() % 16, count(*) FROM new_rows
+    ON CONFLICT (table_name, shard) DO UPDATE
+        SET row_count = hainco_row_count.row_count + EXCLUDED.row_count;
+    RETURN NULL;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+CREATE OR REPLACE FUNCTION count_deleted_rows()
+    RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO hainco_row_count(table_name, shard, row_count)
+        SELECT TG_TABLE_NAME, pg_backend_pid() % 16, -count(*) FROM old_rows
+    ON CONFLICT (table_name, shard) DO UPDATE
+        SET row_count = hainco_row_count.row_count + EXCLUDED.row_count;
+    RETURN NULL;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+-- block writes while the counters are seeded so no row is missed or counted twice
+LOCK TABLE hainco_admin, hainco_customer, hainco_order, hainco_product, hainco_staff, hainco_transaction
+    IN SHARE ROW EXCLUSIVE MODE;
+
+DELETE FROM hainco_row_count;
+
+INSERT INTO hainco_row_count(table_name, row_count)
+    SELECT 'hainco_admin', count(*) FROM hainco_admin
+    UNION ALL SELECT 'hainco_customer', count(*) FROM hainco_customer
+    UNION ALL SELECT 'hainco_order', count(*) FROM hainco_order
+    UNION ALL SELECT 'hainco_product', count(*) FROM hainco_product
+    UNION ALL SELECT 'hainco_staff', count(*) FROM hainco_staff
+    UNION ALL SELECT 'hainco_transaction', count(*) FROM hainco_transaction;
+
+DROP TRIGGER IF EXISTS count_new_admin ON hainco_admin;
+CREATE TRIGGER count_new_admin
+    AFTER INSERT ON hainco_admin
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_inserted_rows();
+
+DROP TRIGGER IF EXISTS count_deleted_admin ON hainco_admin;
+CREATE TRIGGER count_deleted_admin
+    AFTER DELETE ON hainco_admin
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_deleted_rows();
+
+DROP TRIGGER IF EXISTS count_new_customer ON hainco_customer;
+CREATE TRIGGER count_new_customer
+    AFTER INSERT ON hainco_customer
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_inserted_rows();
+
+DROP TRIGGER IF EXISTS count_deleted_customer ON hainco_customer;
+CREATE TRIGGER count_deleted_customer
+    AFTER DELETE ON hainco_customer
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_deleted_rows();
+
+DROP TRIGGER IF EXISTS count_new_order ON hainco_order;
+CREATE TRIGGER count_new_order
+    AFTER INSERT ON hainco_order
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_inserted_rows();
+
+DROP TRIGGER IF EXISTS count_deleted_order ON hainco_order;
+CREATE TRIGGER count_deleted_order
+    AFTER DELETE ON hainco_order
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_deleted_rows();
+
+DROP TRIGGER IF EXISTS count_new_product ON hainco_product;
+CREATE TRIGGER count_new_product
+    AFTER INSERT ON hainco_product
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_inserted_rows();
+
+DROP TRIGGER IF EXISTS count_deleted_product ON hainco_product;
+CREATE TRIGGER count_deleted_product
+    AFTER DELETE ON hainco_product
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_deleted_rows();
+
+DROP TRIGGER IF EXISTS count_new_staff ON hainco_staff;
+CREATE TRIGGER count_new_staff
+    AFTER INSERT ON hainco_staff
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_inserted_rows();
+
+DROP TRIGGER IF EXISTS count_deleted_staff ON hainco_staff;
+CREATE TRIGGER count_deleted_staff
+    AFTER DELETE ON hainco_staff
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_deleted_rows();
+
+DROP TRIGGER IF EXISTS count_new_transaction ON hainco_transaction;
+CREATE TRIGGER count_new_transaction
+    AFTER INSERT ON hainco_transaction
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_inserted_rows();
+
+DROP TRIGGER IF EXISTS count_deleted_transaction ON hainco_transaction;
+CREATE TRIGGER count_deleted_transaction
+    AFTER DELETE ON hainco_transaction
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE count_deleted_rows();
+
+COMMIT;
@@ -0,0 +1,143 @@
+-- SALES ROLLUPS
+-- Keeps daily totals in hainco_sales_rollup so GET /report/sales answers any RecordInterval
+-- without reading hainco_transaction. The rows are updated by statement level triggers:
+--   transactions add to the 'total' and 'transaction_type' dimensions
+--   orders add to the 'product' and 'staff' dimensions, priced like log_add_order does
+-- Transactions and orders are treated as append only, deleting them does not update the rollups
+-- The totals of a day are split over up to 16 shards, picked by the backend pid of the writing
+-- session, and added up when read. A rollup row stays locked until its writer commits, with a
+-- single 'total' row per day every order placed would wait for the previous one to commit
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS hainco_sales_rollup(
+    dimension text NOT NULL,
+    rollup_date date NOT NULL,
+    dimension_key text NOT NULL,
+    transaction_amount numeric(14, 2) NOT NULL DEFAULT 0,
+    transaction_count bigint NOT NULL DEFAULT 0,
+    order_count bigint NOT NULL DEFAULT 0,
+    shard integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, rollup_date, dimension_key, shard)
+);
+
+-- the rollups created before the shards are backfilled again below, into shard 0
+ALTER TABLE hainco_sales_rollup ADD COLUMN IF NOT EXISTS shard integer NOT NULL DEFAULT 0;
+ALTER TABLE hainco_sales_rollup
+    DROP CONSTRAINT IF EXISTS hainco_sales_rollup_pkey,
+    ADD PRIMARY KEY (dimension, rollup_date, dimension_key, shard);
+
+CREATE OR REPLACE FUNCTION rollup_new_transactions()
+    RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO hainco_sales_rollup(
+        dimension, rollup_date, dimension_key, transaction_amount, transaction_count, order_count, shard
+    )
+        SELECT
+            dimension,
+            transaction_date::date,
+            dimension_key,
+            COALESCE(sum(transaction_amount), 0),
+            count(*),
+            count(*) FILTER (WHERE transaction_type = 1),
+            pg_backend_pid() % 16
+        FROM new_rows
+        CROSS JOIN LATERAL (
+            VALUES ('total', ''), ('transaction_type', transaction_type::text)
+        ) AS dimensions(dimension, dimension_key)
+        GROUP BY dimension, transaction_date::date, dimension_key
+    ON CONFLICT (dimension, rollup_date, dimension_key, shard) DO UPDATE
+        SET transaction_amount = hainco_sales_rollup.transaction_amount + EXCLUDED.transaction_amount,
+            transaction_count = hainco_sales_rollup.transaction_count + EXCLUDED.transaction_count,
+            order_count = hainco_sales_rollup.order_count + EXCLUDED.order_count;
+    RETURN NULL;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+CREATE OR REPLACE FUNCTION rollup_new_orders()
+    RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO hainco_sales_rollup(
+        dimension, rollup_date, dimension_key, transaction_amount, transaction_count, order_count, shard
+    )
+        SELECT
+            dimension,
+            new_rows.order_date::date,
+            dimension_key,
+            COALESCE(sum(hainco_product.product_price), 0),
+            count(*),
+            count(*),
+            pg_backend_pid() % 16
+        FROM new_rows
+        LEFT JOIN hainco_product ON hainco_product.product_code = new_rows.order_product_code
+        CROSS JOIN LATERAL (
+            VALUES ('product', new_rows.order_product_code),
+                   ('staff', COALESCE(new_rows.order_staff_username, ''))
+        ) AS dimensions(dimension, dimension_key)
+        GROUP BY dimension, new_rows.order_date::date, dimension_key
+    ON CONFLICT (dimension, rollup_date, dimension_key, shard) DO UPDATE
+        SET transaction_amount = hainco_sales_rollup.transaction_amount + EXCLUDED.transaction_amount,
+            transaction_count = hainco_sales_rollup.transaction_count + EXCLUDED.transaction_count,
+            order_count = hainco_sales_rollup.order_count + EXCLUDED.order_count;
+    RETURN NULL;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+-- block writes while the rollups are backfilled so no row is missed or added twice
+LOCK TABLE hainco_transaction, hainco_order IN SHARE ROW EXCLUSIVE MODE;
+
+DELETE FROM hainco_sales_rollup;
+
+INSERT INTO hainco_sales_rollup(
+    dimension, rollup_date, dimension_key, transaction_amount, transaction_count, order_count
+)
+    SELECT
+        dimension,
+        transaction_date::date,
+        dimension_key,
+        COALESCE(sum(transaction_amount), 0),
+        count(*),
+        count(*) FILTER (WHERE transaction_type = 1)
+    FROM hainco_transaction
+    CROSS JOIN LATERAL (
+        VALUES ('total', ''), ('transaction_type', transaction_type::text)
+    ) AS dimensions(dimension, dimension_key)
+    GROUP BY dimension, transaction_date::date, dimension_key;
+
+INSERT INTO hainco_sales_rollup(
+    dimension, rollup_date, dimension_key, transaction_amount, transaction_count, order_count
+)
+    SELECT
+        dimension,
+        hainco_order.order_date::date,
+        dimension_key,
+        COALESCE(sum(hainco_product.product_price), 0),
+        count(*),
+        count(*)
+    FROM hainco_order
+    LEFT JOIN hainco_product ON hainco_product.product_code = hainco_order.order_product_code
+    CROSS JOIN LATERAL (
+        VALUES ('product', hainco_order.order_product_code),
+               ('staff', COALESCE(hainco_order.order_staff_username, ''))
+    ) AS dimensions(dimension, dimension_key)
+    GROUP BY dimension, hainco_order.order_date::date, dimension_key;
+
+DROP TRIGGER IF EXISTS rollup_transaction ON hainco_transaction;
+CREATE TRIGGER rollup_transaction
+    AFTER INSERT ON hainco_transaction
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE rollup_new_transactions();
+
+DROP TRIGGER IF EXISTS rollup_order ON hainco_order;
+CREATE TRIGGER rollup_order
+    AFTER INSERT ON hainco_order
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE rollup_new_orders();
+
+COMMIT;
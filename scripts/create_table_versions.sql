@@ -0,0 +1,74 @@
+-- TABLE VERSIONS
+-- Keeps a version and last modification time of the tables served with ETags in
+-- hainco_table_version, so GET /product, /staff and /admin answer If-None-Match and
+-- If-Modified-Since without reading the tables. The rows are updated by statement level
+-- triggers in the writing transaction, so a new version is only visible once the write is.
+-- A version row stays locked until its writer commits, so the version of a table is split over
+-- up to 16 shards, picked by the backend pid of the writing session, instead of making every
+-- write of the table (every order placed takes stock off hainco_product) wait for the previous
+-- one to commit. Shard versions are microseconds since the epoch and only go up, the version of
+-- the table is their sum, which changes with every committed write. Its modification time is
+-- the latest of the shards, a write committing after one that started later leaves it as is,
+-- that is why the ETag is the validator to rely on
+-- Every write statement also notifies the API workers on the hainco_changes channel, deletes
+-- and truncates included, so they keep the versions cached until the next notification
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS hainco_table_version(
+    table_name text NOT NULL,
+    shard integer NOT NULL DEFAULT 0,
+    version bigint NOT NULL,
+    modified_at timestamptz NOT NULL,
+    PRIMARY KEY (table_name, shard)
+);
+
+-- the versions created before the shards become shard 0
+ALTER TABLE hainco_table_version ADD COLUMN IF NOT EXISTS shard integer NOT NULL DEFAULT 0;
+ALTER TABLE hainco_table_version
+    DROP CONSTRAINT IF EXISTS hainco_table_version_pkey,
+    ADD PRIMARY KEY (table_name, shard);
+
+CREATE OR REPLACE FUNCTION bump_table_version()
+    RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO hainco_table_version(table_name, shard, version, modified_at)
+        VALUES (TG_TABLE_NAME, pg_backend_pid() % 16, (extract(epoch FROM clock_timestamp()) * 1000000)::bigint,
+                clock_timestamp())
+    ON CONFLICT (table_name, shard) DO UPDATE
+        SET version = greatest(hainco_table_version.version + 1, EXCLUDED.version),
+            modified_at = EXCLUDED.modified_at;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP
+    )::text);
+    RETURN NULL;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+INSERT INTO hainco_table_version(table_name, version, modified_at)
+    SELECT table_name, (extract(epoch FROM clock_timestamp()) * 1000000)::bigint, clock_timestamp()
+    FROM (VALUES ('hainco_admin'), ('hainco_product'), ('hainco_staff')) AS versioned(table_name)
+ON CONFLICT (table_name, shard) DO NOTHING;
+
+DROP TRIGGER IF EXISTS version_admin ON hainco_admin;
+CREATE TRIGGER version_admin
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hainco_admin
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE bump_table_version();
+
+DROP TRIGGER IF EXISTS version_product ON hainco_product;
+CREATE TRIGGER version_product
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hainco_product
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE bump_table_version();
+
+DROP TRIGGER IF EXISTS version_staff ON hainco_staff;
+CREATE TRIGGER version_staff
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hainco_staff
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE bump_table_version();
+
+COMMIT;
@@ -1,23 +1,36 @@
 -- PROCEDURE CREATION
+-- every function also notifies the API workers on the hainco_changes channel,
+-- re-run the CREATE OR REPLACE FUNCTION statements to update existing databases.
+-- Sessions with hainco.audit_mode = 'batched' (the API with AUDIT_MODE=batched) skip the
+-- insert into hainco_transaction, their entries are written by backend/operations/audit.py
+-- pg_notify fails the write when the payload is 8000 bytes or more, so the order row is only
+-- sent while it stays well under, the listeners read the longer ones by their key
 
 -- -- EXECUTED ALREADY
 CREATE OR REPLACE FUNCTION log_add_admin()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN',
-        CONCAT('Added new admin: ', NEW.admin_full_name),
-        3,
-        current_timestamp,
-        'ADD RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN',
+            CONCAT('Added new admin: ', NEW.admin_full_name),
+            3,
+            current_timestamp,
+            'ADD RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.admin_username
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -28,19 +41,26 @@ CREATE OR REPLACE FUNCTION log_add_product()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN/STAFF',
-        CONCAT('Added new product: ', NEW.product_name, ' with code: ', NEW.product_code),
-        3,
-        current_timestamp,
-        'ADD RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN/STAFF',
+            CONCAT('Added new product: ', NEW.product_name, ' with code: ', NEW.product_code),
+            3,
+            current_timestamp,
+            'ADD RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.product_code
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -51,19 +71,26 @@ CREATE OR REPLACE FUNCTION log_add_customer()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN/CUSTOMER',
-        CONCAT('Added new customer with email: ', NEW.customer_email),
-        3,
-        current_timestamp,
-        'ADD RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN/CUSTOMER',
+            CONCAT('Added new customer with email: ', NEW.customer_email),
+            3,
+            current_timestamp,
+            'ADD RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.customer_email
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -74,19 +101,26 @@ CREATE OR REPLACE FUNCTION log_add_staff()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN',
-        CONCAT('Added new staff with username: ', NEW.staff_username),
-        3,
-        current_timestamp,
-        'ADD RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN',
+            CONCAT('Added new staff with username: ', NEW.staff_username),
+            3,
+            current_timestamp,
+            'ADD RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.staff_username
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -97,26 +131,36 @@ CREATE OR REPLACE FUNCTION log_add_order()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_amount,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'CUSTOMER',
-        CONCAT('New Order by: ', NEW.order_customer_email, ' ordering: ', NEW.order_product_code),
-        (
-            SELECT
-                product_price
-            FROM hainco_product
-            WHERE product_code = NEW.order_product_code
-        ),
-        1,
-        current_timestamp,
-        'ADD RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_amount,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'CUSTOMER',
+            CONCAT('New Order by: ', NEW.order_customer_email, ' ordering: ', NEW.order_product_code),
+            (
+                SELECT
+                    product_price
+                FROM hainco_product
+                WHERE product_code = NEW.order_product_code
+            ),
+            1,
+            current_timestamp,
+            'ADD RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.order_number,
+        'id', (extract(epoch FROM clock_timestamp()) * 1000000)::bigint,
+        'status', NEW.order_status,
+        'row', CASE WHEN octet_length(row_to_json(NEW)::text) < 7000 THEN row_to_json(NEW) END
+    )::text);
     RETURN NEW;
 END
 $$
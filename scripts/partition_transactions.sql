@@ -0,0 +1,187 @@
+-- TRANSACTION PARTITIONS
+-- Turns hainco_transaction into a table partitioned by month of transaction_date, so inserts
+-- and the reads of recent transactions only touch the partitions of the months they need
+-- however long the history grows, and old months can be archived by dropping their partition
+-- (python -m backend.operations.partitions archive).
+-- Partitions are named hainco_transaction_YYYY_MM. Rows of a month without a partition go to
+-- hainco_transaction_default and are moved to their partition once it is created. The API
+-- creates the partitions of the coming months when a worker starts, see the README
+-- The existing rows are copied while the table is locked. The triggers and indexes of the table
+-- are created again on the partitioned table, and the row counter and sales rollups are kept as
+-- they are. The primary key becomes (transaction_id, transaction_date), as the key of a
+-- partitioned table must hold the partition column
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION transaction_partition_name(month date)
+    RETURNS text AS
+$$
+    SELECT 'hainco_transaction_' || to_char(month, 'YYYY_MM');
+$$
+LANGUAGE 'sql' IMMUTABLE;
+
+-- the row counter of create_row_counters.sql, for the rows moved without going through its triggers
+CREATE OR REPLACE FUNCTION adjust_transaction_row_count(delta bigint)
+    RETURNS void AS
+$$
+BEGIN
+    IF to_regclass('hainco_row_count') IS NOT NULL THEN
+        INSERT INTO hainco_row_count(table_name, shard, row_count)
+            VALUES ('hainco_transaction', 0, delta)
+        ON CONFLICT (table_name, shard) DO UPDATE
+            SET row_count = hainco_row_count.row_count + EXCLUDED.row_count;
+    END IF;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+-- creates the partition of the month of the given day, returns its name or NULL when it exists
+CREATE OR REPLACE FUNCTION create_transaction_partition(month date)
+    RETURNS text AS
+$$
+DECLARE
+    first_day date := date_trunc('month', month);
+    next_month date := date_trunc('month', month) + interval '1 month';
+    partition text := transaction_partition_name(month);
+BEGIN
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- attached rather than created as a partition, which keeps inserting into the other
+    -- partitions possible while the rows of the month are moved out of the default partition
+    EXECUTE format('CREATE TABLE %I (LIKE hainco_transaction INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition);
+    IF to_regclass('hainco_transaction_default') IS NOT NULL THEN
+        EXECUTE format('WITH moved AS (
+                            DELETE FROM hainco_transaction_default
+                            WHERE transaction_date >= %L AND transaction_date < %L
+                            RETURNING *
+                        )
+                        INSERT INTO %I SELECT * FROM moved', first_day, next_month, partition);
+    END IF;
+    EXECUTE format('ALTER TABLE hainco_transaction ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   partition, first_day, next_month);
+    RETURN partition;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+-- creates the partitions from the current month to months_ahead months later, and those of the
+-- months found in the default partition. Returns the partitions created, nothing when another
+-- session is already creating them
+CREATE OR REPLACE FUNCTION create_transaction_partitions(months_ahead integer)
+    RETURNS SETOF text AS
+$$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('create_transaction_partitions')) THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+        SELECT created
+        FROM (
+            SELECT generate_series(
+                date_trunc('month', current_date),
+                date_trunc('month', current_date) + make_interval(months => months_ahead),
+                interval '1 month'
+            )::date AS month
+            UNION
+            SELECT DISTINCT date_trunc('month', transaction_date)::date
+            FROM hainco_transaction_default
+        ) AS months
+        CROSS JOIN LATERAL create_transaction_partition(months.month) AS created
+        WHERE created IS NOT NULL
+        ORDER BY months.month;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+-- detaches and drops the partition of an archived month, returns the rows it held
+CREATE OR REPLACE FUNCTION drop_transaction_partition(partition text)
+    RETURNS bigint AS
+$$
+DECLARE
+    archived bigint;
+BEGIN
+    EXECUTE format('SELECT count(*) FROM %I', partition) INTO archived;
+    EXECUTE format('ALTER TABLE hainco_transaction DETACH PARTITION %I', partition);
+    EXECUTE format('DROP TABLE %I', partition);
+    -- dropping the rows does not fire the delete trigger of the row counter
+    PERFORM adjust_transaction_row_count(-archived);
+    RETURN archived;
+END;
+$$
+LANGUAGE 'plpgsql';
+
+DO
+$$
+DECLARE
+    definitions text[];
+    definition text;
+    id_sequence text;
+    primary_key text;
+    first_month date;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'hainco_transaction'::regclass) = 'p' THEN
+        RAISE NOTICE 'hainco_transaction is already partitioned';
+        RETURN;
+    END IF;
+
+    LOCK TABLE hainco_transaction IN ACCESS EXCLUSIVE MODE;
+
+    SELECT array_agg(pg_get_triggerdef(oid) ORDER BY tgname)
+        INTO definitions
+        FROM pg_trigger
+        WHERE tgrelid = 'hainco_transaction'::regclass AND NOT tgisinternal;
+    definitions := COALESCE(definitions, '{}') || ARRAY(
+        SELECT pg_get_indexdef(indexrelid)
+        FROM pg_index
+        WHERE indrelid = 'hainco_transaction'::regclass AND NOT indisprimary
+        ORDER BY indexrelid
+    );
+    SELECT date_trunc('month', min(transaction_date))::date INTO first_month FROM hainco_transaction;
+    id_sequence := pg_get_serial_sequence('hainco_transaction', 'transaction_id');
+    SELECT conname INTO primary_key
+        FROM pg_constraint
+        WHERE conrelid = 'hainco_transaction'::regclass AND contype = 'p';
+
+    ALTER TABLE hainco_transaction RENAME TO hainco_transaction_unpartitioned;
+    -- frees the name of the primary key for the partitioned table
+    IF primary_key IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE hainco_transaction_unpartitioned RENAME CONSTRAINT %I TO %I',
+                       primary_key, primary_key || '_unpartitioned');
+    END IF;
+    -- the ids keep coming from the same sequence, which would be dropped with the old table
+    IF id_sequence IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_sequence);
+    END IF;
+
+    CREATE TABLE hainco_transaction (
+        LIKE hainco_transaction_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+    ) PARTITION BY RANGE (transaction_date);
+    EXECUTE format('ALTER TABLE hainco_transaction ADD CONSTRAINT %I PRIMARY KEY (transaction_id, transaction_date)',
+                   COALESCE(primary_key, 'hainco_transaction_pkey'));
+    CREATE TABLE hainco_transaction_default PARTITION OF hainco_transaction DEFAULT;
+    IF id_sequence IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY hainco_transaction.transaction_id', id_sequence);
+    END IF;
+
+    PERFORM create_transaction_partition(month::date)
+        FROM generate_series(
+            COALESCE(first_month, date_trunc('month', current_date)),
+            date_trunc('month', current_date) + interval '3 months',
+            interval '1 month'
+        ) AS month;
+
+    INSERT INTO hainco_transaction SELECT * FROM hainco_transaction_unpartitioned;
+    DROP TABLE hainco_transaction_unpartitioned;
+
+    FOREACH definition IN ARRAY definitions LOOP
+        EXECUTE definition;
+    END LOOP;
+END
+$$;
+
+COMMIT;
+
+ANALYZE hainco_transaction;
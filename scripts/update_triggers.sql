@@ -1,22 +1,35 @@
 -- PROCEDURE CREATION
+-- every function also notifies the API workers on the hainco_changes channel,
+-- re-run the CREATE OR REPLACE FUNCTION statements to update existing databases.
+-- Sessions with hainco.audit_mode = 'batched' (the API with AUDIT_MODE=batched) skip the
+-- insert into hainco_transaction, their entries are written by backend/operations/audit.py
+-- pg_notify fails the write when the payload is 8000 bytes or more, so the order row is only
+-- sent while it stays well under, the listeners read the longer ones by their key
 
 CREATE OR REPLACE FUNCTION log_update_admin()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN',
-        CONCAT('Updated admin information of: ', NEW.admin_full_name),
-        3,
-        current_timestamp,
-        'UPDATE RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN',
+            CONCAT('Updated admin information of: ', NEW.admin_full_name),
+            3,
+            current_timestamp,
+            'UPDATE RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.admin_username
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -27,19 +40,26 @@ CREATE OR REPLACE FUNCTION log_update_staff()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN',
-        CONCAT('Updated staff information of: ', NEW.staff_username),
-        3,
-        current_timestamp,
-        'UPDATE RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN',
+            CONCAT('Updated staff information of: ', NEW.staff_username),
+            3,
+            current_timestamp,
+            'UPDATE RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.staff_username
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -50,19 +70,29 @@ CREATE OR REPLACE FUNCTION log_update_product()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN',
-        CONCAT('Updated product information of: ', NEW.product_code),
-        3,
-        current_timestamp,
-        'UPDATE RECORD'
-    );
+    -- stock taken by place_order (create_checkout.sql) is logged with the orders
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched'
+        AND current_setting('hainco.stock_reservation', true) IS DISTINCT FROM 'on' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN',
+            CONCAT('Updated product information of: ', NEW.product_code),
+            3,
+            current_timestamp,
+            'UPDATE RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.product_code,
+        'old_key', OLD.product_code
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -72,19 +102,26 @@ CREATE OR REPLACE FUNCTION log_update_customer()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'ADMIN',
-        CONCAT('Updated customer information of: ', NEW.customer_email),
-        3,
-        current_timestamp,
-        'UPDATE RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'ADMIN',
+            CONCAT('Updated customer information of: ', NEW.customer_email),
+            3,
+            current_timestamp,
+            'UPDATE RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.customer_email
+    )::text);
     RETURN NEW;
 END;
 $$
@@ -94,19 +131,30 @@ CREATE OR REPLACE FUNCTION log_update_order()
     RETURNS trigger AS
 $$
 BEGIN
-    INSERT INTO hainco_transaction(
-        transaction_agent,
-        transaction_description,
-        transaction_type,
-        transaction_date,
-        transaction_state
-    ) VALUES (
-        'STAFF',
-        CONCAT('Updated Order by: ', NEW.order_customer_email, ' ordering: ', NEW.order_product_code, ' from status code: ', OLD.order_status, ' to status code: ', NEW.order_status),
-        3,
-        current_timestamp,
-        'UPDATE RECORD'
-    );
+    IF current_setting('hainco.audit_mode', true) IS DISTINCT FROM 'batched' THEN
+        INSERT INTO hainco_transaction(
+            transaction_agent,
+            transaction_description,
+            transaction_type,
+            transaction_date,
+            transaction_state
+        ) VALUES (
+            'STAFF',
+            CONCAT('Updated Order by: ', NEW.order_customer_email, ' ordering: ', NEW.order_product_code, ' from status code: ', OLD.order_status, ' to status code: ', NEW.order_status),
+            3,
+            current_timestamp,
+            'UPDATE RECORD'
+        );
+    END IF;
+    PERFORM pg_notify('hainco_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', NEW.order_number,
+        'id', (extract(epoch FROM clock_timestamp()) * 1000000)::bigint,
+        'old_status', OLD.order_status,
+        'status', NEW.order_status,
+        'row', CASE WHEN octet_length(row_to_json(NEW)::text) < 7000 THEN row_to_json(NEW) END
+    )::text);
     RETURN NEW;
 END
 $$